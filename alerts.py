@@ -0,0 +1,187 @@
+import numpy as np
+import pandas as pd
+
+import detect
+import structs
+
+ALERT_COLUMNS = [
+    "symbol",
+    "trendtype",
+    "id",
+    "bar_index",
+    "price_at_bar",
+    "high",
+    "low",
+    "close",
+    "close_beyond",
+]
+
+# Per-line arrays of a TrendlineBook and their dtypes, as saved by save()
+LINE_FIELDS = {
+    "symbol_code": np.int32,
+    "trendtype": np.int8,
+    "anchor_index": np.int32,
+    "m": np.float64,
+    "b": np.float64,
+    "tolerance": np.float64,
+}
+
+_TREND_CODES = {structs.TrendlineTypes.SUPPORT: 1, structs.TrendlineTypes.RESISTANCE: 2}
+_TREND_TYPES = np.array([None, structs.TrendlineTypes.SUPPORT, structs.TrendlineTypes.RESISTANCE], dtype=object)
+
+
+class TrendlineBook:
+    # The active trendlines of many symbols, one entry per line in flat arrays: symbol, type, anchor (first
+    # point) index, slope m and intercept b of price = m * bar_index + b in the symbol's detection bar indices,
+    # and the symbol's breakout tolerance. Each symbol also keeps the index of its next bar, so check() can
+    # price every line at the new bar in one pass. Lines are dropped once they break out.
+
+    def __init__(self):
+        self.symbols = []
+        self._codes = {}
+        self._index = None
+        self.next_index = np.empty(0, dtype=np.int64)
+        self.ids = np.empty(0, dtype=object)
+        for name, dtype in LINE_FIELDS.items():
+            setattr(self, name, np.empty(0, dtype=dtype))
+
+    def __len__(self):
+        return len(self.m)
+
+    @classmethod
+    def from_results(cls, results_by_symbol, best_only=False, config=detect.DEFAULT_CONFIG):
+        book = cls()
+        for symbol, results in results_by_symbol.items():
+            book.add(symbol, results, best_only, config)
+        return book
+
+    def _code(self, symbol):
+        code = self._codes.get(symbol)
+        if code is None:
+            code = self._codes[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+            self._index = None
+            self.next_index = np.append(self.next_index, 0)
+        return code
+
+    def add(self, symbol, results, best_only=False, config=detect.DEFAULT_CONFIG):
+        """
+        Stores the lines of a detect(...) output for symbol that have not broken out, replacing the symbol's
+        previous lines. With best_only, only the best line of every duplicate group is kept. config must be
+        the one detection ran with, for the breakout tolerance.
+        """
+        candlestick_data = results["candlestick_data"]
+        tolerance = config.get("breakout_tolerance", detect.DEFAULT_CONFIG["breakout_tolerance"])(candlestick_data)
+        code = self._code(symbol)
+        self.remove(symbol)
+        self.next_index[code] = len(candlestick_data)
+
+        frames = []
+        for key in ("support_trendlines", "resistance_trendlines"):
+            trends = results.get(key)
+            if trends is None or len(trends) == 0:
+                continue
+            keep = ~trends["is_breakout"].astype(bool)
+            if best_only:
+                keep &= trends["is_best_from_duplicate_group"].astype(bool)
+            frames.append(trends[keep])
+        if not frames:
+            return 0
+
+        lines = pd.concat(frames, ignore_index=True)
+        added = {
+            "symbol_code": np.full(len(lines), code),
+            "trendtype": lines["trendtype"].map(_TREND_CODES).to_numpy(),
+            "anchor_index": lines["starts_at_index"].to_numpy(),
+            "m": lines["m"].to_numpy(),
+            "b": lines["b"].to_numpy(),
+            "tolerance": np.full(len(lines), tolerance),
+        }
+        for name, dtype in LINE_FIELDS.items():
+            setattr(self, name, np.concatenate([getattr(self, name), added[name].astype(dtype)]))
+        self.ids = np.concatenate([self.ids, lines["id"].to_numpy(dtype=object)])
+        return len(lines)
+
+    def remove(self, symbol):
+        code = self._codes.get(symbol)
+        if code is not None:
+            self._keep(self.symbol_code != code)
+
+    def _keep(self, mask):
+        for name in LINE_FIELDS:
+            setattr(self, name, getattr(self, name)[mask])
+        self.ids = self.ids[mask]
+
+    def check(self, bars):
+        """
+        Prices every stored line at the new bar of its symbol and returns the lines the bar breaks, as detect
+        would mark them: a resistance whose line the High exceeds by more than the tolerance, a support the Low
+        falls below. bars is a frame indexed by symbol with High, Low and Close columns (one new bar per
+        symbol, symbols without a bar are left as they are). close_beyond tells whether the Close is past the
+        line too. Broken lines are removed from the book and the symbols' bar indices advance by one.
+        """
+        if self._index is None:
+            self._index = pd.Index(self.symbols, dtype=object)
+        bars = bars[~bars.index.duplicated(keep="last")]
+        codes = self._index.get_indexer(bars.index)
+        bars, codes = bars[codes >= 0], codes[codes >= 0]
+
+        # Latest bar per symbol code, NaN for the symbols without a bar this time
+        high = np.full(len(self.symbols), np.nan)
+        low = np.full(len(self.symbols), np.nan)
+        close = np.full(len(self.symbols), np.nan)
+        high[codes] = bars["High"].to_numpy(dtype=np.float64)
+        low[codes] = bars["Low"].to_numpy(dtype=np.float64)
+        close[codes] = bars["Close"].to_numpy(dtype=np.float64)
+
+        line_code = self.symbol_code
+        bar_index = self.next_index[line_code]
+        price = self.m * bar_index + self.b
+        is_resistance = self.trendtype == _TREND_CODES[structs.TrendlineTypes.RESISTANCE]
+
+        # NaN comparisons are False, so lines of symbols without a bar never break
+        line_high, line_low, line_close = high[line_code], low[line_code], close[line_code]
+        broken = np.where(is_resistance, line_high > price + self.tolerance, line_low < price - self.tolerance)
+        close_beyond = np.where(is_resistance, line_close > price, line_close < price)
+
+        hits = np.flatnonzero(broken)
+        alerts = pd.DataFrame(
+            {
+                "symbol": self._index[line_code[hits]],
+                "trendtype": _TREND_TYPES[self.trendtype[hits]],
+                "id": self.ids[hits],
+                "bar_index": bar_index[hits],
+                "price_at_bar": price[hits],
+                "high": line_high[hits],
+                "low": line_low[hits],
+                "close": line_close[hits],
+                "close_beyond": close_beyond[hits],
+            },
+            columns=ALERT_COLUMNS,
+        )
+
+        self._keep(~broken)
+        self.next_index[codes] += 1
+        return alerts
+
+    def save(self, path):
+        # One .npz file with the line arrays, the symbols and their next bar index
+        np.savez(
+            path,
+            symbols=np.asarray(self.symbols, dtype=str),
+            next_index=self.next_index,
+            ids=self.ids.astype(str),
+            **{name: getattr(self, name) for name in LINE_FIELDS},
+        )
+
+    @classmethod
+    def load(cls, path):
+        book = cls()
+        with np.load(path) as data:
+            book.symbols = data["symbols"].tolist()
+            book._codes = {symbol: code for code, symbol in enumerate(book.symbols)}
+            book.next_index = data["next_index"].astype(np.int64)
+            book.ids = data["ids"].astype(object)
+            for name, dtype in LINE_FIELDS.items():
+                setattr(book, name, data[name].astype(dtype))
+        return book
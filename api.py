@@ -0,0 +1,308 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+import tornado.web
+
+import detect
+import stats
+import structs
+
+from cache import ResultCache
+from providers import provider_from_name
+from scanner import DEFAULT_DETECT_OPTIONS, arrays_to_candlestick_data, df_to_arrays
+from store import OHLCVStore
+
+DEFAULT_PORT = 8502
+DEFAULT_PERIOD = 252
+MAX_PERIOD = 5 * 365
+
+# Responses only change when a new daily bar comes in, clients and proxies may reuse them for this long
+DEFAULT_MAX_AGE = 300
+
+BOOLEAN_OPTIONS = [
+    "first_pt_must_be_pivot",
+    "last_pt_must_be_pivot",
+    "all_pts_must_be_pivots",
+    "trendline_must_include_global_maxmin_pt",
+    "ignore_breakouts",
+]
+
+
+def _json_default(value):
+    if isinstance(value, (pd.Timestamp, date)):
+        return value.isoformat()
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.floating):
+        return None if np.isnan(value) else float(value)
+    if isinstance(value, np.bool_):
+        return bool(value)
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError("{} is not JSON serializable".format(type(value).__name__))
+
+
+def to_json(payload):
+    return json.dumps(payload, default=_json_default, allow_nan=False, separators=(",", ":")).encode()
+
+
+def _records(trends):
+    # NaN floats (no breakout date, ...) become null
+    return trends.astype(object).where(trends.notna(), None).to_dict("records")
+
+
+def detect_json(symbol, period, arrays, options):
+    # Runs in a worker process: detection and serialization both happen there, only the body comes back
+    candlestick_data = arrays_to_candlestick_data(arrays)
+    results = detect.detect(
+        candlestick_data=candlestick_data, trend_type=structs.TrendlineTypes.BOTH, parallel=False, **options
+    )
+    return to_json(
+        {
+            "symbol": symbol,
+            "period": period,
+            "bars": len(candlestick_data),
+            "first_date": candlestick_data.dates[0],
+            "last_date": candlestick_data.dates[-1],
+            "last_close": detect.last_close(candlestick_data),
+            "options": options,
+            # False when time_budget cut the search short, the lines are the best found in the time
+            "is_exhaustive": results["is_exhaustive"],
+            "support_trendlines": _records(results["support_trendlines"]),
+            "resistance_trendlines": _records(results["resistance_trendlines"]),
+            "support_pivots": sorted(results["support_pivots"]),
+            "resistance_pivots": sorted(results["resistance_pivots"]),
+        }
+    )
+
+
+def statistics_json(symbol, period, df, store, start):
+    returns = stats.close_returns(df)
+    benchmark = stats.benchmark_returns(store, start)
+    metrics = stats.core_metrics(returns.rename(symbol).to_frame(), benchmark).iloc[0]
+    return to_json(
+        {
+            "symbol": symbol,
+            "period": period,
+            "benchmark": stats.BENCHMARK_SYMBOL,
+            "metrics": {name: None if np.isnan(value) else value for name, value in metrics.items()},
+        }
+    )
+
+
+class TrendlineService:
+    # Fetches run on a thread pool and detection on a process pool, so a request waiting on the data
+    # provider never holds up the CPU work of another. Identical requests in flight share one computation,
+    # and finished bodies are kept for max_age seconds together with their ETag.
+
+    def __init__(self, store, max_workers=None, fetch_workers=None, max_age=DEFAULT_MAX_AGE, time_budget=None):
+        self.store = store
+        self.max_age = max_age
+        self.time_budget = time_budget
+        self.cpu_pool = ProcessPoolExecutor(max_workers=max_workers or os.cpu_count())
+        self.io_pool = ThreadPoolExecutor(max_workers=fetch_workers or 16)
+        self.responses = ResultCache(ttl=max_age)
+        self._inflight = {}
+
+    def close(self):
+        self.cpu_pool.shutdown(wait=False, cancel_futures=True)
+        self.io_pool.shutdown(wait=False, cancel_futures=True)
+
+    async def respond(self, key, compute):
+        """
+        Returns (body, etag) for key, from the response cache or by awaiting compute(). Concurrent requests
+        for the same key await the same task; it is shielded so a client going away does not cancel it for
+        the others.
+        """
+        cached = self.responses.get(key)
+        if cached is not None:
+            return cached
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = asyncio.ensure_future(self._compute(key, compute))
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _compute(self, key, compute):
+        body = await compute()
+        response = (body, '"{}"'.format(hashlib.blake2b(body, digest_size=16).hexdigest()))
+        self.responses.put(key, response)
+        return response
+
+    async def fetch(self, symbol, period):
+        today = date.today()
+        start = today - timedelta(days=period)
+        try:
+            df = await asyncio.get_running_loop().run_in_executor(self.io_pool, self.store.get, symbol, start, today)
+        except Exception as e:
+            raise tornado.web.HTTPError(
+                502, "Fetching %s failed: %s", symbol, e, reason="Could not fetch data for {}".format(symbol)
+            )
+        if df is None or len(df) < 3:
+            raise tornado.web.HTTPError(404, reason="No data found for {}".format(symbol))
+        return df, start
+
+    async def trendlines(self, symbol, period, options):
+        key = ("trendlines", date.today(), symbol, period, tuple(sorted(options.items())))
+
+        async def compute():
+            df, _ = await self.fetch(symbol, period)
+            return await asyncio.get_running_loop().run_in_executor(
+                self.cpu_pool, detect_json, symbol, period, df_to_arrays(df), options
+            )
+
+        return await self.respond(key, compute)
+
+    async def statistics(self, symbol, period):
+        key = ("statistics", date.today(), symbol, period)
+
+        async def compute():
+            df, start = await self.fetch(symbol, period)
+            return await asyncio.get_running_loop().run_in_executor(
+                self.io_pool, statistics_json, symbol, period, df, self.store, start
+            )
+
+        return await self.respond(key, compute)
+
+
+class BaseHandler(tornado.web.RequestHandler):
+    def initialize(self, service):
+        self.service = service
+
+    def symbol_and_period(self):
+        symbol = self.get_query_argument("symbol", "").strip().upper()
+        if not symbol:
+            raise tornado.web.HTTPError(400, reason="symbol is required")
+        try:
+            period = int(self.get_query_argument("period", DEFAULT_PERIOD))
+        except ValueError:
+            raise tornado.web.HTTPError(400, reason="period must be a number of days")
+        if not 10 <= period <= MAX_PERIOD:
+            raise tornado.web.HTTPError(400, reason="period must be between 10 and {} days".format(MAX_PERIOD))
+        return symbol, period
+
+    def detect_options(self):
+        options = dict(DEFAULT_DETECT_OPTIONS)
+        for name in BOOLEAN_OPTIONS:
+            value = self.get_query_argument(name, None)
+            if value is not None:
+                if value.lower() not in ("1", "0", "true", "false"):
+                    raise tornado.web.HTTPError(400, reason="{} must be true or false".format(name))
+                options[name] = value.lower() in ("1", "true")
+        value = self.get_query_argument("min_points_required", None)
+        if value is not None:
+            if not value.isdigit() or int(value) < 2:
+                raise tornado.web.HTTPError(400, reason="min_points_required must be a number of at least 2")
+            options["min_points_required"] = int(value)
+        # Seconds detection may take per request, the server's --time-budget unless the request asks for less
+        time_budget = self.service.time_budget
+        value = self.get_query_argument("time_budget", None)
+        if value is not None:
+            try:
+                requested = float(value)
+            except ValueError:
+                requested = 0
+            if not requested > 0:
+                raise tornado.web.HTTPError(400, reason="time_budget must be a positive number of seconds")
+            time_budget = requested if time_budget is None else min(requested, time_budget)
+        if time_budget is not None:
+            options["time_budget"] = time_budget
+        return options
+
+    def send_json(self, response):
+        body, self._etag = response
+        self.set_header("Content-Type", "application/json")
+        self.set_header("Cache-Control", "public, max-age={}".format(self.service.max_age))
+        # finish() answers 304 when If-None-Match matches compute_etag
+        self.finish(body)
+
+    def compute_etag(self):
+        return getattr(self, "_etag", None)
+
+    def write_error(self, status_code, **kwargs):
+        self.set_header("Content-Type", "application/json")
+        self.finish(to_json({"error": self._reason}))
+
+
+class TrendlinesHandler(BaseHandler):
+    async def get(self):
+        symbol, period = self.symbol_and_period()
+        self.send_json(await self.service.trendlines(symbol, period, self.detect_options()))
+
+
+class StatisticsHandler(BaseHandler):
+    async def get(self):
+        symbol, period = self.symbol_and_period()
+        self.send_json(await self.service.statistics(symbol, period))
+
+
+class HealthHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.finish({"status": "ok"})
+
+
+def make_app(service):
+    return tornado.web.Application(
+        [
+            (r"/trendlines", TrendlinesHandler, {"service": service}),
+            (r"/statistics", StatisticsHandler, {"service": service}),
+            (r"/health", HealthHandler),
+        ]
+    )
+
+
+async def serve(service, port, address):
+    app = make_app(service)
+    app.listen(port, address)
+    print("Serving trendlines on http://{}:{}".format(address, port), file=sys.stderr)
+    await asyncio.Event().wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="JSON API serving trendlines, pivots and statistics")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--address", default="0.0.0.0")
+    parser.add_argument("--workers", type=int, default=None, help="detection processes (default: all cores)")
+    parser.add_argument("--fetch-workers", type=int, default=None, help="concurrent downloads")
+    parser.add_argument("--max-age", type=int, default=DEFAULT_MAX_AGE, help="seconds responses may be reused")
+    parser.add_argument(
+        "--time-budget", type=float, default=None, help="seconds detection may take per request (default: no limit)"
+    )
+    parser.add_argument("--store", default=None, help="path of the local OHLCV store")
+    parser.add_argument("--provider", choices=["tiingo", "yfinance", "local"], default="tiingo")
+    parser.add_argument(
+        "--data-dir", default=None, help="directory of <SYMBOL>.csv/.parquet files for --provider local"
+    )
+    args = parser.parse_args(argv)
+
+    api_key = os.environ.get("TIINGO_API_KEY")
+    if args.provider == "tiingo" and not api_key:
+        parser.error("TIINGO_API_KEY must be set in the environment")
+    if args.provider == "local" and not args.data_dir:
+        parser.error("--data-dir is required with --provider local")
+    if args.time_budget is not None and args.time_budget <= 0:
+        parser.error("--time-budget must be a positive number of seconds")
+
+    store_kwargs = {"path": args.store} if args.store else {}
+    ohlcv_store = OHLCVStore(provider=provider_from_name(args.provider, api_key, args.data_dir), **store_kwargs)
+    service = TrendlineService(ohlcv_store, args.workers, args.fetch_workers, args.max_age, args.time_budget)
+    try:
+        asyncio.run(serve(service, args.port, args.address))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,39 +1,69 @@
+import os
 import warnings
 from datetime import date, timedelta
 
 import pandas as pd
-import pytrendline as ptl
-import quantstats as qs
 import streamlit as st
-import pandas_datareader as pdr
 
-from PIL import Image
+import detect
+import stats
+import structs
+import timing
 
-from plot import plot_graph_bokeh
+from cache import ResultCache, content_key
+from providers import LocalFileProvider, TiingoProvider
+from store import OHLCVStore
 
 warnings.filterwarnings("ignore")
+timing.configure_logging()
 
-TIINGO_TOKEN = st.secrets["TIINGO_API_KEY"]
+# quantstats, bokeh and PIL are imported by the features that use them, on first use, so a new replica starts
+# serving without paying for them up front (see benchmark.py --imports)
+
+LOGO_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logo.png")
+
+# Seconds detection may take per chart, PIVOT_PEAK_DETECT_BUDGET unset searches exhaustively. The same for every
+# session of the process, so it stays out of the result cache key
+DETECT_BUDGET = float(os.environ["PIVOT_PEAK_DETECT_BUDGET"]) if os.environ.get("PIVOT_PEAK_DETECT_BUDGET") else None
+
+# Seconds a result the budget cut short stays cached. Long enough for the reruns of one interaction, short enough
+# that later sessions get a fresh search rather than the partial lines for the whole cache TTL
+PARTIAL_RESULT_TTL = float(os.environ.get("PIVOT_PEAK_PARTIAL_CACHE_TTL", 60))
+
+
+@st.cache_resource
+def get_ohlcv_store():
+    # One store per process, shared by every session, so reruns only fetch bars missing since the last visit.
+    # PIVOT_PEAK_DATA_DIR serves bars from local CSV/Parquet files instead of Tiingo
+    data_dir = os.environ.get("PIVOT_PEAK_DATA_DIR")
+    provider = LocalFileProvider(data_dir) if data_dir else TiingoProvider(st.secrets["TIINGO_API_KEY"])
+    return OHLCVStore(provider=provider)
+
+
+@st.cache_resource
+def load_logo():
+    # Decoded once per process instead of on every rerun
+    from PIL import Image
+
+    logo = Image.open(LOGO_PATH)
+    logo.load()
+    return logo
+
+
+@st.cache_resource
+def get_result_cache():
+    # Detection results shared by every session in the process, keyed on the candles' content and the options
+    return ResultCache()
 
 
 def ticker_to_df(symbol, period):
     try:
         today = date.today()
         start = today - timedelta(days=int(period))
-        start_date = start.strftime("%Y-%m-%d")
-        end_date = today.strftime("%Y-%m-%d")
-        ticker_df = pdr.get_data_tiingo(symbol, start=start_date, end=end_date, api_key=TIINGO_TOKEN)
-        ticker_df.reset_index(inplace=True)
-
-        ticker_df["Open"] = ticker_df["adjOpen"]
-        ticker_df["High"] = ticker_df["adjHigh"]
-        ticker_df["Low"] = ticker_df["adjLow"]
-        ticker_df["Close"] = ticker_df["adjClose"]
-        ticker_df["Volume"] = ticker_df["adjVolume"]
-        ticker_df["Symbol"] = symbol
-        ticker_df["Date"] = ticker_df["date"]
-
-        return pd.concat([pd.DataFrame(), ticker_df], ignore_index=True)
+        with timing.stage("fetch"):
+            df = get_ohlcv_store().get(symbol, start, today)
+        timing.count(bars=len(df))
+        return df
     except Exception as e:
         print(f"Error searching {symbol} occured: {e}")
         return pd.DataFrame()
@@ -45,56 +75,144 @@ def detect_trendlines(full_df):
     all_must_be_pivots = st.sidebar.checkbox("All points must be pivots", value=True)
     include_global_maxmin_pt = st.sidebar.checkbox("Include global max/min point", value=False)
 
-    candlestick_data = ptl.CandlestickData(
-        df=full_df,
-        time_interval="1d",  # choose between 1m,3m,5m,10m,15m,30m,1h,1d
-        open_col="Open",  # name of the column containing candle "Open" price
-        high_col="High",  # name of the column containing candle "High" price
-        low_col="Low",  # name of the column containing candle "Low" price
-        close_col="Close",  # name of the column containing candle "Close" price
-        datetime_col="Date",  # name of the column containing candle datetime price (use none if datetime is in index)
+    options = {
+        "first_pt_must_be_pivot": first_must_be_pivot,
+        "last_pt_must_be_pivot": last_must_be_pivot,
+        "all_pts_must_be_pivots": all_must_be_pivots,
+        "trendline_must_include_global_maxmin_pt": include_global_maxmin_pt,
+    }
+    key = content_key(full_df, options)
+    computed = []
+
+    def compute():
+        computed.append(True)
+        return _detect_trendlines(full_df, **options)
+
+    cache = get_result_cache()
+    results = cache.get_or_compute(
+        key, compute, ttl=lambda results: cache.ttl if results["is_exhaustive"] else PARTIAL_RESULT_TTL
     )
 
-    return ptl.detect(
-        candlestick_data=candlestick_data,
-        # Choose between BOTH, SUPPORT or RESISTANCE
-        trend_type=ptl.TrendlineTypes.BOTH,
-        # Specify if you require the first point of a trendline to be a pivot
-        first_pt_must_be_pivot=first_must_be_pivot,
-        # Specify if you require the last point of the trendline to be a pivot
-        last_pt_must_be_pivot=last_must_be_pivot,
-        # Specify if you require all trendline points to be pivots
-        all_pts_must_be_pivots=all_must_be_pivots,
-        # Specify if you require one of the trendline points to be global max or min price
-        trendline_must_include_global_maxmin_pt=include_global_maxmin_pt,
-        # Specify minimum amount of points required for trendline detection (NOTE: must be at least two)
-        min_points_required=3,
-        # Specify if you want to ignore prices before some date
-        scan_from_date=None,
-        # Specify if you want to ignore 'breakout' lines. That is, lines that intersect a candle
-        ignore_breakouts=True,
-        # Specify and override to default config (See docs on how)
-        config={},
+    trends = [results[col] for col in ("support_trendlines", "resistance_trendlines") if col in results]
+    timing.count(
+        detect_cached=not computed,
+        pivots=sum(len(results[col]) for col in ("support_pivots", "resistance_pivots") if col in results),
+        candidate_lines=sum(trend.attrs.get("num_candidates", 0) for trend in trends),
+        trendlines=sum(len(trend) for trend in trends),
     )
+    return results
+
+
+def _detect_trendlines(
+    full_df,
+    first_pt_must_be_pivot,
+    last_pt_must_be_pivot,
+    all_pts_must_be_pivots,
+    trendline_must_include_global_maxmin_pt,
+):
+    # Only runs on a cache miss, a rerun served from the cache records neither stage
+    with timing.stage("candles"):
+        candlestick_data = structs.CandlestickData(
+            df=full_df,
+            time_interval="1d",  # choose between 1m,3m,5m,10m,15m,30m,1h,1d
+            open_col="Open",  # name of the column containing candle "Open" price
+            high_col="High",  # name of the column containing candle "High" price
+            low_col="Low",  # name of the column containing candle "Low" price
+            close_col="Close",  # name of the column containing candle "Close" price
+            datetime_col="Date",  # name of the column containing candle datetime price (use none if datetime is in index)
+        )
+
+    with timing.stage("detect"):
+        return detect.detect(
+            candlestick_data=candlestick_data,
+            # Choose between BOTH, SUPPORT or RESISTANCE
+            trend_type=structs.TrendlineTypes.BOTH,
+            # Specify if you require the first point of a trendline to be a pivot
+            first_pt_must_be_pivot=first_pt_must_be_pivot,
+            # Specify if you require the last point of the trendline to be a pivot
+            last_pt_must_be_pivot=last_pt_must_be_pivot,
+            # Specify if you require all trendline points to be pivots
+            all_pts_must_be_pivots=all_pts_must_be_pivots,
+            # Specify if you require one of the trendline points to be global max or min price
+            trendline_must_include_global_maxmin_pt=trendline_must_include_global_maxmin_pt,
+            # Specify minimum amount of points required for trendline detection (NOTE: must be at least two)
+            min_points_required=3,
+            # Specify if you want to ignore prices before some date
+            scan_from_date=None,
+            # Specify if you want to ignore 'breakout' lines. That is, lines that intersect a candle
+            ignore_breakouts=True,
+            # Specify and override to default config (See docs on how)
+            config={},
+            # Specify a time limit in seconds to get the best lines found so far instead of all of them
+            time_budget=DETECT_BUDGET,
+        )
 
 
 def plot_trendlines(results, symbol, period):
-    return plot_graph_bokeh(results, symbol, period)
+    from plot import chart_data_bytes, plot_graph_bokeh
+
+    with timing.stage("plot"):
+        p = plot_graph_bokeh(results, symbol, period)
+    timing.count(
+        glyph_renderers=len(p.renderers),
+        glyph_points=sum(len(next(iter(r.data_source.data.values()), ())) for r in p.renderers),
+        chart_data_bytes=chart_data_bytes(p),
+    )
+    return p
+
+
+def compute_stock_statistics(symbol, df, period, full=False):
+    # The symbol's returns come from the bars already fetched for the chart, SPY's from the benchmark series
+    # shared by every session for the trading day
+    stock = stats.close_returns(df)
+    start = date.today() - timedelta(days=int(period))
+    bench = stats.benchmark_returns(get_ohlcv_store(), start)
+    if bench.empty:
+        raise Exception("No benchmark data found for SPY")
+
+    with timing.stage("statistics"):
+        if full:
+            import quantstats as qs
+
+            return qs.reports.metrics(stock, mode="full", benchmark=bench, display=False)
+        return stats.metrics_table(stock, bench)
 
 
-def compute_stock_statistics(symbol, df):
-    df.index = pd.DatetimeIndex(df["Date"])
-    stock = qs.utils.download_returns(symbol, period=df.index)
-    bench = qs.utils.download_returns("SPY", period=df.index)
+def show_timings(trace, report):
+    # Sidebar panel with the stage timings and counters of this rerun, plus the profile when one was captured
+    with st.sidebar.expander("Timings", expanded=True):
+        st.table(
+            pd.DataFrame(
+                {"ms": [round(1000 * seconds, 2) for seconds in trace.stages.values()]}, index=list(trace.stages)
+            )
+        )
+        st.caption("Total {:.1f} ms".format(1000 * trace.total))
+        st.json(trace.counters)
 
-    return qs.reports.metrics(stock, mode="full", benchmark=bench, display=False)
+    if report is not None:
+        with st.expander("Profile of this rerun"):
+            st.text(report.top_functions)
+            st.text(report.top_allocations)
 
 
 def st_ui():
+    # ?profile=1 runs this rerun under cProfile and tracemalloc; otherwise only the per-stage timers run
+    profiling = st.query_params.get("profile") == "1"
+    trace = timing.start_trace("st_ui")
+    try:
+        with timing.profile(profiling) as report:
+            _st_ui()
+    finally:
+        timing.finish_trace()
+
+    if st.sidebar.checkbox("Show timings", value=profiling):
+        show_timings(trace, report)
+
+
+def _st_ui():
     st.set_page_config(page_title="PivotPeak.AI", page_icon="📈", layout="wide")
 
-    logo = Image.open("logo.png")
-    st.sidebar.image(logo, width=90, caption="PivotPeak.AI")
+    st.sidebar.image(load_logo(), width=90, caption="PivotPeak.AI")
 
     params = st.query_params.get_all("symbol")
 
@@ -124,13 +242,15 @@ def st_ui():
     p = plot_trendlines(results, symbol, period)
 
     st.bokeh_chart(p, use_container_width=True)
+    if not results.get("is_exhaustive", True):
+        st.caption("Detection stopped after {:g}s, showing the best trendlines found so far".format(DETECT_BUDGET))
 
     if st.sidebar.checkbox("View statistics"):
         st.divider()
         st.subheader("Statistics with respect to SPY")
 
-        stats = compute_stock_statistics(symbol, full_df)
-        st.table(stats)
+        full = st.sidebar.checkbox("Full statistics report", value=False)
+        st.table(compute_stock_statistics(symbol, full_df, period, full))
 
 
 if __name__ == "__main__":
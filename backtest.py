@@ -0,0 +1,312 @@
+import argparse
+import os
+import sys
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+import structs
+
+from live import LiveDetector
+from providers import provider_from_name
+from scanner import DEFAULT_DETECT_OPTIONS, arrays_to_candlestick_data, df_to_arrays, read_watchlist
+from store import OHLCVStore
+
+DEFAULT_WINDOW = 252
+DEFAULT_HORIZONS = (1, 5, 10, 20)
+
+BREAK = "break"
+BOUNCE = "bounce"
+
+# Trade direction of each signal: +1 long, -1 short
+DIRECTIONS = {
+    (structs.TrendlineTypes.RESISTANCE, BREAK): 1,
+    (structs.TrendlineTypes.RESISTANCE, BOUNCE): -1,
+    (structs.TrendlineTypes.SUPPORT, BREAK): -1,
+    (structs.TrendlineTypes.SUPPORT, BOUNCE): 1,
+}
+
+SIGNAL_COLUMNS = [
+    "symbol",
+    "id",
+    "trendtype",
+    "event",
+    "direction",
+    "window_end_index",
+    "bar_index",
+    "date",
+    "line_price",
+    "close",
+]
+
+
+def _side_events(side, window_start, bars, offset):
+    """
+    Signals of one side's active lines over the bars following the detector's last candle. A line is active
+    when it has min_points_required points, starts inside the window, has not broken out and its price at the
+    last candle is within detection's last price limits. On each bar it either breaks (the Close is beyond the
+    line by more than the breakout tolerance, which ends the line) or bounces (the bar reaches the line within
+    the tolerance and closes back on its side). bars holds the following bars' (index, High, Low, Close)
+    arrays, in the detector's indices.
+    """
+    detector = side.detector
+    counts, (on_line, _, tail) = side.point_counts()
+    rows = np.flatnonzero(
+        (counts >= detector.options["min_points_required"])
+        & (side.ii >= window_start)
+        & (side.breakout_index < 0)
+        & side.within_limits()
+    )
+    if len(rows) == 0:
+        return []
+
+    index, high, low, close = bars
+    price = side.m[rows, None] * index[None, :] + side.b[rows, None]
+    tolerance = detector.thresholds["breakout_tolerance"]
+    if side.trend_type == structs.TrendlineTypes.RESISTANCE:
+        broke = close[None, :] > price + tolerance
+        bounced = (high[None, :] >= price - tolerance) & (close[None, :] <= price)
+    else:
+        broke = close[None, :] < price - tolerance
+        bounced = (low[None, :] <= price + tolerance) & (close[None, :] >= price)
+
+    # Nothing counts after a line's first break
+    first_break = np.where(broke.any(axis=1), broke.argmax(axis=1), len(index))
+    bounced &= np.arange(len(index))[None, :] < first_break[:, None]
+    broke &= np.arange(len(index))[None, :] == first_break[:, None]
+
+    line_rows, cols = np.nonzero(broke | bounced)
+    if len(line_rows) == 0:
+        return []
+
+    # Same id as detect gives the line over the full history: its points in absolute bar indices
+    prefix = "R" if side.trend_type == structs.TrendlineTypes.RESISTANCE else "S"
+    ids = {}
+    events = []
+    for line_row, col in zip(line_rows.tolist(), cols.tolist()):
+        row = rows[line_row]
+        if row not in ids:
+            points = side.frozen_points[row] + tail[on_line[row]].tolist()
+            ids[row] = "{}-[{}]".format(prefix, ",".join(str(point + offset) for point in points))
+        events.append(
+            (
+                ids[row],
+                side.trend_type,
+                BREAK if broke[line_row, col] else BOUNCE,
+                int(index[col]) + offset,
+                float(price[line_row, col]),
+            )
+        )
+    return events
+
+
+def backtest_segment(arrays, offset, window, snapshots, step, options):
+    """
+    Runs in a worker process. arrays are the bars from absolute index offset on; the first window of them
+    is detected from scratch, then a LiveDetector follows the remaining bars, so pivots and candidate lines
+    carry over from one window to the next instead of being detected again. After each of the given number
+    of snapshots (step bars apart) the active lines are checked against the next step bars.
+    Returns (id, trendtype, event, window_end_index, bar_index, line_price) tuples.
+    """
+    dates, open_, high, low, close = arrays
+    n = len(close)
+    detector = LiveDetector(
+        arrays_to_candlestick_data(tuple(values[:window] for values in arrays)),
+        structs.TrendlineTypes.BOTH,
+        lookback=window,
+        **options,
+    )
+
+    signals = []
+    last = window - 1
+    for _ in range(snapshots):
+        stop = min(last + step, n - 1)
+        following = slice(last + 1, stop + 1)
+        bars = (np.arange(last + 1, stop + 1), high[following], low[following], close[following])
+        for side in detector.sides.values():
+            for line_id, trendtype, event, bar_index, line_price in _side_events(side, last - window + 1, bars, offset):
+                signals.append((line_id, trendtype, event, last + offset, bar_index, line_price))
+
+        for k in range(last + 1, stop + 1):
+            detector.update(pd.Timestamp(dates[k]), open_[k], high[k], low[k], close[k])
+        last = stop
+    return signals
+
+
+def forward_returns(close, bar_index, direction, horizons=DEFAULT_HORIZONS):
+    # Return from the signal bar's close to the close horizon bars later, in the signal's direction. NaN when
+    # the history ends before that
+    returns = {}
+    for horizon in horizons:
+        later = bar_index + horizon
+        valid = later < len(close)
+        values = np.full(len(bar_index), np.nan)
+        values[valid] = close[later[valid]] / close[bar_index[valid]] - 1
+        returns["return_{}".format(horizon)] = values * direction
+    return returns
+
+
+def signal_table(symbol, arrays, signals, horizons=DEFAULT_HORIZONS):
+    """
+    Builds a symbol's signal table: one row per break or bounce, with the line's id (joins to the id column
+    of detect's results on the same history), the bar it happened on and its forward returns.
+    """
+    table = pd.DataFrame(
+        signals, columns=["id", "trendtype", "event", "window_end_index", "bar_index", "line_price"]
+    ).astype({"window_end_index": np.int64, "bar_index": np.int64, "line_price": np.float64})
+    # Duplicate anchor pairs of the same line give the same signal
+    table = table.drop_duplicates(subset=["id", "bar_index"]).sort_values(["bar_index", "id"], ignore_index=True)
+
+    dates, _, _, _, close = arrays
+    bar_index = table["bar_index"].to_numpy()
+    table.insert(0, "symbol", symbol)
+    table.insert(
+        4,
+        "direction",
+        np.array([DIRECTIONS[key] for key in zip(table["trendtype"], table["event"])], dtype=np.int64),
+    )
+    table["date"] = pd.to_datetime(dates[bar_index], unit="ns")
+    table["close"] = close[bar_index]
+    table = table[SIGNAL_COLUMNS]
+    for name, values in forward_returns(close, bar_index, table["direction"].to_numpy(), horizons).items():
+        table[name] = values
+    return table
+
+
+def _segments(n, window, step):
+    # (offset, snapshots) of the tasks of one symbol. A fresh detection every window bars or so keeps the
+    # thresholds (which a LiveDetector fixes at start) in line with the prices
+    per_segment = max(1, -(-window // step))
+    snapshot_ends = np.arange(window - 1, n - 1, step)
+    return [
+        (int(snapshot_ends[first]) - window + 1, len(snapshot_ends[first : first + per_segment]))
+        for first in range(0, len(snapshot_ends), per_segment)
+    ]
+
+
+def backtest(
+    frames,
+    window=DEFAULT_WINDOW,
+    step=1,
+    horizons=DEFAULT_HORIZONS,
+    options=DEFAULT_DETECT_OPTIONS,
+    max_workers=None,
+):
+    """
+    Walk-forward backtest of trendline signals. frames is {symbol: candles DataFrame}. Every step bars, the
+    active lines detected over the last window bars are checked against the following step bars for breaks
+    and bounces. Each symbol's history is cut into segments run on a process pool, each detecting its first
+    window from scratch and updating incrementally afterwards.
+    Returns ({symbol: signal table}, {symbol: error}); a failing symbol is reported and skipped.
+    """
+    if window < 3 or step < 1:
+        raise Exception("window must be at least 3 bars and step at least 1, received {} and {}".format(window, step))
+    if options.get("trendline_must_include_global_maxmin_pt"):
+        raise Exception("trendline_must_include_global_maxmin_pt is not supported by the backtest")
+
+    arrays_by_symbol = {}
+    errors = {}
+    for symbol, df in frames.items():
+        if df is None or len(df) <= window:
+            errors[symbol] = "not enough data for a {} bar window".format(window)
+        else:
+            arrays_by_symbol[symbol] = df_to_arrays(df)
+
+    signals = {symbol: [] for symbol in arrays_by_symbol}
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as pool:
+        futures = {}
+        for symbol, arrays in arrays_by_symbol.items():
+            n = len(arrays[0])
+            for offset, snapshots in _segments(n, window, step):
+                end = min(n, offset + window + snapshots * step)
+                segment = tuple(values[offset:end] for values in arrays)
+                future = pool.submit(backtest_segment, segment, offset, window, snapshots, step, options)
+                futures[future] = symbol
+
+        for future in as_completed(futures):
+            symbol = futures[future]
+            if symbol in errors:
+                continue
+            try:
+                signals[symbol].extend(future.result())
+            except Exception as e:
+                errors[symbol] = "backtest failed: {}".format(e)
+
+    tables = {
+        symbol: signal_table(symbol, arrays_by_symbol[symbol], signals[symbol], horizons)
+        for symbol in arrays_by_symbol
+        if symbol not in errors
+    }
+    return tables, errors
+
+
+def summarize(signals, horizons=DEFAULT_HORIZONS):
+    # Number of signals, mean forward return and hit rate (share of positive returns) per trend type and event
+    columns = ["return_{}".format(horizon) for horizon in horizons]
+    returns = signals[columns]
+    hits = (returns > 0).astype(np.float64).where(returns.notna())
+    hits.columns = ["hit_rate_{}".format(horizon) for horizon in horizons]
+    keys = [signals["trendtype"], signals["event"]]
+    summary = pd.concat([returns.groupby(keys).mean().add_prefix("mean_"), hits.groupby(keys).mean()], axis=1)
+    summary.insert(0, "signals", signals.groupby(keys).size())
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Walk-forward backtest of trendline breaks and bounces")
+    parser.add_argument("watchlist", help="file with one symbol per line")
+    parser.add_argument("--years", type=float, default=5, help="years of history to test on")
+    parser.add_argument("--window", type=int, default=DEFAULT_WINDOW, help="bars of each detection window")
+    parser.add_argument("--step", type=int, default=1, help="bars between two detection windows")
+    parser.add_argument(
+        "--horizons", default=",".join(map(str, DEFAULT_HORIZONS)), help="comma separated forward return bars"
+    )
+    parser.add_argument("--output", default="-", help="CSV file for the signal table (default: stdout)")
+    parser.add_argument("--summary", default=None, help="CSV file for the hit rates per trend type and event")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--min-points", type=int, default=DEFAULT_DETECT_OPTIONS["min_points_required"])
+    parser.add_argument("--store", default=None, help="path of the local OHLCV store")
+    parser.add_argument("--provider", choices=["tiingo", "yfinance", "local"], default="tiingo")
+    parser.add_argument(
+        "--data-dir", default=None, help="directory of <SYMBOL>.csv/.parquet files for --provider local"
+    )
+    parser.add_argument("--fetch-workers", type=int, default=None, help="concurrent downloads")
+    args = parser.parse_args(argv)
+
+    api_key = os.environ.get("TIINGO_API_KEY")
+    if args.provider == "tiingo" and not api_key:
+        parser.error("TIINGO_API_KEY must be set in the environment")
+    if args.provider == "local" and not args.data_dir:
+        parser.error("--data-dir is required with --provider local")
+    horizons = [int(horizon) for horizon in args.horizons.split(",") if horizon.strip()]
+
+    store_kwargs = {"path": args.store} if args.store else {}
+    ohlcv_store = OHLCVStore(provider=provider_from_name(args.provider, api_key, args.data_dir), **store_kwargs)
+    today = date.today()
+    start = today - timedelta(days=int(365 * args.years))
+
+    frames = {}
+    for symbol, df, error in ohlcv_store.get_many(read_watchlist(args.watchlist), start, today, args.fetch_workers):
+        if error is not None:
+            print("{}: load failed: {}".format(symbol, error), file=sys.stderr)
+        else:
+            frames[symbol] = df
+
+    options = dict(DEFAULT_DETECT_OPTIONS, min_points_required=args.min_points)
+    tables, errors = backtest(frames, args.window, args.step, horizons, options, max_workers=args.workers)
+    for symbol, error in errors.items():
+        print("{}: {}".format(symbol, error), file=sys.stderr)
+    for symbol, table in tables.items():
+        print("{}: {} signals".format(symbol, len(table)), file=sys.stderr)
+
+    signals = pd.concat(list(tables.values()), ignore_index=True) if tables else pd.DataFrame(columns=SIGNAL_COLUMNS)
+    signals.to_csv(sys.stdout if args.output == "-" else args.output, index=False)
+    if args.summary:
+        summarize(signals, horizons).to_csv(args.summary)
+
+
+if __name__ == "__main__":
+    main()
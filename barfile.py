@@ -0,0 +1,166 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import structs
+
+DEFAULT_BARS_PATH = os.environ.get(
+    "PIVOT_PEAK_BARS", os.path.join(os.path.expanduser("~"), ".cache", "pivot-peak", "bars")
+)
+
+# One file per column, fixed width, in this order. The timestamps file is written last on append, so its
+# length is the number of complete bars
+COLUMNS = {
+    "open": np.float64,
+    "high": np.float64,
+    "low": np.float64,
+    "close": np.float64,
+    "volume": np.float64,
+    "timestamp": np.int64,
+}
+FRAME_COLUMNS = {"open": "Open", "high": "High", "low": "Low", "close": "Close", "volume": "Volume"}
+
+# Every SPARSE_INDEX_STRIDE-th timestamp is kept in memory. A lookup bisects it, then searches one block of
+# the mapped timestamps, so it touches a couple of pages however long the history is
+SPARSE_INDEX_STRIDE = 4096
+
+
+def _epoch_ns(value):
+    # Naive dates are taken as UTC
+    value = pd.Timestamp(value)
+    if value.tz is None:
+        value = value.tz_localize("UTC")
+    return value.value
+
+
+class BarFile:
+    # The bars of one symbol and interval: a directory with one append-only binary file per column (see
+    # COLUMNS), read through read-only numpy.memmap. The mapped pages belong to the OS page cache, so every
+    # process reading the same symbol shares them, and slicing a date range copies nothing.
+
+    def __init__(self, path, time_interval="1m"):
+        if time_interval not in structs.VALID_TIME_INTERVALS:
+            raise Exception("time_interval must be one of {}".format(structs.VALID_TIME_INTERVALS))
+        self.path = path
+        self.time_interval = time_interval
+        self.columns = {}
+        self.sparse_index = np.empty(0, dtype=np.int64)
+        self.refresh()
+
+    def _column_path(self, name):
+        return os.path.join(self.path, "{}.bin".format(name))
+
+    def __len__(self):
+        return len(self.columns.get("timestamp", ()))
+
+    def refresh(self):
+        # Maps the bars appended since the last refresh (by this or another process)
+        size = os.path.getsize(self._column_path("timestamp")) if os.path.exists(self._column_path("timestamp")) else 0
+        n = size // np.dtype(np.int64).itemsize
+        if n == len(self):
+            return self
+        self.columns = {
+            name: np.memmap(self._column_path(name), dtype=dtype, mode="r", shape=(n,))
+            for name, dtype in COLUMNS.items()
+        }
+        self.sparse_index = np.array(self.columns["timestamp"][::SPARSE_INDEX_STRIDE])
+        return self
+
+    def append(self, df):
+        """
+        Appends the bars of a Date/Open/High/Low/Close[/Volume] frame that are newer than the last stored one
+        and returns how many were written. Dates must be sorted; naive dates are taken as UTC.
+        """
+        if len(df) == 0:
+            return 0
+        dates = pd.DatetimeIndex(df["Date"])
+        timestamps = (dates.tz_localize("UTC") if dates.tz is None else dates).asi8
+        if (np.diff(timestamps) <= 0).any():
+            raise Exception("Bars must be sorted by Date without duplicates")
+
+        self.refresh()
+        n = len(self)
+        new = timestamps > self.columns["timestamp"][-1] if n else np.ones(len(timestamps), dtype=bool)
+        if not new.any():
+            return 0
+
+        values = {
+            name: df[col].to_numpy(dtype=np.float64)[new] if col in df else None for name, col in FRAME_COLUMNS.items()
+        }
+        values["volume"] = values["volume"] if values["volume"] is not None else np.full(new.sum(), np.nan)
+        values["timestamp"] = timestamps[new]
+
+        os.makedirs(self.path, exist_ok=True)
+        for name, dtype in COLUMNS.items():
+            with open(self._column_path(name), "ab") as outfile:
+                # Drops what an interrupted append left past the last complete bar
+                outfile.truncate(n * np.dtype(dtype).itemsize)
+                outfile.write(np.ascontiguousarray(values[name], dtype=dtype).tobytes())
+        self.refresh()
+        return int(new.sum())
+
+    def _search(self, timestamp, side):
+        # Position of timestamp in the mapped timestamps as np.searchsorted would give it
+        block = int(np.searchsorted(self.sparse_index, timestamp, side))
+        if block == 0:
+            return 0
+        lo = (block - 1) * SPARSE_INDEX_STRIDE
+        hi = min(block * SPARSE_INDEX_STRIDE, len(self))
+        return lo + int(np.searchsorted(self.columns["timestamp"][lo:hi], timestamp, side))
+
+    def slice_indices(self, start=None, end=None):
+        # Row range of the bars with start <= Date < end
+        lo = 0 if start is None else self._search(_epoch_ns(start), "left")
+        hi = len(self) if end is None else self._search(_epoch_ns(end), "left")
+        return lo, max(lo, hi)
+
+    def candles(self, start=None, end=None, tz="UTC"):
+        # The bars with start <= Date < end as CandlestickData whose arrays are views into the mapped files
+        lo, hi = self.slice_indices(start, end)
+        return structs.CandlestickData.from_arrays(
+            self.columns["timestamp"][lo:hi],
+            self.columns["open"][lo:hi],
+            self.columns["high"][lo:hi],
+            self.columns["low"][lo:hi],
+            self.columns["close"][lo:hi],
+            time_interval=self.time_interval,
+            tz=tz,
+        )
+
+    def frame(self, start=None, end=None):
+        # Copy of the bars with start <= Date < end as a Date/Open/High/Low/Close/Volume frame
+        lo, hi = self.slice_indices(start, end)
+        df = pd.DataFrame({col: np.array(self.columns[name][lo:hi]) for name, col in FRAME_COLUMNS.items()})
+        df.insert(0, "Date", pd.to_datetime(np.array(self.columns["timestamp"][lo:hi]), unit="ns", utc=True))
+        return df
+
+
+class BarStore:
+    # A directory of BarFiles, <root>/<SYMBOL>/<interval>/. Files are opened once per process and refreshed
+    # on each read, so worker processes can each open the store and read the same symbols cheaply
+
+    def __init__(self, root=DEFAULT_BARS_PATH):
+        self.root = root
+        self._files = {}
+
+    def open(self, symbol, time_interval):
+        key = (symbol.upper(), time_interval)
+        bar_file = self._files.get(key)
+        if bar_file is None:
+            bar_file = self._files[key] = BarFile(os.path.join(self.root, *key), time_interval)
+        return bar_file.refresh()
+
+    def append(self, symbol, time_interval, df):
+        return self.open(symbol, time_interval).append(df)
+
+    def candles(self, symbol, time_interval, start=None, end=None, tz="UTC"):
+        bar_file = self.open(symbol, time_interval)
+        if len(bar_file) == 0:
+            raise Exception("No {} bars stored for {}".format(time_interval, symbol))
+        return bar_file.candles(start, end, tz)
+
+    def symbols(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, name)))
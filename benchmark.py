@@ -0,0 +1,331 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+from datetime import datetime, timezone
+
+import bokeh
+import numpy as np
+import pandas as pd
+
+from bokeh.embed import components
+from bokeh.resources import CDN
+
+import detect
+import plot
+import structs
+import synthetic
+
+from live import LiveDetector
+from scanner import DEFAULT_DETECT_OPTIONS
+
+# Detection grows roughly quadratically with the number of pivots, 100000 bars takes a long while
+DEFAULT_SIZES = [100, 1000, 10000]
+STAGES = ["construct", "detect", "plot", "table", "html", "live"]
+
+# The live stage follows this many bars with a LiveDetector and checks its lines against detect on the same bars
+LIVE_UPDATES = 20
+
+# Config values the LiveDetector evaluates once on its initial candles. The live check freezes them for detect too
+LIVE_FIXED_CONFIG = [
+    "pivot_seperation_threshold",
+    "pivot_grouping_threshold",
+    "max_allowable_error_pt_to_trend",
+    "breakout_tolerance",
+]
+
+# Modules whose cold import time --imports tracks. app needs streamlit installed
+IMPORT_MODULES = ["structs", "detect", "stats", "store", "plot", "app"]
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _measure(fn, repeat):
+    # Wall time over repeat untraced runs, then peak Python/NumPy allocations of one more run under tracemalloc
+    # (tracing slows the run down, so it is kept out of the timings)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = fn()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return value, {"wall_s": min(times), "wall_median_s": statistics.median(times), "peak_bytes": peak}
+
+
+def _export_html(trend_graph, trend_table, filepath):
+    # Same page as plot.plot, from the figures already built by the plot and table stages
+    script, divs = components((trend_graph, trend_table))
+    plot.write_report(filepath, "pytrendline results", CDN.render_js(), [plot.report_section("SYNTH", script, divs)])
+    return os.path.getsize(filepath)
+
+
+def _live_matches_detect(df, time_interval, options):
+    # Follows the last LIVE_UPDATES bars with a LiveDetector and tells whether its lines are the ones detect
+    # finds on the same bars
+    start = len(df) - LIVE_UPDATES
+    initial = structs.CandlestickData(df=df.iloc[:start], time_interval=time_interval, datetime_col="Date")
+    config = {
+        key: (lambda value: lambda candles: value)(detect._config_value({}, key, initial)) for key in LIVE_FIXED_CONFIG
+    }
+    detector = LiveDetector(initial, structs.TrendlineTypes.BOTH, lookback=None, config=config, **options)
+    for row in df.iloc[start:].itertuples():
+        detector.update(row.Date, row.Open, row.High, row.Low, row.Close)
+
+    live = detector.results()
+    full = detect.detect(
+        candlestick_data=structs.CandlestickData(df=df, time_interval=time_interval, datetime_col="Date"),
+        trend_type=structs.TrendlineTypes.BOTH,
+        config=config,
+        **options,
+    )
+    return all(
+        live[key]["id"].tolist() == full[key]["id"].tolist() for key in ("support_trendlines", "resistance_trendlines")
+    )
+
+
+def run_case(n, time_interval, seed=0, repeat=3, options=DEFAULT_DETECT_OPTIONS, outdir=None):
+    df = synthetic.generate_ohlcv(n, time_interval, seed=seed)
+    case = {"bars": n, "time_interval": time_interval, "seed": seed}
+    stages = {}
+
+    def stage(name, fn, **extra):
+        try:
+            value, stats = _measure(fn, repeat)
+        except Exception as e:
+            stages[name] = {"error": "{}: {}".format(type(e).__name__, e)}
+            return None
+        stages[name] = dict(stats, **{key: get(value) for key, get in extra.items()})
+        return value
+
+    candlestick_data = stage(
+        "construct",
+        lambda: structs.CandlestickData(df=df, time_interval=time_interval, datetime_col="Date"),
+    )
+    if candlestick_data is None:
+        case["stages"] = stages
+        return case
+
+    results = stage(
+        "detect",
+        lambda: detect.detect(
+            candlestick_data=candlestick_data, trend_type=structs.TrendlineTypes.BOTH, config={}, **options
+        ),
+        trendlines=lambda r: len(r["support_trendlines"]) + len(r["resistance_trendlines"]),
+    )
+    if results is not None:
+        trend_graph = stage(
+            "plot",
+            lambda: plot.plot_graph_bokeh(results, "SYNTH", n),
+            renderers=lambda p: len(p.renderers),
+            data_bytes=plot.chart_data_bytes,
+            payload_bytes=plot.chart_payload_bytes,
+        )
+        trend_table = stage("table", lambda: plot.plot_table_bokeh(results))
+        if trend_graph is not None and trend_table is not None:
+            with tempfile.TemporaryDirectory(dir=outdir) as tmp:
+                filepath = os.path.join(tmp, "trend_plot.html")
+                stage("html", lambda: _export_html(trend_graph, trend_table, filepath), html_bytes=lambda size: size)
+
+    if n > LIVE_UPDATES + 3:
+        stage("live", lambda: _live_matches_detect(df, time_interval, options), matches_detect=lambda matched: matched)
+
+    case["stages"] = stages
+    return case
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=REPO_DIR,
+        )
+        return out.stdout.strip()
+    except Exception:
+        return None
+
+
+def _parse_importtime(stderr, module, top=5):
+    # python -X importtime lines are "import time: self | cumulative | name", children indented under (and
+    # printed before) the module that imported them. Returns the module's cumulative seconds and its heaviest
+    # direct imports
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        level = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((level, name.strip(), int(cumulative) / 1e6))
+
+    end = max(i for i, (level, name, _) in enumerate(entries) if level == 0 and name == module)
+    start = max([i for i, (level, _, _) in enumerate(entries[:end]) if level == 0] + [-1]) + 1
+    children = sorted(
+        ((name, seconds) for level, name, seconds in entries[start:end] if level == 1), key=lambda c: -c[1]
+    )
+    return entries[end][2], [{"module": name, "import_s": seconds} for name, seconds in children[:top]]
+
+
+def import_times(modules=IMPORT_MODULES, repeat=3):
+    """
+    Cold start cost of every module: the time to import it in a fresh interpreter (python -X importtime),
+    the fastest of repeat runs, with the heaviest imports it pulls in. A module that fails to import gets an
+    error instead.
+    """
+    report = {}
+    for module in modules:
+        runs = []
+        for _ in range(repeat):
+            proc = subprocess.run(
+                [sys.executable, "-X", "importtime", "-c", "import {}".format(module)],
+                capture_output=True,
+                text=True,
+                cwd=REPO_DIR,
+            )
+            if proc.returncode != 0:
+                errors = proc.stderr.strip().splitlines()
+                report[module] = {"error": errors[-1] if errors else "exit code {}".format(proc.returncode)}
+                break
+            runs.append(_parse_importtime(proc.stderr, module))
+        else:
+            seconds, heaviest = min(runs, key=lambda run: run[0])
+            report[module] = {"import_s": seconds, "heaviest": heaviest}
+    return report
+
+
+def format_imports(imports):
+    lines = []
+    for module, stats in imports.items():
+        if "error" in stats:
+            lines.append("import {:<8} error: {}".format(module, stats["error"]))
+        else:
+            heaviest = ", ".join("{} {:.3f}s".format(c["module"], c["import_s"]) for c in stats["heaviest"])
+            lines.append("import {:<8} {:.3f}s ({})".format(module, stats["import_s"], heaviest))
+    return "\n".join(lines)
+
+
+def environment():
+    return {
+        "commit": _git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "bokeh": bokeh.__version__,
+    }
+
+
+def run(sizes=DEFAULT_SIZES, intervals=structs.VALID_TIME_INTERVALS, seed=0, repeat=3, log=sys.stderr):
+    cases = []
+    for time_interval in intervals:
+        for n in sizes:
+            case = run_case(n, time_interval, seed=seed, repeat=repeat)
+            cases.append(case)
+            if log:
+                print(format_case(case), file=log)
+    return {"environment": environment(), "options": DEFAULT_DETECT_OPTIONS, "repeat": repeat, "cases": cases}
+
+
+def format_case(case):
+    parts = []
+    for name in STAGES:
+        stats = case["stages"].get(name)
+        if stats is None:
+            continue
+        if "error" in stats:
+            parts.append("{} error".format(name))
+        elif stats.get("matches_detect") is False:
+            parts.append("{} MISMATCH".format(name))
+        else:
+            parts.append("{} {:.3f}s {:.1f}MB".format(name, stats["wall_s"], stats["peak_bytes"] / 2**20))
+    return "{:>7} bars {:>3}: {}".format(case["bars"], case["time_interval"], ", ".join(parts))
+
+
+def compare(baseline, current):
+    # Rows of (bars, interval, stage, baseline wall, current wall, ratio) for cases present in both runs, plus
+    # ("import", module, ...) rows for the import times of both runs
+    previous = {(c["bars"], c["time_interval"]): c["stages"] for c in baseline["cases"]}
+    rows = []
+    for module, new in current.get("imports", {}).items():
+        old = baseline.get("imports", {}).get(module, {})
+        if "import_s" in old and "import_s" in new:
+            ratio = new["import_s"] / old["import_s"] if old["import_s"] else float("inf")
+            rows.append(("import", module, "import", old["import_s"], new["import_s"], ratio))
+    for case in current["cases"]:
+        old_stages = previous.get((case["bars"], case["time_interval"]))
+        if old_stages is None:
+            continue
+        for name in STAGES:
+            old, new = old_stages.get(name, {}), case["stages"].get(name, {})
+            if "wall_s" in old and "wall_s" in new:
+                ratio = new["wall_s"] / old["wall_s"] if old["wall_s"] else float("inf")
+                rows.append((case["bars"], case["time_interval"], name, old["wall_s"], new["wall_s"], ratio))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark candles, detection, plotting and export on synthetic bars")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="comma separated bar counts")
+    parser.add_argument("--intervals", default=",".join(structs.VALID_TIME_INTERVALS), help="comma separated")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per stage, the fastest is reported")
+    parser.add_argument("--output", default=None, help="JSON file for the results (default: stdout)")
+    parser.add_argument("--compare", default=None, help="JSON results of an earlier run to compare against")
+    parser.add_argument(
+        "--imports",
+        nargs="?",
+        const=",".join(IMPORT_MODULES),
+        default=None,
+        help="also measure cold import times (comma separated modules, default: {})".format(",".join(IMPORT_MODULES)),
+    )
+    args = parser.parse_args(argv)
+
+    warnings.filterwarnings("ignore")
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    intervals = [interval.strip() for interval in args.intervals.split(",")]
+    for interval in intervals:
+        if interval not in structs.VALID_TIME_INTERVALS:
+            parser.error("unknown interval {}".format(interval))
+
+    report = run(sizes, intervals, seed=args.seed, repeat=args.repeat)
+    if args.imports:
+        report["imports"] = import_times(args.imports.split(","), args.repeat)
+        print(format_imports(report["imports"]), file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w") as outfile:
+            json.dump(report, outfile, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare) as infile:
+            baseline = json.load(infile)
+        print("Compared to {}:".format(baseline["environment"].get("commit") or args.compare), file=sys.stderr)
+        for bars, interval, name, old, new, ratio in compare(baseline, report):
+            case = "import {:<9}".format(interval) if bars == "import" else "{:>7} bars {:>3}".format(bars, interval)
+            name = "" if bars == "import" else name
+            print("{} {:<9} {:8.3f}s -> {:8.3f}s  x{:.2f}".format(case, name, old, new, ratio), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+import hashlib
+import os
+import sys
+import threading
+import time
+
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_MAX_BYTES = int(float(os.environ.get("PIVOT_PEAK_CACHE_MB", 256)) * 2**20)
+DEFAULT_TTL = float(os.environ.get("PIVOT_PEAK_CACHE_TTL", 3600))
+
+
+def content_key(df, params, columns=("Date", "Open", "High", "Low", "Close")):
+    # Hash of the raw bytes of the candle columns plus a canonical repr of the parameters. Two frames with the
+    # same bars hash alike regardless of index, column order or which session fetched them
+    digest = hashlib.blake2b(digest_size=20)
+    for col in columns:
+        values = df[col]
+        if col == "Date":
+            values = pd.DatetimeIndex(values).tz_localize(None).asi8
+        else:
+            values = values.to_numpy(dtype=np.float64)
+        digest.update(col.encode())
+        digest.update(np.ascontiguousarray(values).tobytes())
+    digest.update(repr(sorted(params.items())).encode())
+    return digest.hexdigest()
+
+
+def estimate_nbytes(value):
+    # Rough deep size of a cached value: DataFrames and arrays by their buffers, containers recursively
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_nbytes(v) for v in value.values())
+    if isinstance(value, (list, tuple, set)):
+        return sys.getsizeof(value) + sum(estimate_nbytes(v) for v in value)
+    if hasattr(value, "__slots__"):
+        return sys.getsizeof(value) + sum(estimate_nbytes(getattr(value, name, None)) for name in value.__slots__)
+    if hasattr(value, "__dict__"):
+        return sys.getsizeof(value) + estimate_nbytes(vars(value))
+    return sys.getsizeof(value)
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class ResultCache:
+    # Process-wide LRU cache with a TTL and a memory budget. Entries are evicted least recently used first
+    # until the total estimated size fits in max_bytes; a single entry larger than the budget is returned but
+    # not stored.
+    #
+    # get_or_compute is single-flight: while one thread computes a key, other threads asking for the same key
+    # wait for that result instead of computing it again. A failed computation is raised in every waiter and
+    # is not cached.
+    #
+    # Cached values are shared between callers and must be treated as read only.
+    #
+    # put and get_or_compute take an optional ttl overriding the cache's for that entry, either seconds or a
+    # function of the value giving them, e.g. a shorter one for partial results. 0 stores nothing.
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL, sizeof=estimate_nbytes):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (value, nbytes, expires_at)
+        self._inflight = {}
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "nbytes": self.nbytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def _lookup(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[2] <= now:
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _remove(self, key):
+        _, nbytes, _ = self._entries.pop(key)
+        self.nbytes -= nbytes
+
+    def _store(self, key, value, now, ttl=None):
+        if ttl is None:
+            ttl = self.ttl
+        elif callable(ttl):
+            ttl = ttl(value)
+        nbytes = self.sizeof(value)
+        if nbytes > self.max_bytes or ttl <= 0:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (value, nbytes, now + ttl)
+        self.nbytes += nbytes
+        while self.nbytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._lookup(key, time.monotonic())
+            if entry is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, ttl=None):
+        with self._lock:
+            self._store(key, value, time.monotonic(), ttl)
+
+    def get_or_compute(self, key, compute, ttl=None):
+        with self._lock:
+            entry = self._lookup(key, time.monotonic())
+            if entry is not None:
+                self.hits += 1
+                return entry[0]
+
+            flight = self._inflight.get(key)
+            owner = flight is None
+            if owner:
+                flight = self._inflight[key] = _Flight()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not owner:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = compute()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                if flight.error is None:
+                    self._store(key, flight.value, time.monotonic(), ttl)
+                del self._inflight[key]
+            flight.done.set()
+        return flight.value
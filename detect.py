@@ -0,0 +1,944 @@
+import os
+import sys
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from numpy.lib.stride_tricks import sliding_window_view
+
+import structs
+
+# Max number of consecutive near-equal prices that are grouped together when looking for a pivot's neighbours
+MAX_NUMBER_CONTINUOUS_PIVOTS = 6
+
+# Upper bound on the number of (candidate line x candle) cells evaluated at once, keeps memory flat on long histories
+CANDIDATE_CHUNK_CELLS = 2**20
+
+# Max number of candidate anchor pairs materialized at once
+CANDIDATE_PAIR_BLOCK = 2**20
+
+# With a budget, candidates are evaluated in rounds over the most prominent anchors: the first round pairs up
+# this many anchors, every later round doubles it
+FIRST_ROUND_ANCHORS = 64
+
+
+# Threads that run the support pass of BOTH requests while the caller runs the resistance pass. NumPy releases
+# the GIL in the evaluation kernels, so the two sides overlap on separate cores
+_side_pool = None
+_side_pool_lock = threading.Lock()
+
+
+def _get_side_pool():
+    global _side_pool
+    with _side_pool_lock:
+        if _side_pool is None:
+            _side_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="detect")
+        return _side_pool
+
+
+# Find the average distance between High and Low price in a set of candles
+def avg_candle_range(candles):
+    return max(np.nanmean(candles.high - candles.low), 0.01)
+
+
+# Closing price of the most recent candle
+def last_close(candles):
+    return candles.close[-1]
+
+
+DEFAULT_CONFIG = {
+    # For some price at date t, what difference must be exceeded between p_t-1 and p_t+1
+    # with respect to p_t for t to be considered pivot
+    "pivot_seperation_threshold": lambda candles: avg_candle_range(candles) * 0.2,
+    # For some pivot found at date t, what difference is tolerable between p_t-1 to p_t and p_t+1 to p_t
+    # for either p_t-1 or p_t+1 to ALSO be considered pivots
+    "pivot_grouping_threshold": lambda candles: avg_candle_range(candles) * 0.1,
+    # Max allowable error for a trendline point and a candlestick price
+    "max_allowable_error_pt_to_trend": lambda candles: avg_candle_range(candles) * 0.06,
+    # Thresholds used to group 'duplicate' trendlines, ie lines with almost identical last price and slope
+    "duplicate_grouping_threshold_last_price": lambda candles: avg_candle_range(candles) * 0.2,
+    "duplicate_grouping_threshold_slope": lambda candles: avg_candle_range(candles) * 0.05,
+    # How much does a trendline break into any candle for it to be considered a break-out
+    "breakout_tolerance": lambda candles: avg_candle_range(candles) * 0.08,
+    # Scores detected trendlines. Receives arrays (one entry per candidate line) of the mean distance from
+    # trend to price, the number of points and the slope, and must return an array of scores
+    "scoring_function": lambda candles, mean_err_distances, num_points, slope: (
+        avg_candle_range(candles) / mean_err_distances
+    )
+    * (2.5**num_points),
+    # Max and min allowable slope angle for both resistance and support lines
+    # By default set to allow all angles but min or max can be set to 0 to only allow positive / negative slopes
+    "max_allowable_support_slope": lambda candles: sys.float_info.max,
+    "min_allowable_support_slope": lambda candles: -sys.float_info.max,
+    "max_allowable_resistance_slope": lambda candles: sys.float_info.max,
+    "min_allowable_resistance_slope": lambda candles: -sys.float_info.max,
+    # Max and min allowable last price point for both resistance and support lines
+    # By default set to be 1.5X of last candle closing price for max and 0.667x for min
+    "max_allowable_support_last_price": lambda candles: last_close(candles) * 1.5,
+    "min_allowable_support_last_price": lambda candles: last_close(candles) * 0.667,
+    "max_allowable_resistance_last_price": lambda candles: last_close(candles) * 1.5,
+    "min_allowable_resistance_last_price": lambda candles: last_close(candles) * 0.667,
+}
+
+TRENDLINE_COLUMNS = [
+    "id",
+    "trendtype",
+    "pointset_indeces",
+    "pointset_dates",
+    "starts_at_index",
+    "starts_at_date",
+    "ends_at_index",
+    "ends_at_date",
+    "is_breakout",
+    "breakout_index",
+    "breakout_date",
+    "num_points",
+    "m",
+    "b",
+    "slope",
+    "price_at_last_date",
+    "score",
+    "includes_global_max_or_min",
+    "global_maxs_or_mins",
+    "price_at_next_future_date",
+    "duplicate_group_id",
+    "is_best_from_duplicate_group",
+    "overall_rank",
+    "rank_within_group",
+]
+
+
+def _config_value(config, key, candlestick_data):
+    return config.get(key, DEFAULT_CONFIG[key])(candlestick_data)
+
+
+def _validate_inputs(candlestick_data, trend_type):
+    if candlestick_data is None:
+        raise Exception("No candlestick data provided")
+    elif not isinstance(candlestick_data, structs.CandlestickData):
+        raise Exception("candlestick_data input provided is of invalid type. See README for instructions")
+
+    if trend_type is None:
+        raise Exception("No trend_type data provided")
+    elif trend_type not in (
+        structs.TrendlineTypes.SUPPORT,
+        structs.TrendlineTypes.RESISTANCE,
+        structs.TrendlineTypes.BOTH,
+    ):
+        raise Exception("trend_type input provided is of invalid type. See README for instructions")
+
+
+def _price_series(candlestick_data, trend_type):
+    return candlestick_data.low if trend_type == structs.TrendlineTypes.SUPPORT else candlestick_data.high
+
+
+def _scan_from_index(candlestick_data, scan_from_date):
+    if scan_from_date is None:
+        return 0
+    return int(candlestick_data.dates.searchsorted(pd.Timestamp(scan_from_date)))
+
+
+def _leading_true_count(flags, width):
+    # For each position t, count the consecutive True values in flags[t:t+width]
+    padded = np.concatenate([flags, np.zeros(width, dtype=bool)])
+    windows = sliding_window_view(padded, width)[: len(flags)]
+    return np.cumprod(windows, axis=1).sum(axis=1)
+
+
+def pivot_mask(prices, trend_type, separation_thres, grouping_thres):
+    n = len(prices)
+    mask = np.zeros(n, dtype=bool)
+    if n < 3:
+        mask[:] = True
+        return mask
+
+    # near_next[t] is True when p_t and p_t+1 are close enough to be grouped together
+    near_next = np.abs(np.diff(prices)) < grouping_thres
+    width = MAX_NUMBER_CONTINUOUS_PIVOTS - 1
+    forward_run = _leading_true_count(near_next, width)
+    backward_run = _leading_true_count(near_next[::-1], width)[::-1]
+
+    idx = np.arange(1, n - 1)
+    next_step = np.minimum(1 + forward_run[idx], n - 1 - idx)
+    prev_step = np.minimum(1 + backward_run[idx - 1], idx)
+
+    pcur = prices[idx]
+    pnext = prices[idx + next_step]
+    pprev = prices[idx - prev_step]
+
+    if trend_type == structs.TrendlineTypes.RESISTANCE:
+        is_extreme = (pprev <= pcur) & (pnext <= pcur)
+    else:
+        is_extreme = (pprev >= pcur) & (pnext >= pcur)
+
+    dprev = np.abs(pcur - pprev)
+    dnext = np.abs(pcur - pnext)
+    is_separated = ((dprev > separation_thres * (1 / 4)) & (dnext > separation_thres * (3 / 4))) | (
+        (dprev > separation_thres * (3 / 4)) & (dnext > separation_thres * (1 / 4))
+    )
+
+    mask[idx] = is_extreme & is_separated
+
+    # Always include last point and first point as pivots
+    mask[0] = True
+    mask[-1] = True
+    return mask
+
+
+def get_pivots(
+    candlestick_data=None,
+    trend_type=None,
+    scan_from_index=None,
+    config=DEFAULT_CONFIG,
+    debug=False,
+):
+    _validate_inputs(candlestick_data, trend_type)
+
+    separation_thres = _config_value(config, "pivot_seperation_threshold", candlestick_data)
+    grouping_thres = _config_value(config, "pivot_grouping_threshold", candlestick_data)
+
+    offset = scan_from_index or 0
+    prices = _price_series(candlestick_data, trend_type)[offset:]
+    mask = pivot_mask(prices, trend_type, separation_thres, grouping_thres)
+    pivots = set((np.flatnonzero(mask) + offset).tolist())
+
+    if debug:
+        print(
+            "🐛 FIND PIVOT DEBUG 🐛\n"
+            + "Grouping Threshold = {}\n".format(grouping_thres)
+            + "Separation Threshold = {}\n".format(separation_thres)
+            + "Pivots found = {}\n".format(pivots)
+            + "Percentage of pivots to total data points = {}\n".format((len(pivots) / len(prices)) * 100)
+        )
+
+    return pivots
+
+
+def anchor_ranks(prices, trend_type, is_pivot, is_global, separation_thres, grouping_thres):
+    """
+    Ranks candles by how promising they are as trendline anchors, 0 being the best: global max/min candles
+    first, then by pivot level (pivots of the pivot sequence are level 2, pivots of those level 3, ...), then
+    by how extreme the price is. Used to evaluate the most promising candidates first under a budget.
+    """
+    n = len(prices)
+    level = is_pivot.astype(np.int64)
+    idx = np.flatnonzero(is_pivot)
+    while len(idx) > 2:
+        higher = idx[pivot_mask(prices[idx], trend_type, separation_thres, grouping_thres)]
+        if len(higher) == len(idx):
+            break
+        idx = higher
+        level[idx] += 1
+
+    extremity = prices if trend_type == structs.TrendlineTypes.RESISTANCE else -prices
+    order = np.lexsort((-extremity, -level, ~is_global))
+    ranks = np.empty(n, dtype=np.int64)
+    ranks[order] = np.arange(n)
+    return ranks
+
+
+class _Budget:
+    # Deadline (perf_counter time) and number of candidate lines a side may still evaluate. Either may be None.
+    # Sides that run one after the other split the time left: the first of sides_left gets its share of it, so it
+    # does not use up the deadline of the sides after it
+
+    def __init__(self, deadline, max_candidates, sides_left=1):
+        self.started = time.perf_counter()
+        self.deadline = None if deadline is None else self.started + (deadline - self.started) / sides_left
+        self.remaining = max_candidates
+
+    def reserve_setup_time(self):
+        # Scoring and grouping the kept lines afterwards takes about as long as finding pivots and ranking anchors
+        # did, so candidates stop that much earlier to leave time for it
+        if self.deadline is not None:
+            self.deadline -= time.perf_counter() - self.started
+
+    def allowance(self, wanted, started=True, seconds_each=None):
+        # How many of the wanted candidates may be evaluated now, 0 once the budget is spent. The deadline only
+        # applies once something was evaluated, so there always is a result to return. With the measured
+        # seconds_each, no more are allowed than fit before the deadline, so a chunk does not run far past it
+        if started and self.deadline is not None:
+            left = self.deadline - time.perf_counter()
+            if left <= 0:
+                return 0
+            if seconds_each:
+                wanted = min(wanted, int(left / seconds_each))
+        if self.remaining is None:
+            return wanted
+        allowed = min(wanted, self.remaining)
+        self.remaining -= allowed
+        return allowed
+
+
+def _budgeted_pair_blocks(start_indices, end_indices, ranks):
+    # Same pairs as _candidate_pair_blocks, in rounds of increasing anchor rank: round r yields the pairs
+    # whose anchors are both among the FIRST_ROUND_ANCHORS * 2**r best ranked and that no earlier round yielded,
+    # best ranked pairs first
+    sorted_ranks = np.sort(ranks[np.union1d(start_indices, end_indices)])
+    if len(sorted_ranks) == 0:
+        return
+    previous_cutoff = -1
+    top = FIRST_ROUND_ANCHORS
+    while previous_cutoff < sorted_ranks[-1]:
+        cutoff = sorted_ranks[min(top, len(sorted_ranks)) - 1]
+        starts = start_indices[ranks[start_indices] <= cutoff]
+        ends = end_indices[ranks[end_indices] <= cutoff]
+        for ii, jj in _candidate_pair_blocks(starts, ends):
+            new = np.flatnonzero(np.maximum(ranks[ii], ranks[jj]) > previous_cutoff)
+            # Pairs of the best ranked anchors first within the round too
+            new = new[np.argsort(ranks[ii[new]] + ranks[jj[new]], kind="stable")]
+            yield ii[new], jj[new]
+        previous_cutoff = cutoff
+        top *= 2
+
+
+def _candidate_pairs(start_indices, end_indices):
+    # All (i, j) pairs with i taken from start_indices, j from end_indices and i < j
+    first_end = np.searchsorted(end_indices, start_indices, side="right")
+    counts = len(end_indices) - first_end
+    total = int(counts.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    row_offsets = np.cumsum(counts) - counts
+    pos = np.arange(total) - np.repeat(row_offsets, counts) + np.repeat(first_end, counts)
+    return np.repeat(start_indices, counts), end_indices[pos]
+
+
+def _candidate_pair_blocks(start_indices, end_indices, max_pairs=CANDIDATE_PAIR_BLOCK):
+    # Same as _candidate_pairs, but yields the pairs in blocks of consecutive start indices so the
+    # number of pairs held in memory stays bounded on long histories
+    counts = len(end_indices) - np.searchsorted(end_indices, start_indices, side="right")
+    block_of_start = (np.cumsum(counts) - counts) // max_pairs
+    boundaries = np.flatnonzero(np.diff(block_of_start)) + 1
+    for block in np.split(start_indices, boundaries):
+        if len(block):
+            yield _candidate_pairs(block, end_indices)
+
+
+def _evaluate_candidates(
+    prices,
+    ii,
+    jj,
+    m,
+    b,
+    trend_type,
+    member_mask,
+    is_pivot,
+    last_pt_must_be_pivot,
+    thresholds,
+    min_points_required,
+    ignore_breakouts,
+):
+    # Evaluates a chunk of candidate lines (sorted by first anchor) against the candles at or after their first
+    # anchor at once. Returns the rows of the chunk that qualify as trendlines along with their breakout index
+    # (-1 if none), the sum of errors of their points and the packed bitmask of points on the line
+    tested = _breakout_test(prices, ii, jj, m, b, trend_type, thresholds, ignore_breakouts)
+    rows, breakout_index, abs_deviation = tested["rows"], tested["breakout_index"], tested["abs_deviation"]
+    on_line = _points_on_line(tested, jj, member_mask, is_pivot, last_pt_must_be_pivot, thresholds)
+
+    keep = on_line.sum(axis=1) >= min_points_required
+    rows, on_line = rows[keep], on_line[keep]
+    err_sum = np.where(on_line, abs_deviation[keep], 0.0).sum(axis=1)
+    return rows, breakout_index[rows], err_sum, _pack_points(on_line, tested["lo"], len(prices))
+
+
+def _breakout_test(prices, ii, jj, m, b, trend_type, thresholds, ignore_breakouts):
+    # The option independent part of evaluating a chunk: deviation of every candle at or after the chunk's first
+    # anchor from every line, and breakouts. With ignore_breakouts, only the rows without one are kept. Every
+    # candle is tested for breakouts whatever the pivot options. pytrendline only tested pivots when
+    # last_pt_must_be_pivot was set, so it kept lines that cut through a non-pivot candle, which here are breakouts
+    n = len(prices)
+    lo = int(ii.min())
+    k = np.arange(lo, n)
+
+    deviation = m[:, None] * k[None, :] + b[:, None] - prices[None, lo:]
+    after_start = k[None, :] >= ii[:, None]
+    is_anchor = (k[None, :] == ii[:, None]) | (k[None, :] == jj[:, None])
+
+    if trend_type == structs.TrendlineTypes.RESISTANCE:
+        broken = deviation < -thresholds["breakout_tolerance"]
+    else:
+        broken = deviation > thresholds["breakout_tolerance"]
+    broken &= after_start & ~is_anchor
+    is_breakout = broken.any(axis=1)
+    breakout_index = np.where(is_breakout, broken.argmax(axis=1) + lo, -1)
+
+    # Most candidates cross some candle, drop them before doing any more work on them
+    rows = np.flatnonzero(~is_breakout) if ignore_breakouts else np.arange(len(ii))
+    return {
+        "lo": lo,
+        "k": k,
+        "rows": rows,
+        "breakout_index": breakout_index,
+        "abs_deviation": np.abs(deviation[rows]),
+        "after_start": after_start[rows],
+        "is_anchor": is_anchor[rows],
+    }
+
+
+def _points_on_line(tested, jj, member_mask, is_pivot, last_pt_must_be_pivot, thresholds):
+    # (rows x candles from lo) mask of the candles each tested line passes through. pytrendline only counted
+    # pivots under last_pt_must_be_pivot and any candle under all_pts_must_be_pivots alone. Here the members
+    # are member_mask, and with last_pt_must_be_pivot any of them up to the second anchor
+    lo, k, rows = tested["lo"], tested["k"], tested["rows"]
+    on_line = (
+        (tested["abs_deviation"] < thresholds["max_allowable_error_pt_to_trend"])
+        & tested["after_start"]
+        & member_mask[None, lo:]
+    )
+    if last_pt_must_be_pivot:
+        # Points past the second anchor would become the last point of the line, so they must be pivots too
+        on_line &= (k[None, :] <= jj[rows, None]) | is_pivot[None, lo:]
+    on_line |= tested["is_anchor"]
+    return on_line
+
+
+def _pack_points(on_line, lo, n):
+    points = np.zeros((len(on_line), n), dtype=bool)
+    points[:, lo:] = on_line
+    return np.packbits(points, axis=1)
+
+
+def _unique_pointsets(packed_points):
+    # Index of the first occurrence of every distinct point set
+    if len(packed_points) == 0:
+        return np.empty(0, dtype=np.int64)
+    packed_points = np.ascontiguousarray(packed_points)
+    row_view = packed_points.view(np.dtype((np.void, packed_points.shape[1])))[:, 0]
+    _, first = np.unique(row_view, return_index=True)
+    return np.sort(first)
+
+
+def _cell_neighbours(cell_keys, cell_xy, values_x, values_y, dx, dy):
+    # (cell, neighbour) index pairs of the occupied cells whose neighbour at (+dx, +dy) is occupied too
+    flags, rx, ry = cell_xy
+    target_x, target_y = values_x[rx] + dx, values_y[ry] + dy
+    nx = np.minimum(np.searchsorted(values_x, target_x), len(values_x) - 1)
+    ny = np.minimum(np.searchsorted(values_y, target_y), len(values_y) - 1)
+    target = (flags * len(values_x) + nx) * len(values_y) + ny
+    neighbour = np.minimum(np.searchsorted(cell_keys, target), len(cell_keys) - 1)
+    exists = (values_x[nx] == target_x) & (values_y[ny] == target_y) & (cell_keys[neighbour] == target)
+    return np.flatnonzero(exists), neighbour[exists]
+
+
+def _duplicate_groups(last_prices, slopes, is_breakout, price_thres, slope_thres):
+    # Connected components of the 'almost identical' relation (last prices within price_thres, slopes within
+    # slope_thres, same breakout state), numbered in order of their first row. Lines are hashed into cells of
+    # price_thres x slope_thres: lines sharing a cell are all within both thresholds, so only cells need joining,
+    # and a cell can only touch its 8 neighbours. Side by side cells touch when their closest lines do, diagonal
+    # ones are found with a sorted sweep, so grouping is O(n log n) instead of comparing every pair
+    n = len(last_prices)
+    if n == 0 or not (price_thres > 0 and slope_thres > 0):
+        return np.arange(n)
+
+    values_x, rx = np.unique(np.floor(last_prices / price_thres), return_inverse=True)
+    values_y, ry = np.unique(np.floor(slopes / slope_thres), return_inverse=True)
+    keys = (is_breakout.astype(np.int64) * len(values_x) + rx) * len(values_y) + ry
+    cell_keys, cell = np.unique(keys, return_inverse=True)
+    num_cells = len(cell_keys)
+    cell_xy = (
+        cell_keys // (len(values_x) * len(values_y)),
+        cell_keys // len(values_y) % len(values_x),
+        cell_keys % len(values_y),
+    )
+
+    # Lines ordered by cell, then by last price or slope
+    by_price = np.lexsort((last_prices, cell))
+    by_slope = np.lexsort((slopes, cell))
+    starts = np.searchsorted(cell[by_price], np.arange(num_cells))
+    ends = np.r_[starts[1:], n]
+
+    def near(a, b):
+        return (np.abs(last_prices[a] - last_prices[b]) < price_thres) & (np.abs(slopes[a] - slopes[b]) < slope_thres)
+
+    edges = []
+    for dx, dy, order in ((1, 0, by_price), (0, 1, by_slope)):
+        # Side by side cells touch when the last line of one and the first of the other along that axis do
+        a, b = _cell_neighbours(cell_keys, cell_xy, values_x, values_y, dx, dy)
+        touching = near(order[ends[a] - 1], order[starts[b]])
+        edges.append((a[touching], b[touching]))
+
+    # A line of cell b touches diagonal neighbour a when one of a's lines with a last price within price_thres,
+    # a suffix of a's lines by price, has a slope within slope_thres. The closest slope is the max (b above a)
+    # or min of the suffix, kept per position as slope ranks offset by cell so the running max/min stays in the
+    # cell, and the line it belongs to is confirmed with the pairwise comparison
+    sorted_keys = cell[by_price] + 1j * last_prices[by_price]
+    sorted_prices = last_prices[by_price]
+    by_rank = np.argsort(slopes, kind="stable")
+    slope_rank = np.empty(n, dtype=np.int64)
+    slope_rank[by_rank] = np.arange(n)
+    offset = cell[by_price] * n
+    suffix_max = by_rank[np.maximum.accumulate((slope_rank[by_price] - offset)[::-1])[::-1] + offset]
+    suffix_min = by_rank[np.minimum.accumulate((slope_rank[by_price] + offset)[::-1])[::-1] - offset]
+    for dy, suffix in ((1, suffix_max), (-1, suffix_min)):
+        a, b = _cell_neighbours(cell_keys, cell_xy, values_x, values_y, 1, dy)
+        neighbour_of = np.full(num_cells, -1)
+        neighbour_of[b] = a
+        rows = np.flatnonzero(neighbour_of[cell] >= 0)
+        row_a = neighbour_of[cell[rows]]
+
+        # First of a's lines within price_thres of the line. The rounded bound only gives a start: the exact
+        # first one is found by stepping over the prices at either side that compare otherwise
+        first = np.searchsorted(sorted_keys, row_a + 1j * (last_prices[rows] - price_thres))
+        while True:
+            step = first < ends[row_a]
+            step[step] = np.abs(last_prices[rows[step]] - sorted_prices[first[step]]) >= price_thres
+            if not step.any():
+                break
+            first[step] = np.searchsorted(sorted_keys, row_a[step] + 1j * sorted_prices[first[step]], side="right")
+        while True:
+            step = first > starts[row_a]
+            step[step] = np.abs(last_prices[rows[step]] - sorted_prices[first[step] - 1]) < price_thres
+            if not step.any():
+                break
+            first[step] = np.searchsorted(sorted_keys, row_a[step] + 1j * sorted_prices[first[step] - 1])
+
+        inside = first < ends[row_a]
+        rows, row_a, first = rows[inside], row_a[inside], first[inside]
+        touching = near(suffix[first], rows)
+        edges.append((row_a[touching], cell[rows[touching]]))
+
+    # Components of the cells, by propagating the min label along the edges, grouped by the cell they lead from
+    a = np.concatenate([pair[0] for pair in edges])
+    b = np.concatenate([pair[1] for pair in edges])
+    links = np.unique(np.r_[a * num_cells + b, b * num_cells + a])
+    source, target = links // num_cells, links % num_cells
+    sources, source_starts = np.unique(source, return_index=True)
+    labels = np.arange(num_cells)
+    while len(links):
+        propagated = labels.copy()
+        propagated[sources] = np.minimum(labels[sources], np.minimum.reduceat(labels[target], source_starts))
+        propagated = propagated[propagated]
+        if np.array_equal(propagated, labels):
+            break
+        labels = propagated
+
+    # Groups numbered in order of their first row
+    components, first_row, group_of_row = np.unique(labels[cell], return_index=True, return_inverse=True)
+    group_rank = np.empty(len(components), dtype=np.int64)
+    group_rank[np.argsort(first_row)] = np.arange(len(components))
+    return group_rank[group_of_row]
+
+
+def _mark_duplicates(trends, candlestick_data, trend_type, config):
+    n = len(trends["score"])
+    group_base = 1000 if trend_type == structs.TrendlineTypes.RESISTANCE else 2000
+
+    if n == 0:
+        trends["duplicate_group_id"] = np.empty(0, dtype=np.int64)
+        trends["is_best_from_duplicate_group"] = np.empty(0, dtype=bool)
+        trends["overall_rank"] = np.empty(0, dtype=object)
+        trends["rank_within_group"] = np.empty(0, dtype=np.int64)
+        return trends
+
+    groups = _duplicate_groups(
+        trends["price_at_last_date"],
+        trends["slope"],
+        trends["is_breakout"],
+        _config_value(config, "duplicate_grouping_threshold_last_price", candlestick_data),
+        _config_value(config, "duplicate_grouping_threshold_slope", candlestick_data),
+    )
+
+    # Order by group, then best score first within each group
+    order = np.lexsort((-trends["score"], groups))
+    sorted_groups = groups[order]
+    group_starts = np.flatnonzero(np.r_[True, sorted_groups[1:] != sorted_groups[:-1]])
+    group_sizes = np.diff(np.r_[group_starts, n])
+
+    rank_within_group = np.empty(n, dtype=np.int64)
+    rank_within_group[order] = np.arange(n) - np.repeat(group_starts, group_sizes) + 1
+
+    is_best = rank_within_group == 1
+    best_rows = np.flatnonzero(is_best)
+    overall_rank = np.full(n, None, dtype=object)
+    overall_rank[best_rows[np.argsort(-trends["score"][best_rows], kind="stable")]] = np.arange(1, len(best_rows) + 1)
+
+    trends["duplicate_group_id"] = groups + group_base
+    trends["is_best_from_duplicate_group"] = is_best
+    trends["overall_rank"] = overall_rank
+    trends["rank_within_group"] = rank_within_group
+    return trends
+
+
+def _split_rows(values, counts):
+    return [chunk.tolist() for chunk in np.split(values, np.cumsum(counts)[:-1])] if len(counts) else []
+
+
+def _dates_at(dates, indices):
+    # Timestamps of the given candles as an object array. Only these are converted: turning every date of a long
+    # history into Timestamps takes longer than the rest of finalizing
+    return dates[indices].to_numpy(dtype=object)
+
+
+def _build_trends_df(trends, counts, point_cols, dates, trend_type, global_dates):
+    if len(trends["score"]) == 0:
+        return pd.DataFrame(columns=TRENDLINE_COLUMNS)
+
+    pointset_indeces = _split_rows(point_cols, counts)
+    pointset_dates = _split_rows(_dates_at(dates, point_cols), counts)
+
+    prefix = "R" if trend_type == structs.TrendlineTypes.RESISTANCE else "S"
+    ids = ["{}-[{}]".format(prefix, ",".join(map(str, pts))) for pts in pointset_indeces]
+
+    starts = point_cols[np.cumsum(counts) - counts]
+    ends = point_cols[np.cumsum(counts) - 1]
+    is_breakout = trends["breakout_index"] >= 0
+    safe_breakout = np.maximum(trends["breakout_index"], 0)
+
+    trends_df = pd.DataFrame(
+        {
+            "id": ids,
+            "trendtype": trend_type,
+            "pointset_indeces": pointset_indeces,
+            "pointset_dates": pointset_dates,
+            "starts_at_index": starts,
+            "starts_at_date": _dates_at(dates, starts),
+            "ends_at_index": ends,
+            "ends_at_date": _dates_at(dates, ends),
+            "is_breakout": is_breakout,
+            "breakout_index": np.where(is_breakout, trends["breakout_index"], None),
+            "breakout_date": np.where(is_breakout, _dates_at(dates, safe_breakout), None),
+            "num_points": counts,
+            "m": trends["m"],
+            "b": trends["b"],
+            "slope": trends["slope"],
+            "price_at_last_date": trends["price_at_last_date"],
+            "score": trends["score"],
+            "includes_global_max_or_min": trends["includes_global_max_or_min"],
+            "global_maxs_or_mins": [global_dates] * len(ids),
+            "price_at_next_future_date": trends["price_at_last_date"] + trends["m"],
+            "duplicate_group_id": trends["duplicate_group_id"],
+            "is_best_from_duplicate_group": trends["is_best_from_duplicate_group"],
+            "overall_rank": trends["overall_rank"],
+            "rank_within_group": trends["rank_within_group"],
+        },
+        columns=TRENDLINE_COLUMNS,
+    )
+    return trends_df.sort_values(by="score", ascending=False)
+
+
+def _line_limits(candlestick_data, trend_type, config):
+    # Allowed (min slope, max slope, min last price, max last price) of a trendline
+    side = "support" if trend_type == structs.TrendlineTypes.SUPPORT else "resistance"
+    return tuple(
+        _config_value(config, "{}_allowable_{}_{}".format(bound, side, kind), candlestick_data)
+        for kind, bound in (("slope", "min"), ("slope", "max"), ("last_price", "min"), ("last_price", "max"))
+    )
+
+
+def _global_mask(prices, trend_type, scan_from_index, avg_range):
+    # Global max (resistance) or min (support) prices, with some tolerance for near-equal extremes
+    scanned = prices[scan_from_index:]
+    extreme = scanned.max() if trend_type == structs.TrendlineTypes.RESISTANCE else scanned.min()
+    is_global = np.zeros(len(prices), dtype=bool)
+    is_global[scan_from_index:] = np.abs(scanned - extreme) < avg_range * 0.10
+    return is_global
+
+
+def _anchor_masks(is_pivot, scan_from_index, first_pt_must_be_pivot, last_pt_must_be_pivot, all_pts_must_be_pivots):
+    # Which candles may start a candidate line, end it, and be one of its points
+    n = len(is_pivot)
+    everything = np.ones(n, dtype=bool)
+    in_scan = np.arange(n) >= scan_from_index
+    start_mask = (is_pivot if (first_pt_must_be_pivot or all_pts_must_be_pivots) else everything) & in_scan
+    end_mask = (is_pivot if (last_pt_must_be_pivot or all_pts_must_be_pivots) else everything) & in_scan
+    member_mask = is_pivot if all_pts_must_be_pivots else everything
+    return start_mask, end_mask, member_mask
+
+
+def _finalize_trends(
+    candlestick_data,
+    tt,
+    config,
+    candidates,
+    counts,
+    point_cols,
+    is_global,
+    trendline_must_include_global_maxmin_pt,
+):
+    # Turns qualifying candidates (m, b, breakout_index and err_sum arrays, with their points as flat sorted
+    # indices split by counts) into the trendlines dataframe: scores, global max/min and duplicate groups
+    dates = candlestick_data.dates
+    last_index = len(dates) - 1
+    avg_range = avg_candle_range(candlestick_data)
+    row_starts = np.cumsum(counts) - counts
+
+    includes_global = np.add.reduceat(is_global[point_cols], row_starts) > 0 if len(counts) else counts > 0
+    if trendline_must_include_global_maxmin_pt:
+        keep_points = np.repeat(includes_global, counts)
+        candidates = {key: values[includes_global] for key, values in candidates.items()}
+        point_cols = point_cols[keep_points]
+        counts = counts[includes_global]
+        includes_global = includes_global[includes_global]
+
+    mean_err = candidates["err_sum"] / np.maximum(counts, 1)
+    mean_err = np.maximum(mean_err, avg_range * 1e-9)
+
+    trends = {
+        "m": candidates["m"],
+        "b": candidates["b"],
+        "slope": candidates["m"] * avg_range,
+        "price_at_last_date": candidates["m"] * last_index + candidates["b"],
+        "breakout_index": candidates["breakout_index"].astype(np.int64),
+        "is_breakout": candidates["breakout_index"] >= 0,
+        "includes_global_max_or_min": includes_global,
+    }
+    trends["score"] = np.asarray(
+        config.get("scoring_function", DEFAULT_CONFIG["scoring_function"])(
+            candlestick_data, mean_err, counts, trends["slope"]
+        ),
+        dtype=np.float64,
+    )
+    trends = _mark_duplicates(trends, candlestick_data, tt, config)
+
+    return _build_trends_df(trends, counts, point_cols, dates, tt, dates[is_global].tolist())
+
+
+def _detect_single(
+    candlestick_data,
+    tt,
+    first_pt_must_be_pivot,
+    last_pt_must_be_pivot,
+    all_pts_must_be_pivots,
+    trendline_must_include_global_maxmin_pt,
+    min_points_required,
+    scan_from_date,
+    ignore_breakouts,
+    config,
+    budget=None,
+):
+    """
+    Every pivot (or candle) pair i < j defines a candidate line. Candidates are evaluated in batches
+    as a (lines x candles) matrix: the line is kept iff it passes through at least min_points_required
+    prices within max_allowable_error_pt_to_trend. Surviving lines are then scored and grouped into
+    duplicates (lines with almost identical slope and last price), marking the best of each group.
+
+    Pivots are pytrendline's, but the lines only match it when neither last_pt_must_be_pivot nor
+    all_pts_must_be_pivots is set. A line breaks out on any candle it cuts through, where pytrendline only
+    tested pivots under last_pt_must_be_pivot, so the defaults find a subset of its lines. That option alone
+    counts any candle up to the second anchor as a point (more lines), and all_pts_must_be_pivots alone only
+    pivots (fewer lines). Scores use each point's own error; pytrendline mispaired them on lines with a point
+    between the anchors, so those rank differently.
+    """
+    thresholds = {
+        key: _config_value(config, key, candlestick_data)
+        for key in ("max_allowable_error_pt_to_trend", "breakout_tolerance")
+    }
+    min_slope, max_slope, min_last_price, max_last_price = _line_limits(candlestick_data, tt, config)
+
+    prices = _price_series(candlestick_data, tt)
+    n = len(prices)
+    last_index = n - 1
+    avg_range = avg_candle_range(candlestick_data)
+
+    scan_from_index = _scan_from_index(candlestick_data, scan_from_date)
+    pivots = get_pivots(candlestick_data, tt, scan_from_index, config)
+    is_pivot = np.zeros(n, dtype=bool)
+    is_pivot[list(pivots)] = True
+    is_global = _global_mask(prices, tt, scan_from_index, avg_range)
+
+    start_mask, end_mask, member_mask = _anchor_masks(
+        is_pivot, scan_from_index, first_pt_must_be_pivot, last_pt_must_be_pivot, all_pts_must_be_pivots
+    )
+
+    start_indices, end_indices = np.flatnonzero(start_mask), np.flatnonzero(end_mask)
+    if budget is None:
+        pair_blocks = _candidate_pair_blocks(start_indices, end_indices)
+    else:
+        ranks = anchor_ranks(
+            prices,
+            tt,
+            is_pivot,
+            is_global,
+            _config_value(config, "pivot_seperation_threshold", candlestick_data),
+            _config_value(config, "pivot_grouping_threshold", candlestick_data),
+        )
+        pair_blocks = _budgeted_pair_blocks(start_indices, end_indices, ranks)
+        budget.reserve_setup_time()
+
+    chunk = max(1, CANDIDATE_CHUNK_CELLS // n)
+    num_candidates = 0
+    seconds_each = None
+    is_exhaustive = True
+    kept = {"ii": [], "jj": [], "m": [], "b": [], "breakout_index": [], "err_sum": [], "points": []}
+    for ii, jj in pair_blocks:
+        m = (prices[jj] - prices[ii]) / (jj - ii)
+        b = prices[ii] - m * ii
+
+        # Slope is found by considering one candle as rightward unit and average candle range as upward unit
+        slope = m * avg_range
+        price_at_last = m * last_index + b
+        allowed = (
+            (slope <= max_slope)
+            & (slope >= min_slope)
+            & (price_at_last <= max_last_price)
+            & (price_at_last >= min_last_price)
+        )
+        ii, jj, m, b = ii[allowed], jj[allowed], m[allowed], b[allowed]
+
+        for start in range(0, len(ii), chunk):
+            size = min(chunk, len(ii) - start)
+            if budget is not None:
+                allowed_size = budget.allowance(size, num_candidates > 0, seconds_each)
+                if allowed_size < size:
+                    is_exhaustive = False
+                    size = allowed_size
+                if size == 0:
+                    break
+            num_candidates += size
+            sl = slice(start, start + size)
+            chunk_started = time.perf_counter()
+            rows, breakout_index, err_sum, packed = _evaluate_candidates(
+                prices,
+                ii[sl],
+                jj[sl],
+                m[sl],
+                b[sl],
+                tt,
+                member_mask,
+                is_pivot,
+                last_pt_must_be_pivot,
+                thresholds,
+                min_points_required,
+                ignore_breakouts,
+            )
+            kept["ii"].append(ii[sl][rows])
+            kept["jj"].append(jj[sl][rows])
+            kept["m"].append(m[sl][rows])
+            kept["b"].append(b[sl][rows])
+            kept["breakout_index"].append(breakout_index)
+            kept["err_sum"].append(err_sum)
+            kept["points"].append(packed)
+            seconds_each = (time.perf_counter() - chunk_started) / size
+        if not is_exhaustive:
+            break
+
+    if kept["points"]:
+        kept = {key: np.concatenate(values) for key, values in kept.items()}
+    else:
+        kept = {key: np.empty(0) for key in kept}
+        kept["points"] = np.empty((0, (n + 7) // 8), dtype=np.uint8)
+        kept["breakout_index"] = np.empty(0, dtype=np.int64)
+        kept["ii"] = kept["jj"] = np.empty(0, dtype=np.int64)
+
+    # Different anchor pairs can describe the same set of points, keep the first one in (i, j) order. Budgeted
+    # rounds find candidates out of that order, sorting them back makes an exhaustive budgeted run identical
+    # to an unbudgeted one
+    if budget is not None:
+        order = np.lexsort((kept["jj"], kept["ii"]))
+        kept = {key: values[order] for key, values in kept.items()}
+    del kept["ii"], kept["jj"]
+    first = _unique_pointsets(kept["points"])
+    kept = {key: values[first] for key, values in kept.items()}
+    point_masks = np.unpackbits(kept.pop("points"), axis=1, count=n).astype(bool)
+    _, point_cols = np.nonzero(point_masks)
+
+    trends_df = _finalize_trends(
+        candlestick_data,
+        tt,
+        config,
+        kept,
+        point_masks.sum(axis=1),
+        point_cols,
+        is_global,
+        trendline_must_include_global_maxmin_pt,
+    )
+    # Number of anchor pairs evaluated against the candles, for instrumentation, and whether that was all of them
+    trends_df.attrs["num_candidates"] = num_candidates
+    trends_df.attrs["is_exhaustive"] = is_exhaustive
+    return trends_df, pivots
+
+
+def detect(
+    candlestick_data=None,
+    trend_type=None,
+    # Specify if you require the first point of a trendline to be a pivot
+    first_pt_must_be_pivot=False,
+    # Specify if you require the last point of the trendline to be a pivot
+    last_pt_must_be_pivot=False,
+    # Specify if you require all trendline points to be pivots
+    all_pts_must_be_pivots=False,
+    # Specify if you require one of the trendline points to be global max or min price
+    trendline_must_include_global_maxmin_pt=False,
+    # Specify minimum amount of points required for trendline detection (NOTE: must be at least two)
+    min_points_required=3,
+    # Specify if you want to ignore prices before some date
+    scan_from_date=None,
+    # Specify if you want to ignore 'breakout' lines. That is, lines that intersect a candle
+    ignore_breakouts=True,
+    # Specify config for tuning detection/grouping/scoring parameters
+    config=DEFAULT_CONFIG,
+    # Specify if support and resistance of a BOTH request may run concurrently (on a shared thread pool)
+    parallel=True,
+    # Specify a time limit in seconds and/or a limit of candidate lines evaluated per side to get the best lines
+    # found so far instead of an exhaustive search. Candidates of the most prominent pivots are evaluated first
+    time_budget=None,
+    max_candidates=None,
+):
+    _validate_inputs(candlestick_data, trend_type)
+
+    if min_points_required < 2:
+        raise Exception("min_points_required must be at least two, received {}".format(min_points_required))
+    if time_budget is not None and time_budget <= 0:
+        raise Exception("time_budget must be a positive number of seconds, received {}".format(time_budget))
+    if max_candidates is not None and max_candidates < 1:
+        raise Exception("max_candidates must be at least one, received {}".format(max_candidates))
+
+    deadline = None if time_budget is None else time.perf_counter() + time_budget
+    budgeted = deadline is not None or max_candidates is not None
+
+    def detect_wrapped(tt, sides_left=1):
+        return _detect_single(
+            candlestick_data,
+            tt,
+            first_pt_must_be_pivot,
+            last_pt_must_be_pivot,
+            all_pts_must_be_pivots,
+            trendline_must_include_global_maxmin_pt,
+            min_points_required,
+            scan_from_date,
+            ignore_breakouts,
+            config,
+            _Budget(deadline, max_candidates, sides_left) if budgeted else None,
+        )
+
+    results = {
+        "trend_type": trend_type,
+        "candlestick_data": candlestick_data,
+    }
+
+    if trend_type == structs.TrendlineTypes.BOTH and parallel and (os.cpu_count() or 1) > 1:
+        # The two sides only read the candle arrays, so support runs on the pool while this thread does resistance
+        support = _get_side_pool().submit(detect_wrapped, structs.TrendlineTypes.SUPPORT)
+        try:
+            resistance = detect_wrapped(structs.TrendlineTypes.RESISTANCE)
+        finally:
+            results["support_trendlines"], results["support_pivots"] = support.result()
+        results["resistance_trendlines"], results["resistance_pivots"] = resistance
+        return _with_exhaustive(results)
+
+    if trend_type in (structs.TrendlineTypes.BOTH, structs.TrendlineTypes.SUPPORT):
+        results["support_trendlines"], results["support_pivots"] = detect_wrapped(
+            structs.TrendlineTypes.SUPPORT, 2 if trend_type == structs.TrendlineTypes.BOTH else 1
+        )
+    if trend_type in (structs.TrendlineTypes.BOTH, structs.TrendlineTypes.RESISTANCE):
+        results["resistance_trendlines"], results["resistance_pivots"] = detect_wrapped(
+            structs.TrendlineTypes.RESISTANCE
+        )
+
+    return _with_exhaustive(results)
+
+
+def _with_exhaustive(results):
+    # False when a time_budget or max_candidates cut the search short on either side
+    results["is_exhaustive"] = all(
+        results[key].attrs.get("is_exhaustive", True)
+        for key in ("support_trendlines", "resistance_trendlines")
+        if key in results
+    )
+    return results
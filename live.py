@@ -0,0 +1,405 @@
+import numpy as np
+import pandas as pd
+
+import detect
+import structs
+
+# Candles whose pivot status can still change when a new candle arrives: a pivot looks up to
+# MAX_NUMBER_CONTINUOUS_PIVOTS candles ahead, and the previous last candle was a pivot only by being last
+TAIL = detect.MAX_NUMBER_CONTINUOUS_PIVOTS + 2
+
+DEFAULT_LOOKBACK = 1000
+
+
+class _GrowableArray:
+    # Append-only float64 buffer with amortized O(1) appends
+
+    def __init__(self, values, dtype=np.float64):
+        values = np.asarray(values, dtype=dtype)
+        self._data = np.empty(max(16, 2 * len(values)), dtype=dtype)
+        self._data[: len(values)] = values
+        self._size = len(values)
+
+    def append(self, value):
+        if self._size == len(self._data):
+            grown = np.empty(2 * len(self._data), dtype=self._data.dtype)
+            grown[: self._size] = self._data[: self._size]
+            self._data = grown
+        self._data[self._size] = value
+        self._size += 1
+
+    def view(self):
+        return self._data[: self._size]
+
+
+class _LiveSide:
+    # Pivots and candidate lines of one trend type. Candidates are all anchor pairs that are still valid,
+    # including the ones that do not have min_points_required points yet or whose last price is currently out
+    # of the allowed range (see within_limits). A candidate's points before the tail are final ('frozen'); the
+    # ones in the tail are recomputed on every update.
+
+    def __init__(self, detector, trend_type, prices):
+        self.detector = detector
+        self.trend_type = trend_type
+        self.prices = _GrowableArray(prices)
+        self.is_pivot = _GrowableArray(
+            detect.pivot_mask(np.asarray(prices), trend_type, detector.separation_thres, detector.grouping_thres),
+            dtype=bool,
+        )
+        self.slope_limits = detector.line_limits[trend_type][:2]
+
+        self.ii = np.empty(0, dtype=np.int64)
+        self.jj = np.empty(0, dtype=np.int64)
+        self.m = np.empty(0)
+        self.b = np.empty(0)
+        self.breakout_index = np.empty(0, dtype=np.int64)
+        self.frozen_count = np.empty(0, dtype=np.int64)
+        self.frozen_err = np.empty(0)
+        self.frozen_points = []
+
+        n = len(prices)
+        start_ok, end_ok = self._anchor_masks(0, n)
+        w0 = self._window_start(n)
+        for ii, jj in detect._candidate_pair_blocks(np.flatnonzero(start_ok[w0:]) + w0, np.flatnonzero(end_ok)):
+            self._add_candidates(ii, jj)
+
+    def _window_start(self, n):
+        lookback = self.detector.lookback
+        return 0 if lookback is None else max(0, n - lookback)
+
+    def _anchor_masks(self, lo, hi):
+        opts = self.detector.options
+        is_pivot = self.is_pivot.view()[lo:hi]
+        everything = np.ones(hi - lo, dtype=bool)
+        start_ok = is_pivot if (opts["first_pt_must_be_pivot"] or opts["all_pts_must_be_pivots"]) else everything
+        end_ok = is_pivot if (opts["last_pt_must_be_pivot"] or opts["all_pts_must_be_pivots"]) else everything
+        return start_ok, end_ok
+
+    def _on_line(self, positions, rows=slice(None)):
+        # (candidates x positions) membership of the given candles in each candidate's point set
+        opts = self.detector.options
+        prices = self.prices.view()
+        is_pivot = self.is_pivot.view()
+        ii, jj = self.ii[rows], self.jj[rows]
+
+        abs_deviation = np.abs(self.m[rows, None] * positions[None, :] + self.b[rows, None] - prices[None, positions])
+        on_line = (abs_deviation < self.detector.thresholds["max_allowable_error_pt_to_trend"]) & (
+            positions[None, :] >= ii[:, None]
+        )
+        if opts["all_pts_must_be_pivots"]:
+            on_line &= is_pivot[None, positions]
+        if opts["last_pt_must_be_pivot"]:
+            on_line &= (positions[None, :] <= jj[:, None]) | is_pivot[None, positions]
+        on_line |= (positions[None, :] == ii[:, None]) | (positions[None, :] == jj[:, None])
+        return on_line, abs_deviation
+
+    def _keep(self, keep):
+        if keep.all():
+            return
+        for name in ("ii", "jj", "m", "b", "breakout_index", "frozen_count", "frozen_err"):
+            setattr(self, name, getattr(self, name)[keep])
+        self.frozen_points = [pts for pts, k in zip(self.frozen_points, keep) if k]
+
+    def _add_candidates(self, ii, jj):
+        detector = self.detector
+        prices = self.prices.view()
+        n = len(prices)
+        min_slope, max_slope = self.slope_limits
+
+        # The last price limits move with every candle, they are applied when lines are read (within_limits)
+        m = (prices[jj] - prices[ii]) / (jj - ii)
+        b = prices[ii] - m * ii
+        slope = m * detector.avg_range
+        allowed = (slope <= max_slope) & (slope >= min_slope)
+        ii, jj, m, b = ii[allowed], jj[allowed], m[allowed], b[allowed]
+
+        # Pairs come sorted by first anchor, chunks keep the (candidates x candles) arrays bounded like in detect
+        chunk = max(1, detect.CANDIDATE_CHUNK_CELLS // n)
+        for start in range(0, len(ii), chunk):
+            sl = slice(start, start + chunk)
+            self._add_chunk(ii[sl], jj[sl], m[sl], b[sl])
+
+    def _add_chunk(self, ii, jj, m, b):
+        detector = self.detector
+        prices = self.prices.view()
+        n = len(prices)
+
+        # Evaluate on the window that starts at the earliest anchor, so the cost does not depend on history length
+        lo = int(ii.min())
+        rows, breakout_index, _, packed = detect._evaluate_candidates(
+            prices[lo:],
+            ii - lo,
+            jj - lo,
+            m,
+            b + m * lo,
+            self.trend_type,
+            self._member_mask(lo, n),
+            self.is_pivot.view()[lo:],
+            detector.options["last_pt_must_be_pivot"],
+            detector.thresholds,
+            2,
+            detector.options["ignore_breakouts"],
+        )
+        frozen_end = max(0, n - TAIL)
+        points = np.unpackbits(packed, axis=1, count=n - lo).astype(bool)[:, : max(0, frozen_end - lo)]
+        frozen_rows, frozen_cols = np.nonzero(points)
+        frozen_cols = frozen_cols + lo
+        abs_deviation = np.abs(m[rows][frozen_rows] * frozen_cols + b[rows][frozen_rows] - prices[frozen_cols])
+
+        self.ii = np.concatenate([self.ii, ii[rows]])
+        self.jj = np.concatenate([self.jj, jj[rows]])
+        self.m = np.concatenate([self.m, m[rows]])
+        self.b = np.concatenate([self.b, b[rows]])
+        self.breakout_index = np.concatenate(
+            [self.breakout_index, np.where(breakout_index >= 0, breakout_index + lo, -1)]
+        )
+        self.frozen_count = np.concatenate([self.frozen_count, points.sum(axis=1)])
+        self.frozen_err = np.concatenate(
+            [self.frozen_err, np.bincount(frozen_rows, weights=abs_deviation, minlength=len(rows))]
+        )
+        self.frozen_points.extend(detect._split_rows(frozen_cols, points.sum(axis=1)))
+
+    def _member_mask(self, lo, hi):
+        if self.detector.options["all_pts_must_be_pivots"]:
+            return self.is_pivot.view()[lo:hi]
+        return np.ones(hi - lo, dtype=bool)
+
+    def update(self, price):
+        detector = self.detector
+        opts = detector.options
+        self.prices.append(price)
+        self.is_pivot.append(True)
+        prices = self.prices.view()
+        is_pivot = self.is_pivot.view()
+        n = len(prices)
+        k = n - 1
+
+        # Confirm or invalidate pivots near the tail
+        tail_start = max(0, n - TAIL)
+        context_start = max(0, n - 2 * TAIL)
+        old_start_ok, old_end_ok = (mask.copy() for mask in self._anchor_masks(tail_start, n))
+        old_end_ok[-1] = False
+        old_start_ok[-1] = False
+        is_pivot[tail_start:] = detect.pivot_mask(
+            prices[context_start:], self.trend_type, detector.separation_thres, detector.grouping_thres
+        )[tail_start - context_start :]
+        start_ok, end_ok = self._anchor_masks(tail_start, n)
+
+        # Candidates whose anchors no longer qualify would not be candidates in a full detection
+        keep = np.ones(len(self.ii), dtype=bool)
+        in_tail = self.ii >= tail_start
+        keep[in_tail] &= start_ok[self.ii[in_tail] - tail_start]
+        in_tail = self.jj >= tail_start
+        keep[in_tail] &= end_ok[self.jj[in_tail] - tail_start]
+        self._keep(keep)
+
+        # Breakouts on the new candle
+        deviation = self.m * k + self.b - price
+        tolerance = detector.thresholds["breakout_tolerance"]
+        if self.trend_type == structs.TrendlineTypes.RESISTANCE:
+            broken = deviation < -tolerance
+        else:
+            broken = deviation > tolerance
+        broken &= self.breakout_index < 0
+        self.breakout_index[broken] = k
+        if opts["ignore_breakouts"]:
+            self._keep(~broken)
+
+        # The candle leaving the tail has a final pivot status, freeze its membership
+        frozen = tail_start - 1
+        if frozen >= 0 and len(self.ii):
+            on_line, abs_deviation = self._on_line(np.array([frozen]))
+            rows = np.flatnonzero(on_line[:, 0])
+            self.frozen_count[rows] += 1
+            self.frozen_err[rows] += abs_deviation[rows, 0]
+            for row in rows:
+                self.frozen_points[row].append(frozen)
+
+        # New candidates are the anchor pairs with at least one anchor that just started to qualify
+        w0 = self._window_start(n)
+        new_start = np.flatnonzero(start_ok & ~old_start_ok) + tail_start
+        new_end = np.flatnonzero(end_ok & ~old_end_ok) + tail_start
+        old_end = np.flatnonzero(end_ok & old_end_ok) + tail_start
+        window_start_ok, _ = self._anchor_masks(w0, n)
+        for ii, jj in (
+            detect._candidate_pairs(np.flatnonzero(window_start_ok) + w0, new_end),
+            detect._candidate_pairs(new_start, old_end),
+        ):
+            if len(ii):
+                self._add_candidates(ii, jj)
+
+        # Candidates are forgotten once their start leaves the lookback, qualified or not, so the number kept (and
+        # the cost of an update) stays bounded however long the stream runs
+        self._keep(self.ii >= w0)
+
+    def within_limits(self, candlestick_data=None):
+        # Candidates whose price at the last candle is within the allowed last prices, evaluated on the current
+        # candles as detect would
+        candlestick_data = candlestick_data if candlestick_data is not None else self.detector.current_candles()
+        _, _, min_last_price, max_last_price = detect._line_limits(
+            candlestick_data, self.trend_type, self.detector.config
+        )
+        price_at_last = self.m * (len(self.prices.view()) - 1) + self.b
+        return (price_at_last <= max_last_price) & (price_at_last >= min_last_price)
+
+    def point_counts(self):
+        tail = np.arange(max(0, len(self.prices.view()) - TAIL), len(self.prices.view()))
+        on_line, abs_deviation = self._on_line(tail)
+        return self.frozen_count + on_line.sum(axis=1), (on_line, abs_deviation, tail)
+
+    def trends_df(self, candlestick_data):
+        detector = self.detector
+        opts = detector.options
+        counts, (on_line, abs_deviation, tail) = self.point_counts()
+
+        rows = np.flatnonzero((counts >= opts["min_points_required"]) & self.within_limits(candlestick_data))
+        # In detect's (i, j) order rather than the order candidates were found, so the same pointset is kept for
+        # duplicate anchor pairs and duplicate groups are numbered as detect numbers them
+        rows = rows[np.lexsort((self.jj[rows], self.ii[rows]))]
+        pointsets = []
+        seen = set()
+        unique_rows = []
+        for row in rows:
+            pointset = tuple(self.frozen_points[row]) + tuple(tail[on_line[row]].tolist())
+            # Different anchor pairs can describe the same set of points, keep the first one
+            if pointset in seen:
+                continue
+            seen.add(pointset)
+            pointsets.append(pointset)
+            unique_rows.append(row)
+        rows = np.array(unique_rows, dtype=np.int64)
+
+        candidates = {
+            "m": self.m[rows],
+            "b": self.b[rows],
+            "breakout_index": self.breakout_index[rows],
+            "err_sum": self.frozen_err[rows] + np.where(on_line[rows], abs_deviation[rows], 0.0).sum(axis=1),
+        }
+        point_counts = np.array([len(pts) for pts in pointsets], dtype=np.int64)
+        point_cols = np.fromiter((pt for pts in pointsets for pt in pts), dtype=np.int64, count=point_counts.sum())
+
+        prices = self.prices.view()
+        is_global = detect._global_mask(prices, self.trend_type, 0, detect.avg_candle_range(candlestick_data))
+        return detect._finalize_trends(
+            candlestick_data,
+            self.trend_type,
+            detector.config,
+            candidates,
+            point_counts,
+            point_cols,
+            is_global,
+            opts["trendline_must_include_global_maxmin_pt"],
+        )
+
+
+class LiveDetector:
+    """
+    Follows one symbol candle by candle. Pivots, candidate lines and breakout state are kept between
+    candles, and each update only touches the last few candles: tail pivots are re-evaluated, existing lines
+    are extended or broken by the new candle, and only anchor pairs involving a newly qualifying pivot are
+    evaluated. Lines must start within the last `lookback` candles and are dropped once their first anchor
+    leaves them; lookback=None keeps every line, as detect would find it over the whole history.
+
+    Detection thresholds come from `config` evaluated on the initial candles and stay fixed afterwards;
+    call rebase() from time to time (e.g. once a session) to recompute them over the full history.
+    """
+
+    def __init__(
+        self,
+        candlestick_data=None,
+        trend_type=structs.TrendlineTypes.BOTH,
+        first_pt_must_be_pivot=False,
+        last_pt_must_be_pivot=False,
+        all_pts_must_be_pivots=False,
+        trendline_must_include_global_maxmin_pt=False,
+        min_points_required=3,
+        ignore_breakouts=True,
+        lookback=DEFAULT_LOOKBACK,
+        config=detect.DEFAULT_CONFIG,
+    ):
+        detect._validate_inputs(candlestick_data, trend_type)
+
+        self.trend_type = trend_type
+        self.time_interval = candlestick_data.time_interval
+        self.lookback = lookback
+        self.config = config
+        self.options = {
+            "first_pt_must_be_pivot": first_pt_must_be_pivot,
+            "last_pt_must_be_pivot": last_pt_must_be_pivot,
+            "all_pts_must_be_pivots": all_pts_must_be_pivots,
+            "trendline_must_include_global_maxmin_pt": trendline_must_include_global_maxmin_pt,
+            "min_points_required": min_points_required,
+            "ignore_breakouts": ignore_breakouts,
+        }
+
+        self.dates = list(candlestick_data.dates)
+        self.tz = candlestick_data.tz
+        self.timestamps = _GrowableArray(candlestick_data.timestamps, dtype=np.int64)
+        self.candles = {
+            "Open": _GrowableArray(candlestick_data.open),
+            "High": _GrowableArray(candlestick_data.high),
+            "Low": _GrowableArray(candlestick_data.low),
+            "Close": _GrowableArray(candlestick_data.close),
+        }
+
+        self.avg_range = detect.avg_candle_range(candlestick_data)
+        self.separation_thres = detect._config_value(config, "pivot_seperation_threshold", candlestick_data)
+        self.grouping_thres = detect._config_value(config, "pivot_grouping_threshold", candlestick_data)
+        self.thresholds = {
+            key: detect._config_value(config, key, candlestick_data)
+            for key in ("max_allowable_error_pt_to_trend", "breakout_tolerance")
+        }
+        self.line_limits = {
+            tt: detect._line_limits(candlestick_data, tt, config)
+            for tt in (structs.TrendlineTypes.SUPPORT, structs.TrendlineTypes.RESISTANCE)
+        }
+
+        self.sides = {}
+        if trend_type in (structs.TrendlineTypes.BOTH, structs.TrendlineTypes.SUPPORT):
+            self.sides["support"] = _LiveSide(self, structs.TrendlineTypes.SUPPORT, candlestick_data.low)
+        if trend_type in (structs.TrendlineTypes.BOTH, structs.TrendlineTypes.RESISTANCE):
+            self.sides["resistance"] = _LiveSide(self, structs.TrendlineTypes.RESISTANCE, candlestick_data.high)
+
+    def update(self, date, open_price, high, low, close):
+        self.dates.append(date)
+        self.timestamps.append(pd.Timestamp(date).value)
+        for col, value in zip(("Open", "High", "Low", "Close"), (open_price, high, low, close)):
+            self.candles[col].append(value)
+
+        if "support" in self.sides:
+            self.sides["support"].update(low)
+        if "resistance" in self.sides:
+            self.sides["resistance"].update(high)
+
+    def candlestick_data(self):
+        df = pd.DataFrame({col: values.view().copy() for col, values in self.candles.items()})
+        df.insert(0, "Date", self.dates)
+        return structs.CandlestickData(df=df, time_interval=self.time_interval, datetime_col="Date")
+
+    def current_candles(self):
+        # The candles so far as views over the growing buffers, for evaluating config values without a copy
+        return structs.CandlestickData.from_arrays(
+            self.timestamps.view(),
+            *(self.candles[col].view() for col in ("Open", "High", "Low", "Close")),
+            time_interval=self.time_interval,
+            tz=self.tz,
+        )
+
+    def rebase(self):
+        # Recompute thresholds and candidates over the full history
+        self.__init__(
+            self.candlestick_data(),
+            self.trend_type,
+            lookback=self.lookback,
+            config=self.config,
+            **self.options,
+        )
+
+    def results(self):
+        candlestick_data = self.candlestick_data()
+        # Incremental updates evaluate every new candidate, there is no budget to cut them short
+        results = {"trend_type": self.trend_type, "candlestick_data": candlestick_data, "is_exhaustive": True}
+        for name, side in self.sides.items():
+            results[name + "_trendlines"] = side.trends_df(candlestick_data)
+            results[name + "_pivots"] = set(np.flatnonzero(side.is_pivot.view()).tolist())
+        return results
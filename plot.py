@@ -1,17 +1,62 @@
+import logging
+import os
+
 import pandas as pd
 import numpy as np
 
-from bokeh.resources import CDN
+from bokeh import __version__ as bokeh_version
+from bokeh.resources import CDN, Resources
+from bokeh.models import CDSView, ColumnDataSource, CustomJSFilter, FuncTickFormatter, IndexFilter, LinearColorMapper
 from bokeh.models.widgets import Div
 from bokeh.plotting import figure
-from bokeh.embed import file_html
+from bokeh.embed import components, json_item
+from bokeh.util.serialization import BINARY_ARRAY_TYPES
 
 from colour import Color
 
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from html import escape
+from json import dumps
+from itertools import chain
 from math import pi
 
 import structs
 
+logger = logging.getLogger("pivot_peak.plot")
+
+# Most candles drawn at once. Longer histories are aggregated into OHLC buckets of several bars, about two
+# pixels per candle at the figure's minimum width, so the page payload does not grow with the history
+DEFAULT_MAX_CANDLES = 650
+
+# Bytes of chart data (data source columns and formatter arguments) a chart may send to the browser. Over
+# it, plot_graph_bokeh draws fewer, wider candle buckets (pivot and point markers follow the buckets), never
+# fewer than MIN_CANDLES
+DEFAULT_PAYLOAD_BUDGET = 32 * 1024
+MIN_CANDLES = 100
+
+# Tick labels are formatted in the browser from the candles source: buckets hold `size` bars each and their
+# first bar's date is stored as int32 minutes since `origin` (epoch milliseconds)
+DATE_TICK_FORMATTER_CODE = """
+const i = Math.round(tick);
+if (i < 0 || i > last_position) {
+    return "";
+}
+const minutes = source.data.minute;
+const d = new Date(origin + 60000 * minutes[Math.min(Math.floor(i / size), minutes.length - 1)]);
+const pad = (v) => String(v).padStart(2, "0");
+return pad(d.getUTCMonth() + 1) + "/" + pad(d.getUTCDate()) + "/" + d.getUTCFullYear();
+"""
+
+# Rising and falling candles are views of the candles source, selected in the browser
+RISING_FILTER_CODE = """
+const {open, close} = source.data;
+return Array.from(open, (o, i) => close[i] > o);
+"""
+FALLING_FILTER_CODE = """
+const {open, close} = source.data;
+return Array.from(open, (o, i) => o > close[i]);
+"""
+
 css_hack = """
 .dataframe {
     border: 1px solid grey;
@@ -80,68 +125,7 @@ class TrendlineFigure:
         self.plotting_prop_overrides = plotting_prop_overrides
 
     def plot_figure(self, p, candles_df, opts={}):
-        pointset_indeces = []
-        for date in self.pointset_dates:
-            pointset_indeces.append(candles_df.loc[candles_df["Date"] == date].index[0])
-
-        pt_set_y = []
-        pt_set_x = pointset_indeces
-
-        for pt in pt_set_x:
-            if self.type == structs.TrendlineTypes.RESISTANCE:
-                pt_set_y.append(candles_df.iloc[pt].High)
-            elif self.type == structs.TrendlineTypes.SUPPORT:
-                pt_set_y.append(candles_df.iloc[pt].Low)
-            else:
-                pt_set_y.append(candles_df.iloc[pt].Low)
-
-        # Calculate slope and intersect using first point and last point
-        m, b = np.polyfit([pt_set_x[0], pt_set_x[-1]], [pt_set_y[0], pt_set_y[-1]], 1)
-
-        if self.is_breakout:
-            last_date_index = self.breakout_index + 0.05
-            last_date_trendline_price = m * last_date_index + b
-            p.x(
-                [last_date_index],
-                [last_date_trendline_price],
-                line_width=3,
-                size=10,
-                color="red",
-                alpha=0.8,
-            )
-        else:
-            last_date_index = len(candles_df) - 1
-
-        tl_vals_at_x = pt_set_y
-        tl_y_at_last_date = m * last_date_index + b
-
-        color = self.get_trendline_plot_color()
-
-        p.segment(
-            x0=[pt_set_x[0]],
-            y0=[tl_vals_at_x[0]],
-            x1=[last_date_index],
-            y1=[tl_y_at_last_date],
-            color=color,
-            line_width=self.get_trendline_plot_line_width(),
-            line_dash=self.get_trendline_plot_line_style(),
-        )
-
-        # Mark points that make up trendline
-        p.square(pt_set_x, tl_vals_at_x, size=12, color=color, alpha=0.5)
-
-        # Mark global maxs or mins
-        for date in self.global_maxs_or_mins:
-            query = candles_df.loc[candles_df["Date"] == date]
-            if len(query) == 0:
-                continue
-            index = query.iloc[0].name
-
-            if self.type == structs.TrendlineTypes.RESISTANCE:
-                price = candles_df.iloc[index].High
-            elif self.type == structs.TrendlineTypes.SUPPORT:
-                price = candles_df.iloc[index].Low
-            p.circle(index, price, size=20, color="gold", alpha=0.3)
+        _plot_trendline_figures(p, [self], candles_df, date_index(candles_df))
 
     def get_trendtype_string(self):
         if self.type == structs.TrendlineTypes.RESISTANCE:
@@ -194,22 +178,223 @@ class TrendlineFigure:
             return "dotted"
 
 
+def date_index(candles_df):
+    # Hashed Date -> row position lookup, built once per chart and shared by every trendline
+    return pd.Index(candles_df["Date"])
+
+
+def candle_buckets(candles_df, max_candles=DEFAULT_MAX_CANDLES):
+    # Aggregates consecutive bars into at most max_candles OHLC buckets of equal size (the last one may be
+    # shorter). Buckets keep bar positions as x coordinates, centered on the bars they cover, so anything else
+    # drawn at exact bar positions still lines up. With max_candles None or enough room, every bar is a bucket
+    n = len(candles_df)
+    size = 1 if not max_candles or n <= max_candles else -(-n // max_candles)
+    starts = np.arange(0, n, size)
+    ends = np.minimum(starts + size, n)
+
+    return {
+        "size": size,
+        "start": starts,
+        "x": (starts + ends - 1) / 2,
+        "open": candles_df["Open"].to_numpy()[starts],
+        "high": np.maximum.reduceat(candles_df["High"].to_numpy(), starts),
+        "low": np.minimum.reduceat(candles_df["Low"].to_numpy(), starts),
+        "close": candles_df["Close"].to_numpy()[ends - 1],
+        "date": pd.DatetimeIndex(candles_df["Date"]).take(starts),
+    }
+
+
+def candle_source(buckets):
+    """
+    The one data source of the candles, drawn by the wick segments and both candle bodies and read by the
+    date tick formatter. Prices are float32 and dates int32 minutes since the first bucket, which Bokeh sends
+    as binary arrays. Returns the source and the first bucket's date in epoch milliseconds.
+    """
+    dates = pd.DatetimeIndex(buckets["date"])
+    if dates.tz is not None:
+        dates = dates.tz_localize(None)
+    stamps = dates.asi8 // 10**6
+    origin = int(stamps[0]) if len(stamps) else 0
+    source = ColumnDataSource(
+        {
+            "x": buckets["x"].astype(np.float32),
+            "open": buckets["open"].astype(np.float32),
+            "high": buckets["high"].astype(np.float32),
+            "low": buckets["low"].astype(np.float32),
+            "close": buckets["close"].astype(np.float32),
+            "minute": ((stamps - origin) // 60000).astype(np.int32),
+        }
+    )
+    return source, origin
+
+
+def date_tick_formatter(source, origin, size, last_position):
+    # Formats tick values (bar positions) as the date of the bucket they fall in, on demand in the browser
+    return FuncTickFormatter(
+        code=DATE_TICK_FORMATTER_CODE,
+        args={"source": source, "origin": origin, "size": int(size), "last_position": int(last_position)},
+    )
+
+
+def _column_bytes(values):
+    # Serialized size of a data source column: base64 for the arrays Bokeh sends binary, JSON otherwise
+    if isinstance(values, np.ndarray) and values.dtype in BINARY_ARRAY_TYPES:
+        return 4 * -(-values.nbytes // 3)
+    return len(dumps(np.asarray(values).tolist(), default=str))
+
+
+def chart_data_bytes(p):
+    """
+    Bytes of data the chart sends to the browser: every data source column once, however many glyphs and
+    views share it, plus the tick formatter's arguments. This is the part of the payload that grows with
+    bars and trendlines; the rest is a fixed ~20 KB of models. Cheap enough to check on every chart.
+    """
+    sources = {renderer.data_source.id: renderer.data_source for renderer in p.renderers}
+    size = sum(_column_bytes(values) for source in sources.values() for values in source.data.values())
+    formatter = p.xaxis[0].formatter
+    if isinstance(formatter, FuncTickFormatter):
+        size += len(dumps({key: value for key, value in formatter.args.items() if key != "source"}, default=str))
+    return size
+
+
+def chart_payload_bytes(p):
+    # Size of the whole chart as sent to the browser (the JSON of json_item, as st.bokeh_chart sends it)
+    return len(dumps(json_item(p)))
+
+
+def _first_in_bucket(groups, positions, size):
+    # Mask of the first of each run of entries that share a group and a bucket of size bars, positions sorted
+    # within each group
+    if len(positions) == 0:
+        return np.ones(0, dtype=bool)
+    bucket = positions // size
+    return np.r_[True, (groups[1:] != groups[:-1]) | (bucket[1:] != bucket[:-1])]
+
+
+def _plot_trendline_figures(p, figures, candles_df, dates_index, bucket_size=1):
+    # Draws all trendlines with a handful of renderers (one segment glyph per dash style plus one glyph for
+    # each kind of marker) instead of several renderers per trendline. Like the candles, point markers are
+    # drawn at most once per line and bucket of bucket_size bars
+    if len(figures) == 0:
+        return
+
+    counts = np.array([len(tf.pointset_dates) for tf in figures])
+    pt_set_x = dates_index.get_indexer(list(chain.from_iterable(tf.pointset_dates for tf in figures)))
+    if (pt_set_x < 0).any():
+        raise Exception("Trendline points reference dates that are not in the candlestick data")
+
+    pt_set_x = pt_set_x.astype(np.int32)
+
+    is_resistance = np.array([tf.type == structs.TrendlineTypes.RESISTANCE for tf in figures])
+    highs = candles_df["High"].to_numpy()
+    lows = candles_df["Low"].to_numpy()
+    pt_set_y = np.where(np.repeat(is_resistance, counts), highs[pt_set_x], lows[pt_set_x]).astype(np.float32)
+
+    # Slope and intersect of each trendline using its first point and last point
+    last_pt = np.cumsum(counts) - 1
+    first_pt = last_pt - counts + 1
+    x0, x1 = pt_set_x[first_pt], pt_set_x[last_pt]
+    y0, y1 = pt_set_y[first_pt], pt_set_y[last_pt]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        m = np.where(x1 != x0, (y1 - y0) / (x1 - x0), 0.0)
+    b = y0 - m * x0
+
+    is_breakout = np.array([bool(tf.is_breakout) for tf in figures])
+    breakout_x = np.array([tf.breakout_index if tf.is_breakout else 0 for tf in figures], dtype=float) + 0.05
+    last_date_index = np.where(is_breakout, breakout_x, len(candles_df) - 1)
+    tl_y_at_last_date = m * last_date_index + b
+
+    colors = np.array([tf.get_trendline_plot_color() for tf in figures])
+    line_widths = np.array([tf.get_trendline_plot_line_width() for tf in figures])
+    line_dashes = np.array([tf.get_trendline_plot_line_style() for tf in figures])
+
+    # Line dash is not vectorizable in bokeh, so there is one segment renderer per dash style, each a view of
+    # the same source. Trendline colors index a small palette instead of repeating color strings
+    palette, color_code = np.unique(colors, return_inverse=True)
+    lines = ColumnDataSource(
+        {
+            "x0": x0.astype(np.float32),
+            "y0": y0.astype(np.float32),
+            "x1": last_date_index.astype(np.float32),
+            "y1": tl_y_at_last_date.astype(np.float32),
+            "color": color_code.astype(np.int32),
+            "line_width": line_widths.astype(np.float32),
+        }
+    )
+    color = {"field": "color", "transform": LinearColorMapper(palette=palette.tolist(), low=0, high=len(palette))}
+    for dash in np.unique(line_dashes):
+        p.segment(
+            x0="x0",
+            y0="y0",
+            x1="x1",
+            y1="y1",
+            color=color,
+            line_width="line_width",
+            line_dash=dash,
+            source=lines,
+            view=CDSView(source=lines, filters=[IndexFilter(np.flatnonzero(line_dashes == dash).tolist())]),
+        )
+
+    # Mark points that make up trendlines
+    line_of_point = np.repeat(np.arange(len(figures)), counts)
+    shown = _first_in_bucket(line_of_point, pt_set_x, bucket_size)
+    p.square(
+        x="x",
+        y="y",
+        size=12,
+        color=color,
+        alpha=0.5,
+        source=ColumnDataSource(
+            {
+                "x": pt_set_x[shown],
+                "y": pt_set_y[shown],
+                "color": color_code[line_of_point[shown]].astype(np.int32),
+            }
+        ),
+    )
+
+    # Mark breakouts
+    if is_breakout.any():
+        p.x(
+            last_date_index[is_breakout].astype(np.float32),
+            tl_y_at_last_date[is_breakout].astype(np.float32),
+            line_width=3,
+            size=10,
+            color="red",
+            alpha=0.8,
+        )
+
+    # Mark global maxs or mins, they are shared by all trendlines of a type so each is drawn once
+    global_dates = {
+        (tf.type, date)
+        for tf in figures
+        if tf.type in (structs.TrendlineTypes.RESISTANCE, structs.TrendlineTypes.SUPPORT)
+        for date in tf.global_maxs_or_mins
+    }
+    if global_dates:
+        types, dates = zip(*global_dates)
+        index = dates_index.get_indexer(list(dates))
+        found = index >= 0
+        on_high = np.array(types) == structs.TrendlineTypes.RESISTANCE
+        price = np.where(on_high, highs[index], lows[index])
+        p.circle(index[found].astype(np.int32), price[found].astype(np.float32), size=20, color="gold", alpha=0.3)
+
+
 def _draw_bidirectional_ray(p, x, y, angle, color, width=2, dash="dashed"):
     p.segment(x0=x, x1=x, y0=0, y1=10000, line_color=color, line_dash=dash, line_width=width)
 
 
-def _highlight_pivots(p, pivots_indexes, col, candles_df):
-    # Highlight pivot points
-    pivots_x_vals = []
-    pivots_y_vals = []
-    for pivot_idx in pivots_indexes:
-        pivot_panda_ts = candles_df.iloc[pivot_idx].name
-        pivot_y_val = candles_df.iloc[pivot_idx][col]
-        pivots_x_vals.append(pivot_panda_ts)
-        pivots_y_vals.append(pivot_y_val)
+def _highlight_pivots(p, pivots_indexes, col, candles_df, bucket_size=1):
+    # Highlight pivot points, the most extreme one of each bucket of bucket_size bars like the candles
+    pivots_indexes = np.sort(np.fromiter(pivots_indexes, dtype=np.int64))
+    prices = candles_df[col].to_numpy()[pivots_indexes]
+    extreme = prices if col == "Low" else -prices
+    order = np.lexsort((extreme, pivots_indexes // bucket_size))
+    pivots_indexes = pivots_indexes[order]
+    shown = _first_in_bucket(np.zeros(len(pivots_indexes)), pivots_indexes, bucket_size)
     p.diamond(
-        pivots_x_vals,
-        pivots_y_vals,
+        candles_df.index[pivots_indexes[shown]].to_numpy(dtype=np.int32),
+        prices[order][shown].astype(np.float32),
         size=20,
         line_color="green",
         fill_alpha=0.1,
@@ -217,7 +402,37 @@ def _highlight_pivots(p, pivots_indexes, col, candles_df):
     )
 
 
-def plot_graph_bokeh(results, symbol, period):
+def plot_graph_bokeh(results, symbol, period, max_candles=DEFAULT_MAX_CANDLES, payload_budget=DEFAULT_PAYLOAD_BUDGET):
+    """
+    Candlestick chart with the trendlines, pivots and global max/min points of a detect(...) output. With a
+    payload_budget (bytes of chart data, see chart_data_bytes), a chart over it is drawn again with fewer
+    candle buckets, and so fewer pivot and point markers, until it fits or is down to MIN_CANDLES. A chart
+    that still does not fit is returned with a warning logged.
+    """
+    p, candles = _plot_graph(results, period, max_candles)
+    if payload_budget is None:
+        return p
+
+    size = chart_data_bytes(p)
+    num_candles = len(candles.data["x"])
+    while size > payload_budget and num_candles > MIN_CANDLES:
+        # Candles and markers take bytes in proportion to the buckets, the trendlines do not
+        fewer = max(MIN_CANDLES, min(num_candles - 1, int(num_candles * payload_budget / size)))
+        p, candles = _plot_graph(results, period, fewer)
+        size = chart_data_bytes(p)
+        num_candles = len(candles.data["x"])
+
+    if size > payload_budget:
+        logger.warning(
+            "Chart data of %d bytes is over the %d bytes payload budget with %d candles",
+            size,
+            payload_budget,
+            num_candles,
+        )
+    return p
+
+
+def _plot_graph(results, period, max_candles):
     candlestick_data = results["candlestick_data"]
 
     # Plot
@@ -232,10 +447,9 @@ def plot_graph_bokeh(results, symbol, period):
     x_range_left = -1
     x_range_right = len(candles_df) + 10
 
-    # Plot candlestick chart
-    inc = candles_df.Close > candles_df.Open
-    dec = candles_df.Open > candles_df.Close
-    w = 0.5
+    # Plot candlestick chart, one candle per bucket of bars
+    buckets = candle_buckets(candles_df, max_candles)
+    w = 0.5 * buckets["size"]
 
     p = figure(
         x_axis_type="datetime",
@@ -247,45 +461,34 @@ def plot_graph_bokeh(results, symbol, period):
         x_range=(x_range_left, x_range_right),
     )
 
-    p.xaxis.major_label_overrides = {i: date.strftime("%m/%d/%Y") for i, date in enumerate(candles_df["Date"])}
+    # One source for the wicks, both kinds of bodies and the tick labels
+    candles, origin = candle_source(buckets)
+    p.xaxis.formatter = date_tick_formatter(candles, origin, buckets["size"], len(candles_df) - 1)
 
     p.xaxis.major_label_orientation = pi / 4
     p.grid.grid_line_alpha = 0.3
-    p.segment(
-        candles_df.index,
-        candles_df.High,
-        candles_df.index,
-        candles_df.Low,
-        color="black",
-    )
-    p.vbar(
-        candles_df.index[inc],
-        w,
-        candles_df.Open[inc],
-        candles_df.Close[inc],
-        fill_color="#D5E1DD",
-        line_color="black",
-    )
-    p.vbar(
-        candles_df.index[dec],
-        w,
-        candles_df.Open[dec],
-        candles_df.Close[dec],
-        fill_color="#F2583E",
-        line_color="black",
-    )
+    p.segment(x0="x", y0="high", x1="x", y1="low", color="black", source=candles)
+    for code, fill_color in ((RISING_FILTER_CODE, "#D5E1DD"), (FALLING_FILTER_CODE, "#F2583E")):
+        p.vbar(
+            x="x",
+            width=w,
+            bottom="open",
+            top="close",
+            fill_color=fill_color,
+            line_color="black",
+            source=candles,
+            view=CDSView(source=candles, filters=[CustomJSFilter(code=code)]),
+        )
 
-    # Plot trendlines (support)
+    # Plot trendlines (support and resistance)
+    figures = []
     if "support_trendlines" in results:
-        for _, result_row in results["support_trendlines"].iterrows():
-            tf = TrendlineFigure(structs.TrendlineTypes.SUPPORT, result_row)
-            tf.plot_figure(p, candles_df)
-
-    # Plot trendlines (resistance)
+        for result_row in results["support_trendlines"].to_dict("records"):
+            figures.append(TrendlineFigure(structs.TrendlineTypes.SUPPORT, result_row))
     if "resistance_trendlines" in results:
-        for _, result_row in results["resistance_trendlines"].iterrows():
-            tf = TrendlineFigure(structs.TrendlineTypes.RESISTANCE, result_row)
-            tf.plot_figure(p, candles_df)
+        for result_row in results["resistance_trendlines"].to_dict("records"):
+            figures.append(TrendlineFigure(structs.TrendlineTypes.RESISTANCE, result_row))
+    _plot_trendline_figures(p, figures, candles_df, date_index(candles_df), buckets["size"])
 
     # Draw vertical lines at first and last price
     _draw_bidirectional_ray(p, candles_df.index[0] - 0.5, 0, 90, "#bbbbbb")
@@ -293,14 +496,14 @@ def plot_graph_bokeh(results, symbol, period):
 
     # Highlight pivot points
     if "support_pivots" in results:
-        _highlight_pivots(p, results["support_pivots"], "Low", candles_df)
+        _highlight_pivots(p, results["support_pivots"], "Low", candles_df, buckets["size"])
     if "resistance_pivots" in results:
-        _highlight_pivots(p, results["resistance_pivots"], "High", candles_df)
+        _highlight_pivots(p, results["resistance_pivots"], "High", candles_df, buckets["size"])
 
     # Styling nits
     p.title.text_font_size = "16pt"
 
-    return p
+    return p, candles
 
 
 def plot_table_bokeh(results):
@@ -312,7 +515,7 @@ def plot_table_bokeh(results):
         all_results = results["resistance_trendlines"]
 
     if len(all_results) > 0:
-        html_trends_table = all_results.drop("pointset_dates", 1).to_html(
+        html_trends_table = all_results.drop(columns="pointset_dates").to_html(
             border=0,
             header=True,
             index=False,
@@ -335,33 +538,151 @@ def plot_table_bokeh(results):
     return div
 
 
-def plot(
-    results=None,
-    filedir=".",
-    filename="trend_plot.html",
-):
-    # Validate data
+REPORT_PAGE_HEAD = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style type="text/css">{css}</style>
+{js}
+</head>
+<body>
+"""
+
+REPORT_PAGE_TAIL = """</body>
+</html>
+"""
+
+# Only the components reports use: the core library and the widgets bundle for the results table
+REPORT_RESOURCES = Resources(mode="inline", components=["bokeh", "bokeh-widgets"])
+
+# Reports are a few hundred KB (a combined one several MB), written with a single buffered writelines
+WRITE_BUFFER_BYTES = 1 << 20
+
+
+def report_parts(results, symbol="", period=None):
+    """
+    Builds the chart and results table of one detect(...) output and returns (script, divs): the document
+    data and the elements to place in a page, without any BokehJS. period only feeds the chart title and
+    defaults to the number of candles.
+    """
     if results is None or type(results) != dict:
         raise Exception("results argument for plot needs to be output of detect(...)")
 
-    # Plot candlestick graph with trendlines
-    trend_graph = plot_graph_bokeh(results)
-
-    # Plot trendline results dataframe below the plot
+    if period is None:
+        period = len(results["candlestick_data"])
+    trend_graph = plot_graph_bokeh(results, symbol, period)
     trend_table = plot_table_bokeh(results)
+    script, divs = components((trend_graph, trend_table))
+    return script, list(divs)
 
-    # Get HTML content
-    filepath = filedir + "/" + filename
-    html_content = file_html(models=(trend_graph, trend_table), resources=CDN, title="pytrendline results")
 
-    # Hack in extra styles to HTML
-    html_content = html_content.replace(
-        "<head>",
-        '<head><style class="custom" type="text/css">{}</style>'.format(css_hack),
-    )
+def report_section(symbol, script, divs):
+    heading = "<h2>{}</h2>\n".format(escape(symbol)) if symbol else ""
+    return heading + "\n".join(divs) + "\n" + script + "\n"
 
-    # Write HTML to file
-    with open(filepath, "w") as outfile:
-        outfile.write(html_content)
 
+def write_report(filepath, title, js, sections):
+    with open(filepath, "w", encoding="utf-8", buffering=WRITE_BUFFER_BYTES) as outfile:
+        outfile.writelines(
+            chain([REPORT_PAGE_HEAD.format(title=escape(title), css=css_hack, js=js)], sections, [REPORT_PAGE_TAIL])
+        )
     return filepath
+
+
+def _symbol_report(symbol, results, period):
+    # Runs in a worker process: the Bokeh models are built there and only the page fragments come back
+    try:
+        return symbol, report_section(symbol, *report_parts(results, symbol, period)), None
+    except Exception as e:
+        return symbol, None, e
+
+
+def shared_bokehjs(filedir):
+    # Writes the BokehJS bundle used by per-symbol reports next to them, once per Bokeh version
+    filename = "bokeh-{}.min.js".format(bokeh_version)
+    filepath = os.path.join(filedir, filename)
+    if not os.path.exists(filepath):
+        _write_report_asset(filepath, "\n".join(REPORT_RESOURCES.js_raw))
+    return filename
+
+
+def _write_report_asset(filepath, content):
+    # Written to a temporary name and renamed, so concurrent exports never load a half written bundle
+    tmp_path = "{}.{}.tmp".format(filepath, os.getpid())
+    with open(tmp_path, "w", encoding="utf-8", buffering=WRITE_BUFFER_BYTES) as outfile:
+        outfile.write(content)
+    os.replace(tmp_path, filepath)
+
+
+def export_reports(
+    results_by_symbol,
+    filedir=".",
+    combined_filename=None,
+    period=None,
+    max_workers=None,
+):
+    """
+    Writes the HTML reports of many symbols ({symbol: detect(...) output}), building the charts on a process
+    pool. By default every symbol gets <filedir>/<SYMBOL>.html, all loading one shared BokehJS file written
+    next to them. With combined_filename, all symbols go into that single file instead, in the order given,
+    with BokehJS inlined once. Reports work offline either way.
+    Returns ({symbol: filepath}, {symbol: error}); a failing symbol is reported and skipped.
+    """
+    os.makedirs(filedir, exist_ok=True)
+    symbols = list(results_by_symbol)
+    max_workers = max_workers or os.cpu_count() or 1
+
+    if max_workers == 1 or len(symbols) < 2:
+        finished = (_symbol_report(symbol, results_by_symbol[symbol], period) for symbol in symbols)
+        return _write_reports(finished, symbols, filedir, combined_filename)
+
+    with ProcessPoolExecutor(max_workers=min(max_workers, len(symbols))) as pool:
+        futures = [pool.submit(_symbol_report, symbol, results_by_symbol[symbol], period) for symbol in symbols]
+        return _write_reports(
+            (future.result() for future in as_completed(futures)), symbols, filedir, combined_filename
+        )
+
+
+def _write_reports(finished, symbols, filedir, combined_filename):
+    paths = {}
+    errors = {}
+
+    if combined_filename is None:
+        js = '<script type="text/javascript" src="{}"></script>'.format(shared_bokehjs(filedir))
+        # Per-symbol files are written as soon as their symbol is done, overlapping with the workers
+        for symbol, section, error in finished:
+            if error is not None:
+                errors[symbol] = error
+                continue
+            filepath = os.path.join(filedir, "{}.html".format(symbol.replace(os.sep, "-")))
+            paths[symbol] = write_report(filepath, "{} trendlines".format(symbol), js, [section])
+        return paths, errors
+
+    sections = {}
+    for symbol, section, error in finished:
+        if error is not None:
+            errors[symbol] = error
+        else:
+            sections[symbol] = section
+    filepath = os.path.join(filedir, combined_filename)
+    write_report(
+        filepath,
+        "Trendline reports",
+        REPORT_RESOURCES.render_js(),
+        [sections[symbol] for symbol in symbols if symbol in sections],
+    )
+    return {symbol: filepath for symbol in sections}, errors
+
+
+def plot(
+    results=None,
+    filedir=".",
+    filename="trend_plot.html",
+    symbol="",
+    period=None,
+):
+    # Single report with the chart and results table, loading BokehJS from the CDN
+    script, divs = report_parts(results, symbol, period)
+    filepath = os.path.join(filedir, filename)
+    return write_report(filepath, "pytrendline results", CDN.render_js(), [report_section(symbol, script, divs)])
@@ -0,0 +1,211 @@
+import os
+import random
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+
+import pandas as pd
+import requests
+
+from requests.adapters import HTTPAdapter
+
+OHLCV_COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+
+# Provider columns to our columns. Split/dividend adjusted prices are what we chart
+TIINGO_COLUMNS = {
+    "date": "Date",
+    "adjOpen": "Open",
+    "adjHigh": "High",
+    "adjLow": "Low",
+    "adjClose": "Close",
+    "adjVolume": "Volume",
+}
+
+TIINGO_DAILY_URL = "https://api.tiingo.com/tiingo/daily/{}/prices"
+
+DEFAULT_POOL_SIZE = 16
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_TIMEOUT = 30
+
+
+class RetryableError(Exception):
+    pass
+
+
+def make_session(pool_size=DEFAULT_POOL_SIZE):
+    # Keep-alive connections shared by every fetch, sized for the concurrent fetches. Retries are ours
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def with_retries(fn, retries=3, backoff=0.5):
+    # Calls fn, retrying transient failures with exponential backoff and jitter
+    for attempt in range(retries + 1):
+        try:
+            return fn()
+        except (RetryableError, requests.ConnectionError, requests.Timeout):
+            if attempt == retries:
+                raise
+            time.sleep(backoff * 2**attempt * (1 + random.random()))
+
+
+def normalize(df, column_map=None):
+    # Renames provider columns to Date/Open/High/Low/Close/Volume, as float prices and UTC dates sorted by date
+    if df is None or len(df) == 0:
+        return pd.DataFrame(columns=["Date"] + OHLCV_COLUMNS)
+
+    if column_map is not None:
+        if not set(column_map).issubset(df.columns):
+            df = df.reset_index()
+        missing = set(column_map) - set(df.columns)
+        if missing:
+            raise Exception("Provider data is missing columns {}".format(sorted(missing)))
+        df = df[list(column_map)].rename(columns=column_map)
+
+    missing = set(["Date"] + OHLCV_COLUMNS) - set(df.columns)
+    if missing:
+        raise Exception("Provider data is missing columns {}".format(sorted(missing)))
+
+    df = df[["Date"] + OHLCV_COLUMNS].astype({col: float for col in OHLCV_COLUMNS})
+    df["Date"] = pd.to_datetime(df["Date"], utc=True)
+    return df.sort_values("Date", ignore_index=True)
+
+
+class Provider:
+    # A source of daily bars. fetch(symbol, start, end) returns the bars between the two dates (inclusive) as a
+    # normalized Date/Open/High/Low/Close/Volume frame. fetch_many runs fetches on a bounded thread pool
+
+    max_workers = DEFAULT_MAX_WORKERS
+
+    def fetch(self, symbol, start, end):
+        raise NotImplementedError
+
+    def fetch_many(self, ranges, max_workers=None):
+        """
+        Fetches every (symbol, start, end) in ranges concurrently, at most max_workers at a time.
+        Yields ((symbol, start, end), df, error) as each one finishes; a failed fetch yields its exception instead of bars.
+        """
+        with ThreadPoolExecutor(max_workers=max_workers or self.max_workers) as pool:
+            futures = {pool.submit(self.fetch, *fetch_range): fetch_range for fetch_range in ranges}
+            for future in as_completed(futures):
+                try:
+                    yield futures[future], future.result(), None
+                except Exception as e:
+                    yield futures[future], None, e
+
+    def close(self):
+        pass
+
+
+class TiingoProvider(Provider):
+    def __init__(self, api_key, session=None, retries=3, backoff=0.5, timeout=DEFAULT_TIMEOUT):
+        if not api_key:
+            raise Exception("TiingoProvider requires an api_key")
+        self.api_key = api_key
+        self.session = session or make_session()
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+    def _get(self, symbol, start, end):
+        response = self.session.get(
+            TIINGO_DAILY_URL.format(symbol.lower()),
+            params={"startDate": start.strftime("%Y-%m-%d"), "endDate": end.strftime("%Y-%m-%d"), "format": "json"},
+            headers={"Authorization": "Token {}".format(self.api_key), "Content-Type": "application/json"},
+            timeout=self.timeout,
+        )
+        if response.status_code == 429 or response.status_code >= 500:
+            raise RetryableError("Tiingo returned {} for {}".format(response.status_code, symbol))
+        if response.status_code != 200:
+            raise Exception("Tiingo returned {} for {}: {}".format(response.status_code, symbol, response.text[:200]))
+        return response.json()
+
+    def fetch(self, symbol, start, end):
+        rows = with_retries(lambda: self._get(symbol, start, end), self.retries, self.backoff)
+        return normalize(pd.DataFrame(rows), TIINGO_COLUMNS)
+
+    def close(self):
+        self.session.close()
+
+
+class YFinanceProvider(Provider):
+    # yfinance is only imported when this provider is used
+    max_workers = 4
+
+    def __init__(self, session=None, retries=3, backoff=0.5):
+        self.session = session or make_session()
+        self.retries = retries
+        self.backoff = backoff
+
+    def fetch(self, symbol, start, end):
+        import yfinance as yf
+
+        def download():
+            # yfinance's end date is exclusive
+            return yf.Ticker(symbol, session=self.session).history(
+                start=start.strftime("%Y-%m-%d"),
+                end=(end + timedelta(days=1)).strftime("%Y-%m-%d"),
+                interval="1d",
+                auto_adjust=True,
+                raise_errors=True,
+            )
+
+        df = with_retries(download, self.retries, self.backoff)
+        return normalize(df.rename_axis("Date").reset_index())
+
+    def close(self):
+        self.session.close()
+
+
+class LocalFileProvider(Provider):
+    # Bars from <directory>/<SYMBOL>.parquet or <directory>/<SYMBOL>.csv, with the Date/Open/High/Low/Close/Volume
+    # columns (any case). A stand-in for the network providers in tests and offline benchmarks. Files are read
+    # once and kept in memory
+
+    def __init__(self, directory):
+        if not os.path.isdir(directory):
+            raise Exception("LocalFileProvider directory {} does not exist".format(directory))
+        self.directory = directory
+        self._frames = {}
+        self._lock = threading.Lock()
+
+    def _path(self, symbol):
+        for ext in ("parquet", "csv"):
+            for name in (symbol.upper(), symbol.lower()):
+                path = os.path.join(self.directory, "{}.{}".format(name, ext))
+                if os.path.exists(path):
+                    return path
+        raise Exception("No local data for {} in {}".format(symbol, self.directory))
+
+    def _load(self, symbol):
+        path = self._path(symbol)
+        df = pd.read_parquet(path) if path.endswith(".parquet") else pd.read_csv(path)
+        df = df.rename(columns={col: col.capitalize() for col in df.columns})
+        return normalize(df)
+
+    def fetch(self, symbol, start, end):
+        symbol = symbol.upper()
+        with self._lock:
+            df = self._frames.get(symbol)
+        if df is None:
+            df = self._load(symbol)
+            with self._lock:
+                self._frames[symbol] = df
+
+        days = df["Date"].dt.tz_localize(None).dt.normalize()
+        return df[(days >= pd.Timestamp(start)) & (days <= pd.Timestamp(end))].reset_index(drop=True)
+
+
+def provider_from_name(name, api_key=None, data_dir=None):
+    if name == "tiingo":
+        return TiingoProvider(api_key)
+    if name == "yfinance":
+        return YFinanceProvider()
+    if name == "local":
+        return LocalFileProvider(data_dir)
+    raise Exception("Unknown provider {}, choose between tiingo, yfinance and local".format(name))
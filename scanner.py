@@ -0,0 +1,231 @@
+import argparse
+import os
+import signal
+import sys
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+import detect
+import stats
+import structs
+
+from providers import provider_from_name
+from store import OHLCVStore
+
+DEFAULT_DETECT_OPTIONS = {
+    "first_pt_must_be_pivot": True,
+    "last_pt_must_be_pivot": True,
+    "all_pts_must_be_pivots": True,
+    "trendline_must_include_global_maxmin_pt": False,
+    "min_points_required": 3,
+    "ignore_breakouts": True,
+}
+
+RESULT_COLUMNS = [
+    "symbol",
+    "trendtype",
+    "id",
+    "score",
+    "num_points",
+    "slope",
+    "price_at_last_date",
+    "price_at_next_future_date",
+    "starts_at_date",
+    "ends_at_date",
+    "is_best_from_duplicate_group",
+    "last_close",
+]
+
+
+class SymbolTimeout(Exception):
+    pass
+
+
+def _raise_timeout(signum, frame):
+    raise SymbolTimeout()
+
+
+def df_to_arrays(df):
+    # Compact, picklable representation of a candles frame: int64 epoch ns dates and float64 OHLC arrays
+    return (
+        pd.DatetimeIndex(df["Date"]).tz_localize(None).asi8,
+        df["Open"].to_numpy(dtype=np.float64),
+        df["High"].to_numpy(dtype=np.float64),
+        df["Low"].to_numpy(dtype=np.float64),
+        df["Close"].to_numpy(dtype=np.float64),
+    )
+
+
+def arrays_to_candlestick_data(arrays, time_interval="1d"):
+    # Candles straight over the arrays df_to_arrays made, without building a frame. Their dates are tz-naive
+    return structs.CandlestickData.from_arrays(
+        *(np.ascontiguousarray(values) for values in arrays), time_interval=time_interval, tz=None
+    )
+
+
+def scan_symbol(symbol, arrays, options=DEFAULT_DETECT_OPTIONS, timeout=None, time_interval="1d"):
+    # Runs in a worker process. SIGALRM bounds the time spent on a single symbol
+    if timeout:
+        signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        candlestick_data = arrays_to_candlestick_data(arrays, time_interval)
+        # Sequential sides: the pool already uses every core, and SIGALRM only interrupts this thread
+        results = detect.detect(
+            candlestick_data=candlestick_data, trend_type=structs.TrendlineTypes.BOTH, parallel=False, **options
+        )
+    finally:
+        if timeout:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+    last_close = float(arrays[4][-1])
+    rows = []
+    for key in ("support_trendlines", "resistance_trendlines"):
+        trends = results[key]
+        active = trends[~trends["is_breakout"].astype(bool)]
+        for row in active.itertuples(index=False):
+            rows.append(
+                (
+                    symbol,
+                    row.trendtype,
+                    row.id,
+                    row.score,
+                    row.num_points,
+                    row.slope,
+                    row.price_at_last_date,
+                    row.price_at_next_future_date,
+                    row.starts_at_date,
+                    row.ends_at_date,
+                    row.is_best_from_duplicate_group,
+                    last_close,
+                )
+            )
+    return rows
+
+
+def _collect(futures, wait_for_all):
+    # Yields the finished futures (or all of them, as they finish, if wait_for_all) and forgets them
+    finished = as_completed(list(futures)) if wait_for_all else [f for f in list(futures) if f.done()]
+    for future in finished:
+        symbol = futures.pop(future)
+        try:
+            yield symbol, future.result(), None
+        except SymbolTimeout:
+            yield symbol, [], "timed out"
+        except Exception as e:
+            yield symbol, [], "detection failed: {}".format(e)
+
+
+def _load_frames(symbols, load):
+    for symbol in symbols:
+        try:
+            yield symbol, load(symbol), None
+        except Exception as e:
+            yield symbol, None, e
+
+
+def scan(symbols, load, options=DEFAULT_DETECT_OPTIONS, timeout=30, max_workers=None, time_interval="1d"):
+    """
+    Detects trendlines for every symbol on a process pool. load(symbol) returns the candles DataFrame
+    for a symbol and runs in this process, overlapping with detection in the workers.
+    Yields (symbol, rows, error) as each symbol finishes; a failing symbol yields its error instead of rows.
+    """
+    yield from scan_frames(_load_frames(symbols, load), options, timeout, max_workers, time_interval)
+
+
+def scan_frames(frames, options=DEFAULT_DETECT_OPTIONS, timeout=30, max_workers=None, time_interval="1d"):
+    # Same as scan, for an iterable of (symbol, df, load_error) such as OHLCVStore.get_many, whose concurrent
+    # fetches then overlap with detection
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as pool:
+        futures = {}
+        for symbol, df, error in frames:
+            try:
+                if error is not None:
+                    raise error
+                if df is None or len(df) < 3:
+                    raise Exception("not enough data")
+                arrays = df_to_arrays(df)
+            except Exception as e:
+                yield symbol, [], "load failed: {}".format(e)
+                continue
+            futures[pool.submit(scan_symbol, symbol, arrays, options, timeout, time_interval)] = symbol
+            yield from _collect(futures, wait_for_all=False)
+
+        yield from _collect(futures, wait_for_all=True)
+
+
+def rank_results(rows):
+    table = pd.DataFrame(rows, columns=RESULT_COLUMNS)
+    return table.sort_values(by="score", ascending=False, ignore_index=True)
+
+
+def read_watchlist(path):
+    with open(path) as infile:
+        symbols = [line.split("#")[0].strip().upper() for line in infile]
+    return [symbol for symbol in symbols if symbol]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scan a watchlist for active trendlines, ranked by score")
+    parser.add_argument("watchlist", help="file with one symbol per line")
+    parser.add_argument("--period", type=int, default=252, help="number of days to look back")
+    parser.add_argument("--output", default="-", help="CSV file for the ranked table (default: stdout)")
+    parser.add_argument("--timeout", type=float, default=30, help="max seconds of detection per symbol")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--min-points", type=int, default=DEFAULT_DETECT_OPTIONS["min_points_required"])
+    parser.add_argument("--store", default=None, help="path of the local OHLCV store")
+    parser.add_argument("--provider", choices=["tiingo", "yfinance", "local"], default="tiingo")
+    parser.add_argument(
+        "--data-dir", default=None, help="directory of <SYMBOL>.csv/.parquet files for --provider local"
+    )
+    parser.add_argument("--fetch-workers", type=int, default=None, help="concurrent downloads")
+    parser.add_argument("--metrics", default=None, help="CSV file for CAGR/Sharpe/drawdown/beta of every symbol")
+    args = parser.parse_args(argv)
+
+    api_key = os.environ.get("TIINGO_API_KEY")
+    if args.provider == "tiingo" and not api_key:
+        parser.error("TIINGO_API_KEY must be set in the environment")
+    if args.provider == "local" and not args.data_dir:
+        parser.error("--data-dir is required with --provider local")
+
+    store_kwargs = {"path": args.store} if args.store else {}
+    ohlcv_store = OHLCVStore(provider=provider_from_name(args.provider, api_key, args.data_dir), **store_kwargs)
+    today = date.today()
+    start = today - timedelta(days=args.period)
+
+    options = dict(DEFAULT_DETECT_OPTIONS, min_points_required=args.min_points)
+    symbols = read_watchlist(args.watchlist)
+
+    rows = []
+    failed = 0
+    for done, (symbol, symbol_rows, error) in enumerate(
+        scan_frames(
+            ohlcv_store.get_many(symbols, start, today, args.fetch_workers), options, args.timeout, args.workers
+        ),
+        1,
+    ):
+        if error:
+            failed += 1
+            print("[{}/{}] {}: {}".format(done, len(symbols), symbol, error), file=sys.stderr)
+        else:
+            print(
+                "[{}/{}] {}: {} active trendlines".format(done, len(symbols), symbol, len(symbol_rows)), file=sys.stderr
+            )
+        rows.extend(symbol_rows)
+
+    table = rank_results(rows)
+    table.to_csv(sys.stdout if args.output == "-" else args.output, index=False)
+    print("Scanned {} symbols, {} failed".format(len(symbols), failed), file=sys.stderr)
+
+    if args.metrics:
+        # Bars are in the store by now, so this only reads them back (plus the benchmark)
+        metrics = stats.watchlist_metrics(ohlcv_store, symbols, start, today, args.fetch_workers)
+        metrics.rename_axis("symbol").to_csv(args.metrics)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+import hashlib
+import json
+
+import numpy as np
+
+import detect
+import structs
+
+FORMAT_VERSION = 1
+
+SIDES = {
+    structs.TrendlineTypes.SUPPORT: "support",
+    structs.TrendlineTypes.RESISTANCE: "resistance",
+}
+
+# Float columns are stored as they are, so decoding gives back the exact same values
+FLOAT_COLUMNS = ["m", "b", "slope", "price_at_last_date", "score"]
+
+
+def candles_key(candlestick_data):
+    # Hash of the candles' dates, prices and interval. Encoded results reference their candles by it
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update("{}|{}".format(candlestick_data.time_interval, candlestick_data.tz).encode())
+    for values in (
+        candlestick_data.timestamps,
+        candlestick_data.open,
+        candlestick_data.high,
+        candlestick_data.low,
+        candlestick_data.close,
+    ):
+        digest.update(np.ascontiguousarray(values).tobytes())
+    return digest.hexdigest()
+
+
+def _encode_side(trends, dates):
+    # Rows are stored in detection order (the frame's index), which _build_trends_df sorts by score again
+    n = len(trends)
+    if n and not np.array_equal(np.sort(trends.index.to_numpy()), np.arange(n)):
+        raise Exception("Trendlines must be the unmodified output of detect(...) to be encoded")
+    trends = trends.sort_index()
+
+    counts = trends["num_points"].to_numpy(dtype=np.int64) if n else np.empty(0, dtype=np.int64)
+    points = (
+        np.fromiter(
+            (i for pts in trends["pointset_indeces"] for i in pts),
+            dtype=np.int32,
+            count=int(counts.sum()),
+        )
+        if n
+        else np.empty(0, dtype=np.int32)
+    )
+    global_dates = trends["global_maxs_or_mins"].iloc[0] if n else []
+
+    encoded = {
+        "point_offsets": np.concatenate([[0], np.cumsum(counts)]).astype(np.int32),
+        "point_indices": points,
+        "global_indices": dates.get_indexer(global_dates).astype(np.int32),
+        "breakout_index": trends["breakout_index"].fillna(-1).to_numpy(dtype=np.int32),
+        "includes_global_max_or_min": trends["includes_global_max_or_min"].to_numpy(dtype=bool),
+        "duplicate_group_id": trends["duplicate_group_id"].to_numpy(dtype=np.int32),
+        "is_best_from_duplicate_group": trends["is_best_from_duplicate_group"].to_numpy(dtype=bool),
+        # 0 for the lines that are not the best of their group (None in the frame)
+        "overall_rank": trends["overall_rank"].fillna(0).to_numpy(dtype=np.int32),
+        "rank_within_group": trends["rank_within_group"].to_numpy(dtype=np.int32),
+    }
+    for col in FLOAT_COLUMNS:
+        encoded[col] = trends[col].to_numpy(dtype=np.float64)
+    if "num_candidates" in trends.attrs:
+        encoded["num_candidates"] = np.int64(trends.attrs["num_candidates"])
+    if "is_exhaustive" in trends.attrs:
+        encoded["is_exhaustive"] = np.bool_(trends.attrs["is_exhaustive"])
+    return encoded
+
+
+def _decode_side(encoded, dates, trend_type):
+    offsets = encoded["point_offsets"].astype(np.int64)
+    counts = np.diff(offsets)
+    breakout_index = encoded["breakout_index"].astype(np.int64)
+    overall_rank = encoded["overall_rank"].astype(object)
+    overall_rank[overall_rank == 0] = None
+
+    trends = {col: encoded[col] for col in FLOAT_COLUMNS}
+    trends.update(
+        {
+            "breakout_index": breakout_index,
+            "is_breakout": breakout_index >= 0,
+            "includes_global_max_or_min": encoded["includes_global_max_or_min"],
+            "duplicate_group_id": encoded["duplicate_group_id"].astype(np.int64),
+            "is_best_from_duplicate_group": encoded["is_best_from_duplicate_group"],
+            "overall_rank": overall_rank,
+            "rank_within_group": encoded["rank_within_group"].astype(np.int64),
+        }
+    )
+    trends_df = detect._build_trends_df(
+        trends,
+        counts,
+        encoded["point_indices"].astype(np.int64),
+        dates,
+        trend_type,
+        dates[encoded["global_indices"]].tolist(),
+    )
+    if "num_candidates" in encoded:
+        trends_df.attrs["num_candidates"] = int(encoded["num_candidates"])
+    if "is_exhaustive" in encoded:
+        trends_df.attrs["is_exhaustive"] = bool(encoded["is_exhaustive"])
+    return trends_df
+
+
+def encode(results):
+    """
+    Encodes a detect(...) output as a flat dict of NumPy arrays: per side, the points of every line as one
+    int32 array plus offsets, float64 m/b/slope/price/score columns, int32 breakout/group/rank columns and
+    the sorted pivots. The candles are not included, only their candles_key; decode needs them back.
+    """
+    candlestick_data = results["candlestick_data"]
+    dates = candlestick_data.dates
+    encoded = {
+        "version": np.int32(FORMAT_VERSION),
+        "trend_type": np.str_(results["trend_type"]),
+        "candles_key": np.str_(candles_key(candlestick_data)),
+    }
+    for trend_type, side in SIDES.items():
+        if "{}_trendlines".format(side) not in results:
+            continue
+        for name, values in _encode_side(results["{}_trendlines".format(side)], dates).items():
+            encoded["{}.{}".format(side, name)] = values
+        encoded["{}.pivots".format(side)] = np.array(sorted(results["{}_pivots".format(side)]), dtype=np.int32)
+    if "is_exhaustive" in results:
+        encoded["is_exhaustive"] = np.bool_(results["is_exhaustive"])
+    return encoded
+
+
+def decode(encoded, candlestick_data):
+    # Rebuilds the detect(...) output dict. candlestick_data must be the candles the results were detected on
+    if int(encoded["version"]) != FORMAT_VERSION:
+        raise Exception("Unsupported encoding version {}".format(int(encoded["version"])))
+    if str(encoded["candles_key"]) != candles_key(candlestick_data):
+        raise Exception("candlestick_data does not match the candles the results were detected on")
+
+    dates = candlestick_data.dates
+    results = {"trend_type": str(encoded["trend_type"]), "candlestick_data": candlestick_data}
+    for trend_type, side in SIDES.items():
+        prefix = "{}.".format(side)
+        if prefix + "pivots" not in encoded:
+            continue
+        side_encoded = {key[len(prefix) :]: value for key, value in encoded.items() if key.startswith(prefix)}
+        results["{}_trendlines".format(side)] = _decode_side(side_encoded, dates, trend_type)
+        results["{}_pivots".format(side)] = set(side_encoded["pivots"].tolist())
+    if "is_exhaustive" in encoded:
+        results["is_exhaustive"] = bool(encoded["is_exhaustive"])
+    return results
+
+
+def dumps(encoded):
+    """
+    Packs an encoded result into bytes: a 4-byte header length, a JSON header with the dtype, shape and
+    offset of every array, then the arrays' raw bytes back to back (8-byte aligned).
+    """
+    header = {}
+    chunks = []
+    offset = 0
+    for name, value in encoded.items():
+        value = np.asarray(value)
+        header[name] = [value.dtype.str, list(value.shape), offset]
+        chunks.append(value.tobytes())
+        padding = -len(chunks[-1]) % 8
+        chunks.append(b"\0" * padding)
+        offset += len(chunks[-2]) + padding
+    header_bytes = json.dumps(header, separators=(",", ":")).encode()
+    header_bytes += b" " * (-(len(header_bytes) + 4) % 8)
+    return b"".join([len(header_bytes).to_bytes(4, "little"), header_bytes] + chunks)
+
+
+def loads(data):
+    # Arrays are read-only views into data, nothing is copied
+    header_length = int.from_bytes(data[:4], "little")
+    header = json.loads(data[4 : 4 + header_length])
+    base = 4 + header_length
+    encoded = {}
+    for name, (dtype, shape, offset) in header.items():
+        dtype = np.dtype(dtype)
+        count = int(np.prod(shape, dtype=np.int64))
+        value = np.frombuffer(data, dtype=dtype, count=count, offset=base + offset).reshape(shape)
+        encoded[name] = value[()] if value.ndim == 0 else value
+    return encoded
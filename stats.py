@@ -0,0 +1,131 @@
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from cache import ResultCache
+
+BENCHMARK_SYMBOL = "SPY"
+
+# One benchmark download covers every period the app offers; shorter windows are slices of it
+BENCHMARK_HISTORY_DAYS = 5 * 365
+
+PERIODS_PER_YEAR = 252
+
+CORE_METRICS = ["CAGR", "Sharpe", "Sortino", "Max Drawdown", "Volatility (ann.)", "Beta", "Alpha"]
+PERCENT_METRICS = ["CAGR", "Max Drawdown", "Volatility (ann.)"]
+
+_benchmark_cache = ResultCache(max_bytes=16 * 2**20, ttl=24 * 3600)
+
+
+def last_trading_day(now=None):
+    # Date of the last regular session that has closed in New York (holidays are not accounted for)
+    now = pd.Timestamp.now(tz="America/New_York") if now is None else now.tz_convert("America/New_York")
+    day = now.normalize()
+    if now < day + pd.Timedelta(hours=16):
+        day -= pd.Timedelta(days=1)
+    while day.weekday() >= 5:
+        day -= pd.Timedelta(days=1)
+    return day.date()
+
+
+def close_returns(df):
+    # Daily simple returns of the Close column of a candles frame, indexed by tz-naive date. The store returns
+    # an empty frame without columns when it has no bars, which gives no returns
+    if "Close" not in df:
+        return pd.Series(dtype=np.float64, index=pd.DatetimeIndex([]))
+    close = pd.Series(df["Close"].to_numpy(dtype=np.float64), index=pd.DatetimeIndex(df["Date"]).tz_localize(None))
+    return close.pct_change().iloc[1:]
+
+
+def benchmark_returns(store, start, end=None, symbol=BENCHMARK_SYMBOL):
+    """
+    Returns of the benchmark between start and end. The series is fetched once per trading day and shared by
+    every caller in the process, concurrent first requests included.
+    """
+    day = last_trading_day()
+    key = (symbol, day)
+    returns = _benchmark_cache.get_or_compute(
+        key, lambda: close_returns(store.get(symbol, day - timedelta(days=BENCHMARK_HISTORY_DAYS), day))
+    )
+    return returns[pd.Timestamp(start) : pd.Timestamp(end or day)]
+
+
+def core_metrics(returns, benchmark=None, periods=PERIODS_PER_YEAR):
+    """
+    Core performance metrics of every column of returns (a dates x symbols frame of simple returns, NaN where a
+    symbol has no bar) in one vectorized pass. The definitions follow quantstats' metrics(mode="full") so the
+    two modes agree. Returns a symbols x CORE_METRICS frame, with fractions (not percents).
+    """
+    if isinstance(returns, pd.Series):
+        returns = returns.to_frame()
+
+    values = returns.to_numpy(dtype=np.float64)
+    valid = ~np.isnan(values)
+    count = valid.sum(axis=0)
+    r = np.where(valid, values, 0.0)
+
+    mean = r.sum(axis=0) / count
+    centered = np.where(valid, r - mean, 0.0)
+    std = np.sqrt((centered**2).sum(axis=0) / (count - 1))
+
+    # quantstats measures years as calendar days / periods
+    dates = returns.index.to_numpy(dtype="datetime64[D]")
+    positions = np.arange(len(dates))[:, None]
+    first = np.where(valid, positions, len(dates)).min(axis=0)
+    last = np.where(valid, positions, -1).max(axis=0)
+    years = (dates[np.maximum(last, 0)] - dates[np.minimum(first, len(dates) - 1)]).astype(np.float64) / periods
+
+    growth = np.cumprod(1.0 + r, axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cagr = np.abs(growth[-1]) ** (1.0 / years) - 1.0
+        downside = np.sqrt((np.minimum(r, 0.0) ** 2).sum(axis=0) / count)
+        metrics = {
+            "CAGR": cagr,
+            "Sharpe": mean / std * np.sqrt(periods),
+            "Sortino": mean / downside * np.sqrt(periods),
+            "Max Drawdown": (growth / np.maximum.accumulate(growth, axis=0)).min(axis=0) - 1.0,
+            "Volatility (ann.)": std * np.sqrt(periods),
+        }
+
+        if benchmark is not None:
+            b = benchmark.reindex(returns.index).fillna(0.0).to_numpy(dtype=np.float64)[:, None]
+            b = np.where(valid, b, 0.0)
+            b_mean = b.sum(axis=0) / count
+            b_centered = np.where(valid, b - b_mean, 0.0)
+            beta = (centered * b_centered).sum(axis=0) / (b_centered**2).sum(axis=0)
+            metrics["Beta"] = beta
+            metrics["Alpha"] = (mean - beta * b_mean) * periods
+        else:
+            metrics["Beta"] = np.full(len(count), np.nan)
+            metrics["Alpha"] = np.full(len(count), np.nan)
+
+    return pd.DataFrame(metrics, index=returns.columns, columns=CORE_METRICS)
+
+
+def metrics_table(returns, benchmark, strategy_title="Strategy", benchmark_title="Benchmark"):
+    # Strategy/Benchmark table of the core metrics for display, percents as in quantstats' report
+    table = core_metrics(pd.DataFrame({strategy_title: returns, benchmark_title: benchmark}), benchmark)
+    table.loc[benchmark_title, ["Beta", "Alpha"]] = np.nan
+    table[PERCENT_METRICS] *= 100
+    table = table.rename(columns={col: col + " %" for col in PERCENT_METRICS}).T.round(2)
+    return table.astype(object).where(table.notna(), "-")
+
+
+def watchlist_metrics(store, symbols, start, end, max_workers=None):
+    """
+    Core metrics of every symbol of a watchlist against the benchmark, with the bars of all symbols fetched
+    concurrently and the metrics computed in one pass. Symbols that fail to load are left out.
+    """
+    closes = {}
+    for symbol, df, error in store.get_many(symbols, start, end, max_workers):
+        if error is None and df is not None and len(df) > 2:
+            closes[symbol] = pd.Series(df["Close"].to_numpy(), index=pd.DatetimeIndex(df["Date"]).tz_localize(None))
+
+    if not closes:
+        return pd.DataFrame(columns=CORE_METRICS)
+
+    order = [symbol for symbol in dict.fromkeys(symbol.upper() for symbol in symbols) if symbol in closes]
+    panel = pd.DataFrame(closes)[order]
+    returns = panel.pct_change(fill_method=None).iloc[1:]
+    return core_metrics(returns, benchmark_returns(store, start, end))
@@ -0,0 +1,157 @@
+import os
+import sqlite3
+import threading
+
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from providers import OHLCV_COLUMNS
+
+DEFAULT_STORE_PATH = os.environ.get(
+    "PIVOT_PEAK_STORE", os.path.join(os.path.expanduser("~"), ".cache", "pivot-peak", "ohlcv.sqlite")
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS bars (
+    symbol TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    open REAL NOT NULL,
+    high REAL NOT NULL,
+    low REAL NOT NULL,
+    close REAL NOT NULL,
+    volume REAL,
+    PRIMARY KEY (symbol, ts)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS coverage (
+    symbol TEXT PRIMARY KEY,
+    first_date TEXT NOT NULL,
+    last_date TEXT NOT NULL
+);
+"""
+
+
+def _epoch_seconds(day):
+    return int(pd.Timestamp(day).tz_localize(None).normalize().tz_localize("UTC").timestamp())
+
+
+class OHLCVStore:
+    # Local SQLite copy of daily bars, keyed by symbol. Bars are rows of a WITHOUT ROWID table clustered on
+    # (symbol, ts), so reading a window for one symbol is a single contiguous range scan.
+    #
+    # Only the date ranges not already covered locally are fetched from the provider (see providers.py). Fetches
+    # run outside the connection lock, so one session waiting on the network does not block reads from others.
+
+    def __init__(self, path=DEFAULT_STORE_PATH, provider=None):
+        if provider is None:
+            raise Exception("OHLCVStore requires a provider")
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        self.path = path
+        self.provider = provider
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def get(self, symbol, start, end):
+        symbol = symbol.upper()
+        with self._lock:
+            missing = self._missing_ranges(symbol, start, end)
+        fetched = [(fetch_range, self.provider.fetch(*fetch_range)) for fetch_range in missing]
+        with self._lock:
+            for (_, missing_start, missing_end), bars in fetched:
+                self.write(symbol, bars, missing_start, missing_end)
+            return self.read(symbol, start, end)
+
+    def get_many(self, symbols, start, end, max_workers=None):
+        """
+        Bars for several symbols over the same dates, fetching the missing ranges of all of them concurrently
+        on the provider's bounded pool. Yields (symbol, df, error) as each symbol becomes available.
+        """
+        symbols = list(dict.fromkeys(symbol.upper() for symbol in symbols))
+        with self._lock:
+            missing = {symbol: self._missing_ranges(symbol, start, end) for symbol in symbols}
+
+        pending = {symbol: len(ranges) for symbol, ranges in missing.items()}
+        for symbol in [symbol for symbol, count in pending.items() if count == 0]:
+            del pending[symbol]
+            with self._lock:
+                df = self.read(symbol, start, end)
+            yield symbol, df, None
+
+        fetch_ranges = [fetch_range for ranges in missing.values() for fetch_range in ranges]
+        failed = set()
+        for (symbol, missing_start, missing_end), bars, error in self.provider.fetch_many(fetch_ranges, max_workers):
+            if symbol in failed:
+                continue
+            if error is not None:
+                failed.add(symbol)
+                yield symbol, None, error
+                continue
+            with self._lock:
+                self.write(symbol, bars, missing_start, missing_end)
+                pending[symbol] -= 1
+                df = self.read(symbol, start, end) if pending[symbol] == 0 else None
+            if df is not None:
+                yield symbol, df, None
+
+    def _coverage(self, symbol):
+        row = self._conn.execute("SELECT first_date, last_date FROM coverage WHERE symbol = ?", (symbol,)).fetchone()
+        if row is None:
+            return None
+        return pd.Timestamp(row[0]).date(), pd.Timestamp(row[1]).date()
+
+    def _missing_ranges(self, symbol, start, end):
+        coverage = self._coverage(symbol)
+        if coverage is None:
+            return [(symbol, start, end)]
+
+        first_date, last_date = coverage
+        missing = []
+        if start < first_date:
+            missing.append((symbol, start, first_date - timedelta(days=1)))
+        if end > last_date:
+            # Re-fetch the last covered day too, its bar may have been written before the session closed
+            missing.append((symbol, last_date, end))
+        return missing
+
+    def write(self, symbol, bars, start, end):
+        if len(bars):
+            ts = bars["Date"].to_numpy(dtype="datetime64[s]").astype(np.int64)
+            rows = zip(
+                [symbol] * len(bars),
+                ts.tolist(),
+                *(bars[col].to_numpy(dtype=np.float64).tolist() for col in OHLCV_COLUMNS),
+            )
+            self._conn.executemany("INSERT OR REPLACE INTO bars VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+        coverage = self._coverage(symbol)
+        if coverage is not None:
+            start, end = min(start, coverage[0]), max(end, coverage[1])
+        self._conn.execute(
+            "INSERT OR REPLACE INTO coverage VALUES (?, ?, ?)", (symbol, start.isoformat(), end.isoformat())
+        )
+        self._conn.commit()
+
+    def read(self, symbol, start, end):
+        query = (
+            "SELECT ts, open, high, low, close, volume FROM bars WHERE symbol = ? AND ts >= ? AND ts < ? ORDER BY ts"
+        )
+        rows = self._conn.execute(
+            query, (symbol, _epoch_seconds(start), _epoch_seconds(end + timedelta(days=1)))
+        ).fetchall()
+        if not rows:
+            return pd.DataFrame()
+
+        values = np.array(rows, dtype=np.float64)
+        df = pd.DataFrame(values[:, 1:], columns=OHLCV_COLUMNS)
+        df.insert(0, "Date", pd.to_datetime(values[:, 0].astype(np.int64), unit="s", utc=True))
+        df["Symbol"] = symbol
+        return df
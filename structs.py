@@ -1,8 +1,18 @@
+import numpy as np
+import pandas as pd
+
 from pandas.api.types import is_datetime64_any_dtype as is_datetime
 
 VALID_TIME_INTERVALS = ["1m", "3m", "5m", "10m", "15m", "30m", "1h", "1d"]
 
 
+def _readonly(values):
+    # Views share memory with the caller's frame, make sure nothing here writes through them
+    values = values.view()
+    values.flags.writeable = False
+    return values
+
+
 class TrendlineTypes(object):
     RESISTANCE = "RESISTANCE"
     SUPPORT = "SUPPORT"
@@ -10,6 +20,28 @@ class TrendlineTypes(object):
 
 
 class CandlestickData:
+    # Candles as contiguous float64 open/high/low/close arrays and an int64 array of epoch nanoseconds (UTC).
+    # The arrays are read-only views over the caller's columns whenever those are already float64 and
+    # contiguous, so the caller must not modify the frame in place while the candles are in use. The df
+    # property builds a Date/Open/High/Low/Close DataFrame with a RangeIndex the first time it is asked for, as a
+    # read-only view over these arrays: one block per column, so nothing is copied.
+
+    __slots__ = (
+        "open",
+        "high",
+        "low",
+        "close",
+        "timestamps",
+        "tz",
+        "time_interval",
+        "open_col",
+        "high_col",
+        "low_col",
+        "close_col",
+        "datetime_col",
+        "_df",
+    )
+
     def __init__(
         self,
         df=None,
@@ -33,13 +65,17 @@ class CandlestickData:
             )
 
         # Price column names provided exist and are in correct format
-        for col_name in [open_col, high_col, low_col, close_col]:
+        price_cols = [open_col, high_col, low_col, close_col]
+        for col_name in price_cols:
             if col_name not in df.columns:
                 raise Exception("CandlestickData constructor param df does not contain column '{}'".format(col_name))
-            if df[col_name].dtypes != float:
-                raise Exception(
-                    "CandlestickData constructor param df requires that column '{}' is of type float".format(col_name)
+        not_float = df.dtypes[price_cols] != float
+        if not_float.any():
+            raise Exception(
+                "CandlestickData constructor param df requires that column '{}' is of type float".format(
+                    not_float.idxmax()
                 )
+            )
 
         # Datetime column provide exists and is of type datetime (or index is of type datetime if arg is None)
         if datetime_col is None:
@@ -61,25 +97,14 @@ class CandlestickData:
                 )
 
         # Instantiate
-        self.df = df.copy(deep=True)
-
-        self.df = self.df.rename(
-            columns={
-                open_col: "Open",
-                high_col: "High",
-                low_col: "Low",
-                close_col: "Close",
-            }
-        )
-
-        # Force index to be monotinically increasing int
-        if datetime_col is None:
-            self.df.set_index(datetime_col)
-            self.df = self.df.rename(columns={"index": "Date"})
-        else:
-            self.df.rename(columns={datetime_col: "Date"})
-
-        self.df.reset_index()
+        dates = df.index if datetime_col is None else df[datetime_col]
+        self.timestamps = _readonly(np.asarray(dates.array.asi8))
+        self.tz = getattr(dates.dtype, "tz", None)
+        self.open = _readonly(np.ascontiguousarray(df[open_col].to_numpy(dtype=np.float64)))
+        self.high = _readonly(np.ascontiguousarray(df[high_col].to_numpy(dtype=np.float64)))
+        self.low = _readonly(np.ascontiguousarray(df[low_col].to_numpy(dtype=np.float64)))
+        self.close = _readonly(np.ascontiguousarray(df[close_col].to_numpy(dtype=np.float64)))
+        self._df = None
 
         self.time_interval = time_interval
         self.open_col = open_col
@@ -88,10 +113,65 @@ class CandlestickData:
         self.close_col = close_col
         self.datetime_col = datetime_col
 
+    @classmethod
+    def from_arrays(cls, timestamps, open, high, low, close, time_interval="1m", tz=None):
+        """
+        Candles over existing arrays without a DataFrame and without copying: timestamps as int64 epoch
+        nanoseconds (UTC), prices as contiguous float64 arrays, e.g. slices of memory-mapped columns. tz only
+        sets how dates are presented.
+        """
+        if time_interval not in VALID_TIME_INTERVALS:
+            raise Exception(
+                "CandlestickData constructor param time_interval must be one of :\n{}".format(VALID_TIME_INTERVALS)
+            )
+        arrays = {"timestamps": timestamps, "open": open, "high": high, "low": low, "close": close}
+        if len(timestamps) < 3:
+            raise Exception(
+                "CandlestickData.from_arrays requires at least three candles, received {}".format(len(timestamps))
+            )
+        for name, values in arrays.items():
+            dtype = np.int64 if name == "timestamps" else np.float64
+            if values.dtype != dtype or len(values) != len(timestamps) or not values.flags.c_contiguous:
+                raise Exception(
+                    "CandlestickData.from_arrays param {} must be a contiguous {} array of {} values".format(
+                        name, np.dtype(dtype).name, len(timestamps)
+                    )
+                )
+
+        candles = cls.__new__(cls)
+        for name, values in arrays.items():
+            setattr(candles, name, _readonly(np.asarray(values)))
+        candles.tz = tz
+        candles.time_interval = time_interval
+        candles.open_col, candles.high_col, candles.low_col, candles.close_col = "Open", "High", "Low", "Close"
+        candles.datetime_col = "Date"
+        candles._df = None
+        return candles
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @property
+    def dates(self):
+        # DatetimeIndex over the timestamps array, in the caller's timezone
+        values = self.timestamps.view("datetime64[ns]")
+        dtype = pd.DatetimeTZDtype(tz=self.tz) if self.tz is not None else values.dtype
+        return pd.DatetimeIndex(pd.arrays.DatetimeArray(values, dtype=dtype, copy=False), copy=False)
+
+    @property
+    def df(self):
+        if self._df is None:
+            # copy=False keeps the columns as separate blocks over the arrays instead of consolidating the prices
+            self._df = pd.DataFrame(
+                {"Date": self.dates, "Open": self.open, "High": self.high, "Low": self.low, "Close": self.close},
+                copy=False,
+            )
+        return self._df
+
     def time_interval_min(self):
         if "m" in self.time_interval:
             return int(self.time_interval[:-1])
         elif "h" in self.time_interval:
-            return int(self.time_interval[:-1] * 60)
+            return int(self.time_interval[:-1]) * 60
         elif "d" in self.time_interval:
-            return int(self.time_interval[:-1] * 60 * 24)
+            return int(self.time_interval[:-1]) * 60 * 24
@@ -0,0 +1,191 @@
+import itertools
+
+from collections import namedtuple
+
+import numpy as np
+
+import detect
+import structs
+
+# One combination of detection options, the key of sweep(...) results. _asdict() gives detect(...) kwargs
+OptionSet = namedtuple(
+    "OptionSet",
+    [
+        "first_pt_must_be_pivot",
+        "last_pt_must_be_pivot",
+        "all_pts_must_be_pivots",
+        "trendline_must_include_global_maxmin_pt",
+        "min_points_required",
+    ],
+)
+
+# Which candles may be points of a line: any, only pivots past the second anchor, or only pivots
+_ANY, _PIVOTS_PAST_END, _PIVOTS = range(3)
+
+
+def option_grid(min_points_required=(3,)):
+    # Every combination of the four option checkboxes, for each min_points_required value
+    return [
+        OptionSet(*flags, min_points)
+        for min_points in min_points_required
+        for flags in itertools.product((False, True), repeat=4)
+    ]
+
+
+def _point_mode(option_set):
+    if option_set.all_pts_must_be_pivots:
+        return _PIVOTS
+    if option_set.last_pt_must_be_pivot:
+        return _PIVOTS_PAST_END
+    return _ANY
+
+
+def _sweep_side(candlestick_data, tt, option_sets, scan_from_date, ignore_breakouts, config):
+    """
+    Detects one side for every option set with one pass over the candidate lines. Pivots, slope limits and
+    the deviation and breakout test of each candidate are computed once, for the union of the candidates the
+    option sets need (all anchor pairs unless every set requires pivot anchors). Each option set then only
+    filters that table: its anchors, which candles count as points (three variants, computed once each) and
+    min_points_required. Candidates are visited in the same order as detect, so every result is exactly what
+    detect(...) gives for that option set.
+    """
+    thresholds = {
+        key: detect._config_value(config, key, candlestick_data)
+        for key in ("max_allowable_error_pt_to_trend", "breakout_tolerance")
+    }
+    min_slope, max_slope, min_last_price, max_last_price = detect._line_limits(candlestick_data, tt, config)
+
+    prices = detect._price_series(candlestick_data, tt)
+    n = len(prices)
+    last_index = n - 1
+    avg_range = detect.avg_candle_range(candlestick_data)
+
+    scan_from_index = detect._scan_from_index(candlestick_data, scan_from_date)
+    pivots = detect.get_pivots(candlestick_data, tt, scan_from_index, config)
+    is_pivot = np.zeros(n, dtype=bool)
+    is_pivot[list(pivots)] = True
+    is_global = detect._global_mask(prices, tt, scan_from_index, avg_range)
+
+    start_pivot = np.array([o.first_pt_must_be_pivot or o.all_pts_must_be_pivots for o in option_sets])
+    end_pivot = np.array([o.last_pt_must_be_pivot or o.all_pts_must_be_pivots for o in option_sets])
+    modes = np.array([_point_mode(o) for o in option_sets])
+    min_points = np.array([o.min_points_required for o in option_sets])
+    start_mask, end_mask, _ = detect._anchor_masks(is_pivot, scan_from_index, start_pivot.all(), end_pivot.all(), False)
+    everything = np.ones(n, dtype=bool)
+
+    chunk = max(1, detect.CANDIDATE_CHUNK_CELLS // n)
+    num_candidates = np.zeros(len(option_sets), dtype=np.int64)
+    kept = [{"m": [], "b": [], "breakout_index": [], "err_sum": [], "points": []} for _ in option_sets]
+    for ii, jj in detect._candidate_pair_blocks(np.flatnonzero(start_mask), np.flatnonzero(end_mask)):
+        m = (prices[jj] - prices[ii]) / (jj - ii)
+        b = prices[ii] - m * ii
+
+        slope = m * avg_range
+        price_at_last = m * last_index + b
+        allowed = (
+            (slope <= max_slope)
+            & (slope >= min_slope)
+            & (price_at_last <= max_last_price)
+            & (price_at_last >= min_last_price)
+        )
+        ii, jj, m, b = ii[allowed], jj[allowed], m[allowed], b[allowed]
+
+        for start in range(0, len(ii), chunk):
+            sl = slice(start, start + chunk)
+            # Candidates of each option set: their anchors must be pivots where the set requires it
+            anchors_ok = (~start_pivot[:, None] | is_pivot[None, ii[sl]]) & (
+                ~end_pivot[:, None] | is_pivot[None, jj[sl]]
+            )
+            num_candidates += anchors_ok.sum(axis=1)
+
+            tested = detect._breakout_test(prices, ii[sl], jj[sl], m[sl], b[sl], tt, thresholds, ignore_breakouts)
+            rows = tested["rows"]
+            for mode in np.unique(modes):
+                on_line = detect._points_on_line(
+                    tested,
+                    jj[sl],
+                    is_pivot if mode == _PIVOTS else everything,
+                    is_pivot,
+                    mode == _PIVOTS_PAST_END,
+                    thresholds,
+                )
+                counts = on_line.sum(axis=1)
+                sets = np.flatnonzero(modes == mode)
+                qualifies = anchors_ok[sets][:, rows] & (counts[None, :] >= min_points[sets, None])
+
+                # Errors and point masks only for the rows some option set keeps
+                needed = np.flatnonzero(qualifies.any(axis=0))
+                on_line = on_line[needed]
+                err_sum = np.where(on_line, tested["abs_deviation"][needed], 0.0).sum(axis=1)
+                packed = detect._pack_points(on_line, tested["lo"], n)
+                for set_index, qualified in zip(sets, qualifies[:, needed]):
+                    chunk_rows = rows[needed[qualified]]
+                    kept[set_index]["m"].append(m[sl][chunk_rows])
+                    kept[set_index]["b"].append(b[sl][chunk_rows])
+                    kept[set_index]["breakout_index"].append(tested["breakout_index"][chunk_rows])
+                    kept[set_index]["err_sum"].append(err_sum[qualified])
+                    kept[set_index]["points"].append(packed[qualified])
+
+    trends = []
+    for option_set, set_kept, set_candidates in zip(option_sets, kept, num_candidates):
+        if set_kept["points"]:
+            set_kept = {key: np.concatenate(values) for key, values in set_kept.items()}
+        else:
+            set_kept = {key: np.empty(0) for key in set_kept}
+            set_kept["points"] = np.empty((0, (n + 7) // 8), dtype=np.uint8)
+            set_kept["breakout_index"] = np.empty(0, dtype=np.int64)
+
+        first = detect._unique_pointsets(set_kept["points"])
+        set_kept = {key: values[first] for key, values in set_kept.items()}
+        point_masks = np.unpackbits(set_kept.pop("points"), axis=1, count=n).astype(bool)
+        _, point_cols = np.nonzero(point_masks)
+
+        trends_df = detect._finalize_trends(
+            candlestick_data,
+            tt,
+            config,
+            set_kept,
+            point_masks.sum(axis=1),
+            point_cols,
+            is_global,
+            option_set.trendline_must_include_global_maxmin_pt,
+        )
+        trends_df.attrs["num_candidates"] = int(set_candidates)
+        trends_df.attrs["is_exhaustive"] = True
+        trends.append(trends_df)
+    return trends, pivots
+
+
+def sweep(
+    candlestick_data=None,
+    trend_type=None,
+    option_sets=None,
+    scan_from_date=None,
+    ignore_breakouts=True,
+    config=detect.DEFAULT_CONFIG,
+):
+    """
+    detect(...) for many option sets at once (OptionSets, default option_grid()), sharing pivots, candidate
+    lines and breakout tests between them. Returns {OptionSet: results}, each results dict as detect returns
+    it for those options.
+    """
+    detect._validate_inputs(candlestick_data, trend_type)
+    option_sets = list(dict.fromkeys(OptionSet(*o) for o in (option_sets or option_grid())))
+    for option_set in option_sets:
+        if option_set.min_points_required < 2:
+            raise Exception(
+                "min_points_required must be at least two, received {}".format(option_set.min_points_required)
+            )
+
+    results = {
+        option_set: {"trend_type": trend_type, "candlestick_data": candlestick_data, "is_exhaustive": True}
+        for option_set in option_sets
+    }
+    for tt, side in ((structs.TrendlineTypes.SUPPORT, "support"), (structs.TrendlineTypes.RESISTANCE, "resistance")):
+        if trend_type not in (structs.TrendlineTypes.BOTH, tt):
+            continue
+        trends, pivots = _sweep_side(candlestick_data, tt, option_sets, scan_from_date, ignore_breakouts, config)
+        for option_set, trends_df in zip(option_sets, trends):
+            results[option_set]["{}_trendlines".format(side)] = trends_df
+            results[option_set]["{}_pivots".format(side)] = set(pivots)
+    return results
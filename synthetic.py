@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+
+import structs
+
+INTERVAL_MINUTES = {"1m": 1, "3m": 3, "5m": 5, "10m": 10, "15m": 15, "30m": 30, "1h": 60, "1d": 390}
+
+SESSION_OPEN = pd.Timedelta(hours=9, minutes=30)
+SESSION_MINUTES = 390
+
+
+def _business_days(start, periods):
+    return np.busday_offset(np.datetime64(pd.Timestamp(start).date()), np.arange(periods), roll="forward")
+
+
+def _bar_dates(n, time_interval, start):
+    if time_interval == "1d":
+        return pd.DatetimeIndex(_business_days(start, n).astype("datetime64[ns]"), tz="UTC")
+
+    # Intraday bars cover the regular session of every business day, 9:30 to 16:00
+    offsets = pd.to_timedelta(np.arange(0, SESSION_MINUTES, INTERVAL_MINUTES[time_interval]), unit="m") + SESSION_OPEN
+    days_needed = -(-n // len(offsets))
+    days = _business_days(start, days_needed).astype("datetime64[ns]")
+    dates = (days[:, None] + offsets.values[None, :]).ravel()[:n]
+    return pd.DatetimeIndex(dates, tz="UTC")
+
+
+def generate_ohlcv(
+    n,
+    time_interval="1d",
+    seed=0,
+    start="1800-01-01",
+    start_price=100.0,
+    daily_volatility=0.02,
+    mean_swing_bars=12,
+    reversion_bars=1000,
+):
+    """
+    Seeded random-walk candles with trending swings, so the series has pivots the way real prices do.
+    Log returns follow a drift that changes sign at the end of every swing (swing lengths are geometric
+    with mean mean_swing_bars) plus gaussian noise scaled to the bar interval. The walk is measured against
+    its trailing reversion_bars mean so long series stay near start_price. Same arguments, same frame.
+    The default start leaves room for 100k daily bars inside the datetime64[ns] range.
+    """
+    if time_interval not in structs.VALID_TIME_INTERVALS:
+        raise Exception("time_interval must be one of :\n{}".format(structs.VALID_TIME_INTERVALS))
+    if n < 3:
+        raise Exception("n must be at least 3, received {}".format(n))
+
+    rng = np.random.default_rng(seed)
+    sigma = daily_volatility * np.sqrt(INTERVAL_MINUTES[time_interval] / SESSION_MINUTES)
+
+    # Drift per swing, alternating up and down with a random strength
+    swing_lengths = rng.geometric(1.0 / mean_swing_bars, size=n // mean_swing_bars * 2 + 2)
+    swing_lengths = swing_lengths[: np.searchsorted(np.cumsum(swing_lengths), n) + 1]
+    signs = np.where(np.arange(len(swing_lengths)) % 2 == 0, 1.0, -1.0) * rng.choice([-1.0, 1.0])
+    drift = np.repeat(signs * rng.uniform(0.2, 0.8, len(swing_lengths)) * sigma, swing_lengths)[:n]
+
+    walk = np.cumsum(drift + rng.normal(0.0, sigma, n))
+    walk_sums = np.concatenate(([0.0], np.cumsum(walk)))
+    window_starts = np.maximum(np.arange(1, n + 1) - reversion_bars, 0)
+    trailing_mean = (walk_sums[1:] - walk_sums[window_starts]) / (np.arange(1, n + 1) - window_starts)
+    log_close = np.log(start_price) + walk - trailing_mean
+    close = np.exp(log_close)
+    prev_close = np.concatenate(([start_price], close[:-1]))
+    open_ = prev_close * np.exp(rng.normal(0.0, sigma / 4, n))
+
+    body_high = np.maximum(open_, close)
+    body_low = np.minimum(open_, close)
+    high = body_high * np.exp(np.abs(rng.normal(0.0, sigma / 2, n)))
+    low = body_low * np.exp(-np.abs(rng.normal(0.0, sigma / 2, n)))
+    volume = np.round(rng.lognormal(13.0, 0.5, n) * np.sqrt(INTERVAL_MINUTES[time_interval] / SESSION_MINUTES))
+
+    return pd.DataFrame(
+        {
+            "Date": _bar_dates(n, time_interval, start),
+            "Open": open_,
+            "High": high,
+            "Low": low,
+            "Close": close,
+            "Volume": volume,
+        }
+    )
@@ -0,0 +1,33 @@
+from pandas.testing import assert_frame_equal
+
+import detect
+import structs
+import synthetic
+
+from benchmark import LIVE_FIXED_CONFIG
+
+SIDES = ("support_trendlines", "resistance_trendlines")
+
+# The pivot settings of the app and scanner
+PIVOT_OPTIONS = {"first_pt_must_be_pivot": True, "last_pt_must_be_pivot": True, "all_pts_must_be_pivots": True}
+
+
+def make_candles(n, time_interval="1d", seed=0):
+    df = synthetic.generate_ohlcv(n, time_interval, seed=seed)
+    return structs.CandlestickData(df=df, time_interval=time_interval, datetime_col="Date")
+
+
+def frozen_config(candles, keys=LIVE_FIXED_CONFIG):
+    # Config whose thresholds are the default ones evaluated on candles, the same whatever candles it is given
+    return {key: (lambda value: lambda _: value)(detect._config_value({}, key, candles)) for key in keys}
+
+
+def assert_results_equal(left, right, check_attrs=True):
+    assert left.keys() == right.keys()
+    for key in left:
+        if key.endswith("_trendlines"):
+            assert_frame_equal(left[key], right[key])
+            if check_attrs:
+                assert left[key].attrs == right[key].attrs
+        elif key.endswith("_pivots"):
+            assert left[key] == right[key]
@@ -0,0 +1,80 @@
+import threading
+import time
+
+from cache import ResultCache
+
+CALLERS = 8
+
+
+def _call_concurrently(fn):
+    # Runs fn in CALLERS threads released at the same moment, returns their results or errors
+    barrier = threading.Barrier(CALLERS)
+    outcomes = [None] * CALLERS
+
+    def call(index):
+        barrier.wait()
+        try:
+            outcomes[index] = fn()
+        except Exception as e:
+            outcomes[index] = e
+
+    threads = [threading.Thread(target=call, args=(index,)) for index in range(CALLERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return outcomes
+
+
+def test_get_or_compute_computes_once_for_concurrent_callers():
+    cache = ResultCache()
+    calls = []
+
+    def compute():
+        calls.append(threading.get_ident())
+        time.sleep(0.2)
+        return {"value": len(calls)}
+
+    outcomes = _call_concurrently(lambda: cache.get_or_compute("key", compute))
+    assert len(calls) == 1
+    assert all(outcome is outcomes[0] for outcome in outcomes)
+    assert cache.get_or_compute("key", compute) is outcomes[0]
+    assert len(calls) == 1
+    assert cache.stats()["coalesced"] + cache.stats()["misses"] == CALLERS
+
+
+def test_failed_compute_is_raised_to_every_caller_and_not_cached():
+    cache = ResultCache()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        raise ValueError("no bars")
+
+    outcomes = _call_concurrently(lambda: cache.get_or_compute("key", compute))
+    assert len(calls) == 1
+    assert all(isinstance(outcome, ValueError) for outcome in outcomes)
+    assert cache.get_or_compute("key", lambda: "fresh") == "fresh"
+
+
+def test_ttl_per_entry():
+    cache = ResultCache(ttl=3600)
+    cache.get_or_compute("partial", lambda: {"is_exhaustive": False}, ttl=lambda value: 0)
+    cache.put("short", 1, ttl=0.05)
+    cache.put("long", 2)
+    assert cache.get("partial") is None
+    assert cache.get("short") == 1
+    time.sleep(0.1)
+    assert cache.get("short") is None
+    assert cache.get("long") == 2
+
+
+def test_memory_budget_evicts_least_recently_used():
+    cache = ResultCache(max_bytes=100, sizeof=lambda value: 40)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
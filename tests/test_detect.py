@@ -0,0 +1,97 @@
+import itertools
+
+import numpy as np
+import pytest
+
+import detect
+import structs
+import synthetic
+
+from conftest import PIVOT_OPTIONS, SIDES, assert_results_equal, make_candles
+
+
+def _pytrendline_pair(n, seed, **options):
+    # detect and pytrendline results on the same bars. pytrendline appends rows with DataFrame.append, which
+    # fails on tz-aware dates, so both get tz-naive ones
+    pytrendline = pytest.importorskip("pytrendline")
+    df = synthetic.generate_ohlcv(n, "1d", seed=seed)
+    df["Date"] = df["Date"].dt.tz_localize(None)
+    options = dict(trendline_must_include_global_maxmin_pt=False, min_points_required=3, **options)
+    ours = detect.detect(
+        candlestick_data=structs.CandlestickData(df=df, time_interval="1d", datetime_col="Date"),
+        trend_type=structs.TrendlineTypes.BOTH,
+        **options,
+    )
+    theirs = pytrendline.detect(
+        candlestick_data=pytrendline.CandlestickData(df=df, time_interval="1d", datetime_col="Date"),
+        trend_type=structs.TrendlineTypes.BOTH,
+        scan_from_date=None,
+        config={},
+        **options,
+    )
+    return ours, theirs
+
+
+@pytest.mark.parametrize("seed", [0, 39])
+def test_default_flags_match_pytrendline_lines(seed):
+    # Same pivots and lines, but every candle is tested for breakouts where pytrendline only tested pivots
+    ours, theirs = _pytrendline_pair(120, seed, ignore_breakouts=False, **PIVOT_OPTIONS)
+    ours_ignoring, theirs_ignoring = _pytrendline_pair(120, seed, ignore_breakouts=True, **PIVOT_OPTIONS)
+    for side in ("support", "resistance"):
+        assert ours[side + "_pivots"] == set(theirs[side + "_pivots"])
+
+        lines = dict(zip(ours[side + "_trendlines"]["id"], ours[side + "_trendlines"]["is_breakout"]))
+        their_lines = dict(zip(theirs[side + "_trendlines"]["id"], theirs[side + "_trendlines"]["is_breakout"]))
+        assert lines.keys() == their_lines.keys()
+        assert all(lines[line_id] for line_id, is_breakout in their_lines.items() if is_breakout)
+
+        active = {line_id for line_id, is_breakout in lines.items() if not is_breakout}
+        assert set(ours_ignoring[side + "_trendlines"]["id"]) == active
+        assert active <= set(theirs_ignoring[side + "_trendlines"]["id"])
+
+
+@pytest.mark.parametrize("first_pt_must_be_pivot", [False, True])
+def test_no_pivot_member_flags_match_pytrendline_lines(first_pt_must_be_pivot):
+    ours, theirs = _pytrendline_pair(60, 0, first_pt_must_be_pivot=first_pt_must_be_pivot)
+    for key in SIDES:
+        assert set(ours[key]["id"]) == set(theirs[key]["id"])
+
+
+@pytest.mark.parametrize("options", [{}, PIVOT_OPTIONS, dict(ignore_breakouts=False, last_pt_must_be_pivot=True)])
+def test_budget_never_hit_gives_unbudgeted_result(options):
+    candles = make_candles(250, seed=2)
+    full = detect.detect(candlestick_data=candles, trend_type=structs.TrendlineTypes.BOTH, **options)
+    for budget in (dict(time_budget=600), dict(max_candidates=10**9)):
+        budgeted = detect.detect(candlestick_data=candles, trend_type=structs.TrendlineTypes.BOTH, **budget, **options)
+        assert budgeted["is_exhaustive"]
+        assert_results_equal(budgeted, full)
+
+
+def test_spent_budget_is_reported():
+    candles = make_candles(250, seed=2)
+    results = detect.detect(candlestick_data=candles, trend_type=structs.TrendlineTypes.BOTH, max_candidates=50)
+    assert not results["is_exhaustive"]
+    assert all(results[key].attrs["num_candidates"] <= 50 for key in SIDES)
+
+
+def test_duplicate_groups_match_pairwise_grouping():
+    # Components of the 'almost identical' relation, numbered by first row, checked against all pairs
+    rng = np.random.default_rng(5)
+    for _ in range(200):
+        n = int(rng.integers(1, 40))
+        last_prices = rng.integers(0, 8, n) * 0.25 + rng.normal(0, 0.05, n)
+        slopes = rng.integers(0, 8, n) * 0.25 + rng.normal(0, 0.05, n)
+        is_breakout = rng.random(n) < 0.3
+        near = (
+            (abs(last_prices[:, None] - last_prices[None, :]) < 0.5)
+            & (abs(slopes[:, None] - slopes[None, :]) < 0.5)
+            & (is_breakout[:, None] == is_breakout[None, :])
+        )
+        labels = list(range(n))
+        for i, j in itertools.product(range(n), repeat=2):
+            if near[i, j] and labels[i] != labels[j]:
+                old, new = max(labels[i], labels[j]), min(labels[i], labels[j])
+                labels = [new if label == old else label for label in labels]
+        numbering = {label: number for number, label in enumerate(dict.fromkeys(labels))}
+        expected = [numbering[label] for label in labels]
+        assert detect._duplicate_groups(last_prices, slopes, is_breakout, 0.5, 0.5).tolist() == expected
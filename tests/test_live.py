@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+import detect
+import structs
+import synthetic
+
+from conftest import PIVOT_OPTIONS, assert_results_equal, frozen_config
+from live import LiveDetector
+
+UPDATES = 25
+
+
+def _follow(df, time_interval, lookback, **options):
+    # Detects all but the last UPDATES bars, then follows those. Returns the detector and its config: the
+    # default thresholds frozen at their values on the initial candles, as the detector fixes them there
+    initial = structs.CandlestickData(df=df.iloc[:-UPDATES], time_interval=time_interval, datetime_col="Date")
+    config = frozen_config(initial)
+    detector = LiveDetector(initial, structs.TrendlineTypes.BOTH, lookback=lookback, config=config, **options)
+    for row in df.iloc[-UPDATES:].itertuples():
+        detector.update(row.Date, row.Open, row.High, row.Low, row.Close)
+    return detector, config
+
+
+@pytest.mark.parametrize(
+    "options",
+    [
+        PIVOT_OPTIONS,
+        dict(ignore_breakouts=False, **PIVOT_OPTIONS),
+        dict(last_pt_must_be_pivot=True),
+        dict(trendline_must_include_global_maxmin_pt=True, min_points_required=4),
+    ],
+)
+@pytest.mark.parametrize("n, time_interval, seed", [(150, "1d", 0), (200, "5m", 3)])
+def test_live_matches_detect(options, n, time_interval, seed):
+    df = synthetic.generate_ohlcv(n, time_interval, seed=seed)
+    detector, config = _follow(df, time_interval, None, **options)
+    expected = detect.detect(
+        candlestick_data=structs.CandlestickData(df=df, time_interval=time_interval, datetime_col="Date"),
+        trend_type=structs.TrendlineTypes.BOTH,
+        config=config,
+        **options,
+    )
+    results = detector.results()
+    for key in ("candlestick_data", "is_exhaustive"):
+        del results[key], expected[key]
+    # Live results do not count candidates
+    assert_results_equal(results, expected, check_attrs=False)
+
+
+def test_lookback_bounds_candidates():
+    df = synthetic.generate_ohlcv(400, "1d", seed=3)
+    detector, _ = _follow(df, "1d", 60, ignore_breakouts=False, **PIVOT_OPTIONS)
+    for side in detector.sides.values():
+        assert len(side.ii) > 0
+        assert np.all(side.ii >= len(df) - 60)
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import detect
+import serialize
+import structs
+import synthetic
+
+from conftest import PIVOT_OPTIONS, assert_results_equal, make_candles
+
+
+def _round_trip(results):
+    encoded = serialize.encode(results)
+    loaded = serialize.loads(serialize.dumps(encoded))
+    assert loaded.keys() == encoded.keys()
+    for key, value in encoded.items():
+        np.testing.assert_array_equal(loaded[key], value)
+    return serialize.decode(loaded, results["candlestick_data"])
+
+
+@pytest.mark.parametrize(
+    "trend_type, options",
+    [
+        (structs.TrendlineTypes.BOTH, {}),
+        (structs.TrendlineTypes.BOTH, dict(ignore_breakouts=False)),
+        (structs.TrendlineTypes.SUPPORT, PIVOT_OPTIONS),
+        (structs.TrendlineTypes.BOTH, dict(trendline_must_include_global_maxmin_pt=True, max_candidates=200)),
+    ],
+)
+def test_round_trip_gives_back_the_results(trend_type, options):
+    candles = make_candles(200, seed=3)
+    results = detect.detect(candlestick_data=candles, trend_type=trend_type, **options)
+    decoded = _round_trip(results)
+    assert_results_equal(decoded, results)
+    # None and NaN cells come back as they were, not just as equal values
+    for key in decoded:
+        if key.endswith("_trendlines"):
+            for col in ("breakout_index", "breakout_date", "overall_rank"):
+                assert [type(value) for value in decoded[key][col]] == [type(value) for value in results[key][col]]
+
+
+def test_round_trip_keeps_timezones():
+    df = synthetic.generate_ohlcv(150, "1h", seed=2)
+    df["Date"] = pd.DatetimeIndex(df["Date"]).tz_convert("America/New_York")
+    candles = structs.CandlestickData(df=df, time_interval="1h", datetime_col="Date")
+    results = detect.detect(candlestick_data=candles, trend_type=structs.TrendlineTypes.BOTH, ignore_breakouts=False)
+    assert_results_equal(_round_trip(results), results)
+
+
+def test_decode_rejects_other_candles():
+    candles = make_candles(100, seed=3)
+    encoded = serialize.encode(detect.detect(candlestick_data=candles, trend_type=structs.TrendlineTypes.BOTH))
+    with pytest.raises(Exception, match="does not match"):
+        serialize.decode(encoded, make_candles(100, seed=4))
@@ -0,0 +1,30 @@
+import pytest
+
+import detect
+import structs
+import sweep
+
+from conftest import assert_results_equal, make_candles
+
+
+@pytest.mark.parametrize("trend_type", [structs.TrendlineTypes.BOTH, structs.TrendlineTypes.RESISTANCE])
+def test_sweep_matches_detect_for_every_option_set(trend_type):
+    candles = make_candles(120, seed=7)
+    option_sets = sweep.option_grid(min_points_required=(3, 4))
+    results = sweep.sweep(candles, trend_type, option_sets)
+    assert list(results) == option_sets
+    for option_set, swept in results.items():
+        expected = detect.detect(
+            candlestick_data=candles, trend_type=trend_type, parallel=False, **option_set._asdict()
+        )
+        assert_results_equal(swept, expected)
+
+
+def test_sweep_keeps_breakouts_like_detect():
+    candles = make_candles(80, "5m", seed=1)
+    option_set = sweep.OptionSet(True, True, False, False, 3)
+    swept = sweep.sweep(candles, structs.TrendlineTypes.BOTH, [option_set], ignore_breakouts=False)[option_set]
+    expected = detect.detect(
+        candlestick_data=candles, trend_type=structs.TrendlineTypes.BOTH, ignore_breakouts=False, **option_set._asdict()
+    )
+    assert_results_equal(swept, expected)
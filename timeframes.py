@@ -0,0 +1,152 @@
+import numpy as np
+import pandas as pd
+
+import detect
+import structs
+
+MINUTE_NS = 60 * 10**9
+DAY_NS = 24 * 60 * MINUTE_NS
+
+# Active lines of different timeframes are confluent when their prices at the last candle are this close,
+# as a fraction of the last close
+DEFAULT_CONFLUENCE_TOLERANCE = 0.005
+
+CONFLUENCE_COLUMNS = [
+    "confluence_id",
+    "trendtype",
+    "num_timeframes",
+    "timeframes",
+    "price_at_last_date",
+    "time_interval",
+    "id",
+    "score",
+    "slope",
+]
+
+
+def interval_minutes(time_interval):
+    if time_interval not in structs.VALID_TIME_INTERVALS:
+        raise Exception("time_interval must be one of :\n{}".format(structs.VALID_TIME_INTERVALS))
+    value = int(time_interval[:-1])
+    return value * {"m": 1, "h": 60, "d": 60 * 24}[time_interval[-1]]
+
+
+def coarser_intervals(time_interval):
+    # Intervals that are whole multiples of time_interval, itself included, finest first
+    base = interval_minutes(time_interval)
+    return [
+        interval
+        for interval in structs.VALID_TIME_INTERVALS
+        if interval_minutes(interval) >= base and interval_minutes(interval) % base == 0
+    ]
+
+
+def resample(candlestick_data, time_interval):
+    """
+    Aggregates candles into coarser ones in one vectorized pass. Intraday buckets are aligned to each day's
+    first bar in the data's own timezone (so 1h bars of a 9:30 session run 9:30-10:30) and daily buckets to
+    midnight. Buckets are labelled with their start time, as pandas' resample does.
+    """
+    source_minutes = candlestick_data.time_interval_min()
+    minutes = interval_minutes(time_interval)
+    if minutes < source_minutes or minutes % source_minutes:
+        raise Exception(
+            "Cannot resample {} candles to {}, the target must be a multiple of the source interval".format(
+                candlestick_data.time_interval, time_interval
+            )
+        )
+    if minutes == source_minutes:
+        return candlestick_data
+
+    # Wall clock time in the data's timezone, so days start at local midnight
+    dates = candlestick_data.dates
+    wall = (dates.tz_localize(None) if dates.tz is not None else dates).asi8
+    day = wall // DAY_NS
+    if time_interval.endswith("d"):
+        keys = day
+        labels = day * DAY_NS
+    else:
+        day_starts = np.flatnonzero(np.diff(day, prepend=day[0] - 1))
+        day_open = np.repeat(wall[day_starts], np.diff(np.append(day_starts, len(wall))))
+        offset = (wall - day_open) // (minutes * MINUTE_NS)
+        keys = day * DAY_NS + offset
+        labels = day_open + offset * minutes * MINUTE_NS
+
+    starts = np.flatnonzero(np.diff(keys, prepend=keys[0] - 1))
+    ends = np.append(starts[1:], len(keys))
+
+    label_dates = pd.DatetimeIndex(labels[starts].view("datetime64[ns]"))
+    if dates.tz is not None:
+        label_dates = label_dates.tz_localize(dates.tz, ambiguous="NaT", nonexistent="shift_forward")
+
+    df = pd.DataFrame(
+        {
+            "Date": label_dates,
+            "Open": candlestick_data.open[starts],
+            "High": np.maximum.reduceat(candlestick_data.high, starts),
+            "Low": np.minimum.reduceat(candlestick_data.low, starts),
+            "Close": candlestick_data.close[ends - 1],
+        }
+    )
+    return structs.CandlestickData(df=df, time_interval=time_interval, datetime_col="Date")
+
+
+def detect_timeframes(candlestick_data, intervals=None, trend_type=structs.TrendlineTypes.BOTH, **detect_options):
+    """
+    Resamples candlestick_data (the finest interval, fetched once) to every interval in intervals (default: all
+    coarser intervals) and runs detect on each. Returns {interval: results}; intervals with fewer than three
+    candles are left out.
+    """
+    if intervals is None:
+        intervals = coarser_intervals(candlestick_data.time_interval)
+
+    results = {}
+    for time_interval in intervals:
+        candles = resample(candlestick_data, time_interval)
+        if len(candles) < 3:
+            continue
+        results[time_interval] = detect.detect(candlestick_data=candles, trend_type=trend_type, **detect_options)
+    return results
+
+
+def confluence(results_by_interval, tolerance=DEFAULT_CONFLUENCE_TOLERANCE):
+    """
+    Lines up the active trendlines of every timeframe by their price at the last candle, which all timeframes
+    share. Lines of one trend type whose prices chain within tolerance * last close of each other form a
+    confluence group; groups spanning at least two timeframes are returned, strongest agreement first.
+    """
+    frames = []
+    last_price = None
+    for time_interval, results in results_by_interval.items():
+        last_price = detect.last_close(results["candlestick_data"])
+        for key in ("support_trendlines", "resistance_trendlines"):
+            trends = results.get(key)
+            if trends is None or len(trends) == 0:
+                continue
+            active = trends[~trends["is_breakout"].astype(bool)]
+            frames.append(
+                active[["trendtype", "id", "score", "slope", "price_at_last_date"]].assign(time_interval=time_interval)
+            )
+
+    if not frames:
+        return pd.DataFrame(columns=CONFLUENCE_COLUMNS)
+
+    lines = pd.concat(frames, ignore_index=True).sort_values(["trendtype", "price_at_last_date"], ignore_index=True)
+    prices = lines["price_at_last_date"].to_numpy(dtype=np.float64)
+    types = lines["trendtype"].to_numpy()
+    new_group = np.ones(len(lines), dtype=bool)
+    new_group[1:] = (types[1:] != types[:-1]) | (np.diff(prices) > tolerance * abs(last_price))
+    lines["confluence_id"] = np.cumsum(new_group) - 1
+
+    by_group = lines.groupby("confluence_id")["time_interval"]
+    lines["num_timeframes"] = by_group.transform("nunique")
+    lines = lines[lines["num_timeframes"] >= 2]
+    if len(lines) == 0:
+        return pd.DataFrame(columns=CONFLUENCE_COLUMNS)
+
+    order = {interval: i for i, interval in enumerate(structs.VALID_TIME_INTERVALS)}
+    timeframes = lines.groupby("confluence_id")["time_interval"].agg(lambda values: sorted(set(values), key=order.get))
+    lines = lines.assign(timeframes=lines["confluence_id"].map(timeframes)).sort_values(
+        ["num_timeframes", "confluence_id", "score"], ascending=[False, True, False]
+    )
+    return lines[CONFLUENCE_COLUMNS].reset_index(drop=True)
@@ -0,0 +1,137 @@
+import cProfile
+import contextvars
+import io
+import json
+import logging
+import pstats
+import sys
+import time
+import tracemalloc
+
+from contextlib import contextmanager, nullcontext
+
+logger = logging.getLogger("pivot_peak.timing")
+
+_current = contextvars.ContextVar("pivot_peak_trace", default=None)
+
+
+class Trace:
+    # Wall time of the stages of one request plus counters (bars, pivots, ...). Stages may repeat, their times add up
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.counters = {}
+        self.total = None
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def count(self, **counters):
+        self.counters.update(counters)
+
+    def finish(self):
+        self.total = time.perf_counter() - self.started
+        return self
+
+    def as_dict(self):
+        return {
+            "trace": self.name,
+            "total_s": round(self.total if self.total is not None else time.perf_counter() - self.started, 6),
+            "stages": {name: round(seconds, 6) for name, seconds in self.stages.items()},
+            "counters": self.counters,
+        }
+
+
+def configure_logging(level=logging.INFO, stream=None):
+    # One JSON object per line on stderr, unless the host application configured the logger already
+    if not logger.handlers:
+        handler = logging.StreamHandler(stream or sys.stderr)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(level)
+        logger.propagate = False
+
+
+def start_trace(name="request"):
+    trace = Trace(name)
+    _current.set(trace)
+    return trace
+
+
+def current_trace():
+    return _current.get()
+
+
+def stage(name):
+    # Times a block against the current trace; without one this is a shared no-op context
+    trace = _current.get()
+    if trace is None:
+        return nullcontext()
+    return trace.stage(name)
+
+
+def count(**counters):
+    trace = _current.get()
+    if trace is not None:
+        trace.count(**counters)
+
+
+def finish_trace():
+    trace = _current.get()
+    if trace is None:
+        return None
+    _current.set(None)
+    trace.finish()
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps(dict(event="timing", **trace.as_dict()), default=str))
+    return trace
+
+
+class Profile:
+    # cProfile plus tracemalloc over one block. top_functions and top_allocations hold the text reports afterwards
+
+    def __init__(self, limit=25):
+        self.limit = limit
+        self.top_functions = ""
+        self.top_allocations = ""
+
+    def __enter__(self):
+        self._was_tracing = tracemalloc.is_tracing()
+        if not self._was_tracing:
+            tracemalloc.start()
+        self._profiler = cProfile.Profile()
+        self._profiler.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+        if not self._was_tracing:
+            tracemalloc.stop()
+
+        out = io.StringIO()
+        pstats.Stats(self._profiler, stream=out).sort_stats("cumulative").print_stats(self.limit)
+        self.top_functions = out.getvalue()
+
+        lines = ["Peak traced memory: {:.1f} MiB".format(peak / 2**20)]
+        for stat in snapshot.statistics("lineno")[: self.limit]:
+            frame = stat.traceback[0]
+            lines.append(
+                "{:>10.1f} KiB {:>8} blocks  {}:{}".format(stat.size / 1024, stat.count, frame.filename, frame.lineno)
+            )
+        self.top_allocations = "\n".join(lines)
+
+        logger.info(json.dumps({"event": "profile", "functions": self.top_functions, "allocations": lines}))
+        return False
+
+
+def profile(enabled):
+    return Profile() if enabled else nullcontext()